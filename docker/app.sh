@@ -4,4 +4,8 @@ cd ./src
 
 alembic upgrade head
 
+# каталог для метрик воркеров gunicorn, /metrics суммирует их; файлы прошлого запуска удаляются
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 gunicorn main:app --workers 4 --worker-class uvicorn.workers.UvicornWorker --bind=0.0.0.0:8000
\ No newline at end of file
@@ -2,8 +2,12 @@
 
 cd ./src
 
+# CELERY_POOL=prefork: процессы, в каждом свой event loop для async-задач;
+# CELERY_POOL=threads: потоки одного процесса, задачи выполняются в общем event loop одновременно
 if [[ "${1}" == "celery" ]]; then
-  celery --app=tasks.tasks:celery worker -l INFO
+  celery --app=tasks.tasks:celery worker -E -l INFO --pool="${CELERY_POOL:-prefork}" --concurrency="${CELERY_CONCURRENCY:-2}"
+elif [[ "${1}" == "beat" ]]; then
+  celery --app=tasks.tasks:celery beat -l INFO --schedule=/tmp/celerybeat-schedule
 elif [[ "${1}" == "flower" ]]; then
   celery --app=tasks.tasks:celery flower
- fi
\ No newline at end of file
+ fi
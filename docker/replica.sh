@@ -0,0 +1,13 @@
+#!/bin/bash
+# реплика для чтения: при первом запуске копирует primary через pg_basebackup
+# и дальше получает WAL потоковой репликацией (-R создает standby.signal)
+
+if [ ! -s "$PGDATA/PG_VERSION" ]; then
+    until pg_basebackup -h db -p 1221 -U admin -D "$PGDATA" -R -X stream; do
+        echo "waiting for primary"
+        sleep 2
+    done
+    chmod 700 "$PGDATA"
+fi
+
+exec postgres -p 1222
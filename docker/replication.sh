@@ -0,0 +1,4 @@
+#!/bin/bash
+# разрешает подключения для потоковой репликации к primary (выполняется при инициализации базы)
+
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -0,0 +1,110 @@
+"""Выгрузка и загрузка таблицы links через COPY в обход API
+
+    export -- вся таблица в CSV (с заголовком) или NDJSON, потоком из COPY ... TO STDOUT;
+    import -- CSV или NDJSON через COPY ... FROM STDIN во временную таблицу и перенос в links пачками
+              по --batch-size: ссылки получают новые id, занятые короткие ссылки и истекшие ссылки пропускаются.
+Память не зависит от размера таблицы. Прогресс (строки вместе с заголовком CSV, МБ, строк в секунду)
+выводится в stderr раз в --progress-interval секунд. Вместо файла можно указать "-" -- stdout или stdin.
+Запуск из папки src (нужны база данных и Redis из .env):
+    python -m admin.cli export --format csv --output links.csv
+    python -m admin.cli import --format csv links.csv
+    python -m admin.cli export --format ndjson | gzip > links.ndjson.gz
+    gunzip -c links.ndjson.gz | python -m admin.cli import --format ndjson -
+"""
+import argparse
+import asyncio
+import contextlib
+import sys
+import time
+
+from config import COPY_MERGE_BATCH_SIZE
+from database import engine
+from .transfer import FORMATS, export_links, import_links
+
+READ_SIZE = 1 << 20
+
+
+class Progress:
+    """Вывод прогресса в stderr не чаще раза в interval секунд"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.started = self.printed = time.monotonic()
+        self.bytes = 0
+
+    def __call__(self, stage, rows, force=False):
+        now = time.monotonic()
+        if not force and now - self.printed < self.interval:
+            return
+        self.printed = now
+        elapsed = max(now - self.started, 1e-9)
+        print(
+            f"{stage}: {rows} rows, {self.bytes / 2 ** 20:.1f} MB, {rows / elapsed:.0f} rows/s, {elapsed:.0f} s",
+            file=sys.stderr,
+        )
+
+
+@contextlib.contextmanager
+def open_file(path, mode):
+    if path == "-":
+        yield sys.stdout.buffer if "w" in mode else sys.stdin.buffer
+        return
+    with open(path, mode) as file:
+        yield file
+
+
+async def run_export(args):
+    progress = Progress(args.progress_interval)
+    rows = 0
+    with open_file(args.output, "wb") as file:
+        async for chunk in export_links(args.format):
+            file.write(chunk)
+            rows += chunk.count(b"\n")
+            progress.bytes += len(chunk)
+            progress("export", rows)
+    progress("export", rows, force=True)
+
+
+async def run_import(args):
+    progress = Progress(args.progress_interval)
+
+    async def chunks(file):
+        while True:
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                return
+            progress.bytes += len(chunk)
+            yield chunk
+
+    with open_file(args.input, "rb") as file:
+        result = await import_links(chunks(file), args.format, args.batch_size, on_progress=progress)
+    print(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--progress-interval", type=float, default=5)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export")
+    export.add_argument("--format", choices=FORMATS, default="csv")
+    export.add_argument("--output", default="-")
+    load = commands.add_parser("import")
+    load.add_argument("input", help='файл CSV или NDJSON, "-" -- stdin')
+    load.add_argument("--format", choices=FORMATS, default="csv")
+    load.add_argument("--batch-size", type=int, default=COPY_MERGE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    async def run():
+        try:
+            await (run_export(args) if args.command == "export" else run_import(args))
+        finally:
+            await engine.dispose()
+
+    try:
+        asyncio.run(run())
+    except ValueError as e:
+        parser.exit(1, f"error: {e}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+
+from auth.db import User
+from auth.users import current_superuser
+from .transfer import MEDIA_TYPES, export_links, import_links, copy_progress
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+@router.get("/links/export")
+async def export_links_copy(
+    format: Literal["csv", "ndjson"] = "csv",
+    user: User = Depends(current_superuser),
+):
+    """Функция выгрузки всей таблицы links (только для superuser)
+    Ответ отдается потоком прямо из COPY ... TO STDOUT, память не зависит от размера таблицы
+
+    params:
+        format: str (csv -- с заголовком из столбцов links, или ndjson)
+
+    returns: CSV или NDJSON
+        по строке на ссылку со всеми столбцами links
+    """
+    return StreamingResponse(
+        export_links(format), media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="links.{format}"'},
+    )
+
+
+@router.post("/links/import")
+async def import_links_copy(
+    request: Request,
+    format: Literal["csv", "ndjson"] = "csv",
+    user: User = Depends(current_superuser),
+):
+    """Функция загрузки ссылок через COPY ... FROM STDIN (только для superuser)
+    Тело читается потоком во временную таблицу и переносится в links пачками по COPY_MERGE_BATCH_SIZE.
+    Ссылки получают новые id; занятые короткие ссылки и истекшие ссылки пропускаются
+
+    params:
+        format: str (csv -- первая строка заголовок из столбцов links, long_link и custom_alias обязательны;
+            или ndjson -- объекты с теми же ключами)
+
+    returns: dict
+        status: str
+        received: int
+        imported: int
+        skipped: int
+        seconds: float
+    """
+    try:
+        return await import_links(request.stream(), format)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get("/links/copy_progress")
+async def links_copy_progress(user: User = Depends(current_superuser)):
+    """Функция получения прогресса выполняющихся выгрузок и загрузок (pg_stat_progress_copy)
+
+    returns: list of dict
+        pid: int
+        relation: str (таблица загрузки, у выгрузки -- None)
+        command: str (COPY FROM или COPY TO)
+        bytes_processed: int
+        tuples_processed: int
+        running: float (сек)
+    """
+    return await copy_progress()
@@ -0,0 +1,271 @@
+import asyncio
+import csv
+import logging
+import time
+import uuid
+
+from asyncpg.exceptions import DataError
+
+from config import COPY_MERGE_BATCH_SIZE, COPY_QUEUE_SIZE, BULK_MAX_ITEM_BYTES
+from database import engine
+from links.bloom import alias_filter
+from links.cache import invalidate_links
+from links.models import linking
+from links.urls import url_fingerprint
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson")
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+COLUMNS = [column.name for column in linking.columns]
+REQUIRED_COLUMNS = {"long_link", "custom_alias"}
+EXPORT_QUERY = f"SELECT {', '.join(COLUMNS)} FROM links"
+EXPORT_QUERIES = {
+    "csv": EXPORT_QUERY,
+    "ndjson": f"SELECT row_to_json(l) FROM ({EXPORT_QUERY}) AS l",
+}
+# NDJSON передается через COPY в формате CSV с управляющими символами вместо кавычки и разделителя:
+# row_to_json экранирует их (\u0001), поэтому строка JSON проходит без экранирования COPY, как есть
+NDJSON_OPTIONS = {"format": "csv", "quote": "\x01", "delimiter": "\x02"}
+COPY_OPTIONS = {
+    "csv": {"format": "csv", "header": True},
+    "ndjson": NDJSON_OPTIONS,
+}
+STAGING_PREFIX = "links_import_"
+# id не переносится: ссылки получают новые id из последовательности links, занятые короткие ссылки
+# и истекшие ссылки пропускаются (занятость проверяет триггер links_claim_alias)
+MERGE_QUERY = """
+    INSERT INTO links (
+        user_id, long_link, long_link_hash, custom_alias, expires_at, last_usage, creation_date,
+        number_of_usages, is_authorized, redirect_status
+    )
+    SELECT
+        user_id, long_link, long_link_hash, custom_alias, COALESCE(expires_at, 'infinity'), COALESCE(last_usage, now()), COALESCE(creation_date, now()),
+        COALESCE(number_of_usages, 0), COALESCE(is_authorized, false), COALESCE(redirect_status, 301)
+    FROM {staging}
+    WHERE import_row > $1 AND import_row <= $2
+        AND long_link IS NOT NULL AND custom_alias IS NOT NULL AND COALESCE(expires_at, 'infinity') > now()
+    ORDER BY import_row
+    RETURNING custom_alias, long_link
+"""
+# отпечаток считается в приложении (links.urls.url_fingerprint), как при создании ссылки: long_link_hash
+# из файла не используется, иначе поиск и дедупликация не нашли бы ссылку с другим отпечатком
+FINGERPRINT_QUERY = """
+    SELECT import_row, long_link FROM {staging}
+    WHERE import_row > $1 AND import_row <= $2 AND long_link IS NOT NULL
+"""
+SET_FINGERPRINTS_QUERY = """
+    UPDATE {staging} AS s SET long_link_hash = f.long_link_hash
+    FROM unnest($1::bigint[], $2::varchar[]) AS f(import_row, long_link_hash)
+    WHERE s.import_row = f.import_row
+"""
+# у выгрузки (COPY из запроса) relid = 0, у загрузки -- временная таблица links_import_<id>
+PROGRESS_QUERY = """
+    SELECT p.pid, CASE WHEN p.relid = 0 THEN NULL ELSE p.relid::regclass::text END AS relation, p.command, p.type,
+        p.bytes_processed, p.bytes_total, p.tuples_processed, p.tuples_excluded,
+        extract(epoch FROM now() - a.query_start)::float8 AS running
+    FROM pg_stat_progress_copy AS p JOIN pg_stat_activity AS a USING (pid)
+    WHERE p.datname = current_database()
+"""
+
+
+async def driver_connection(connection):
+    """Функция получения соединения asyncpg из соединения SQLAlchemy: COPY есть только у драйвера"""
+    return (await connection.get_raw_connection()).driver_connection
+
+
+async def export_links(format="csv", queue_size=COPY_QUEUE_SIZE):
+    """Функция выгрузки всей таблицы links через COPY ... TO STDOUT
+
+    Postgres отдает данные потоком, куски складываются в очередь на queue_size кусков: если получатель
+    читает медленнее, COPY ждет, поэтому в памяти не больше queue_size кусков при любом размере таблицы.
+    Выгрузка -- один запрос, то есть согласованный снимок таблицы, он занимает соединение primary
+    на все время выгрузки.
+
+    params:
+        format: str (csv -- с заголовком, или ndjson)
+        queue_size: int
+
+    returns:
+        асинхронный итератор bytes
+    """
+    queue = asyncio.Queue(maxsize=queue_size)
+
+    async def copy():
+        try:
+            async with engine.connect() as connection:
+                driver = await driver_connection(connection)
+                await driver.copy_from_query(EXPORT_QUERIES[format], output=queue.put, **COPY_OPTIONS[format])
+        except Exception as error:
+            await queue.put(error)
+        else:
+            await queue.put(None)
+
+    task = asyncio.create_task(copy())
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        # получатель отключился или выгрузка закончилась: COPY не должен остаться висеть на соединении
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def read_csv_header(chunks, max_bytes=BULK_MAX_ITEM_BYTES):
+    """Функция чтения заголовка CSV
+
+    params:
+        chunks: асинхронный итератор bytes
+        max_bytes: int
+
+    returns:
+        columns: list of str
+        chunks: асинхронный итератор bytes (все тело, вместе с заголовком)
+
+    raises:
+        ValueError
+    """
+    chunks = chunks.__aiter__()
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        if b"\n" in buffer or len(buffer) > max_bytes:
+            break
+    header = buffer.split(b"\n", 1)[0]
+    if len(header) > max_bytes:
+        raise ValueError("csv header is too long")
+    columns = next(csv.reader([header.decode("UTF-8").strip()]), [])
+    unknown = [column for column in columns if column not in COLUMNS]
+    if unknown:
+        raise ValueError(f"unknown columns {unknown}, expected some of {COLUMNS}")
+    if not REQUIRED_COLUMNS <= set(columns):
+        raise ValueError(f"columns {sorted(REQUIRED_COLUMNS)} are required")
+
+    async def body():
+        yield buffer
+        async for chunk in chunks:
+            yield chunk
+
+    return columns, body()
+
+
+async def counted(chunks, on_progress):
+    rows = 0
+    async for chunk in chunks:
+        rows += chunk.count(b"\n")
+        if on_progress is not None:
+            on_progress("copy", rows)
+        yield chunk
+
+
+async def import_links(chunks, format="csv", batch_size=COPY_MERGE_BATCH_SIZE, on_progress=None):
+    """Функция загрузки ссылок через COPY ... FROM STDIN во временную таблицу и слияния с links
+
+    Данные потоком копируются в нежурналируемую таблицу links_import_<id> без ограничений,
+    затем переносятся в links пачками по batch_size строк, каждая пачка -- в своей транзакции
+    вместе с отпечатками long_link, посчитанными url_fingerprint:
+    блокировки короткие, а после каждой пачки новые короткие ссылки добавляются в фильтр Блума
+    и сбрасываются закэшированные ответы. Таблица обычная, а не TEMP: при PgBouncer
+    (transaction pooling) транзакции одного соединения приложения попадают на разные соединения Postgres.
+    Память не зависит от объема загрузки: в ней одна пачка возвращенных коротких ссылок.
+
+    params:
+        chunks: асинхронный итератор bytes (CSV с заголовком из столбцов links или NDJSON)
+        format: str (csv или ndjson)
+        batch_size: int
+        on_progress: функция (stage, rows) или None; stage -- copy (прочитано строк) или merge (перенесено)
+
+    returns: dict
+        status: str
+        received: int (строк во временной таблице)
+        imported: int
+        skipped: int (занятые короткие ссылки, истекшие ссылки, строки без long_link или custom_alias)
+        seconds: float
+
+    raises:
+        ValueError (неизвестные столбцы, данные не разбираются)
+    """
+    started = time.monotonic()
+    staging = STAGING_PREFIX + uuid.uuid4().hex[:12]
+    if format == "csv":
+        columns, chunks = await read_csv_header(chunks)
+    async with engine.connect() as connection:
+        driver = await driver_connection(connection)
+        await driver.execute(f"CREATE UNLOGGED TABLE {staging} AS SELECT * FROM links WITH NO DATA")
+        try:
+            await driver.execute(f"ALTER TABLE {staging} ADD COLUMN import_row bigint GENERATED ALWAYS AS IDENTITY")
+            try:
+                if format == "csv":
+                    await driver.copy_to_table(
+                        staging, source=counted(chunks, on_progress), columns=columns, **COPY_OPTIONS["csv"]
+                    )
+                else:
+                    await driver.execute(f"CREATE UNLOGGED TABLE {staging}_raw (line json)")
+                    try:
+                        await driver.copy_to_table(
+                            f"{staging}_raw", source=counted(chunks, on_progress), columns=["line"], **NDJSON_OPTIONS
+                        )
+                        # отсутствующие в объекте ключи становятся NULL, лишние -- отбрасываются;
+                        # столбцы перечисляются по именам: физический порядок в links не совпадает с моделью
+                        record_columns = ", ".join(f"r.{column}" for column in COLUMNS)
+                        await driver.execute(
+                            f"INSERT INTO {staging} ({', '.join(COLUMNS)}) "
+                            f"SELECT {record_columns} FROM {staging}_raw, json_populate_record(NULL::links, line) AS r "
+                            f"WHERE line IS NOT NULL"
+                        )
+                    finally:
+                        await driver.execute(f"DROP TABLE IF EXISTS {staging}_raw")
+            except DataError as e:
+                raise ValueError(str(e))
+            # ключ строится после COPY, одним проходом: пачки слияния читают диапазоны import_row по нему,
+            # а не просматривают всю временную таблицу каждый раз
+            await driver.execute(f"ALTER TABLE {staging} ADD PRIMARY KEY (import_row)")
+            await driver.execute(f"ANALYZE {staging}")
+            received = await driver.fetchval(f"SELECT coalesce(max(import_row), 0) FROM {staging}")
+
+            imported = 0
+            merge = MERGE_QUERY.format(staging=staging)
+            fingerprints = FINGERPRINT_QUERY.format(staging=staging)
+            set_fingerprints = SET_FINGERPRINTS_QUERY.format(staging=staging)
+            for low in range(0, received, batch_size):
+                async with driver.transaction():
+                    links = await driver.fetch(fingerprints, low, low + batch_size)
+                    await driver.execute(
+                        set_fingerprints,
+                        [link["import_row"] for link in links], [url_fingerprint(link["long_link"]) for link in links],
+                    )
+                    rows = await driver.fetch(merge, low, low + batch_size)
+                imported += len(rows)
+                aliases = [row["custom_alias"] for row in rows]
+                await alias_filter.add(*aliases)
+                await invalidate_links(long_links=[row["long_link"] for row in rows], created=aliases)
+                if on_progress is not None:
+                    on_progress("merge", min(low + batch_size, received))
+                logger.info("links import %s: %s of %s rows merged", staging, min(low + batch_size, received), received)
+        finally:
+            await driver.execute(f"DROP TABLE IF EXISTS {staging}")
+    return {
+        "status": "success",
+        "received": received,
+        "imported": imported,
+        "skipped": received - imported,
+        "seconds": round(time.monotonic() - started, 2),
+    }
+
+
+async def copy_progress():
+    """Функция получения прогресса выполняющихся выгрузок и загрузок links (pg_stat_progress_copy)
+
+    returns:
+        list of dict (pid, relation, command, type, bytes_processed, bytes_total,
+                      tuples_processed, tuples_excluded, running)
+    """
+    async with engine.connect() as connection:
+        driver = await driver_connection(connection)
+        rows = await driver.fetch(PROGRESS_QUERY)
+    return [dict(row) for row in rows]
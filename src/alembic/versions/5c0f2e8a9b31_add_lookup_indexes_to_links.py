@@ -0,0 +1,32 @@
+"""Add lookup indexes to links
+
+Revision ID: 5c0f2e8a9b31
+Revises: 1a96b8b9bd83
+Create Date: 2026-10-18 10:12:04.118237
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c0f2e8a9b31'
+down_revision: Union[str, None] = '1a96b8b9bd83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # индексы строятся CONCURRENTLY, чтобы не блокировать запись в большую таблицу
+    with op.get_context().autocommit_block():
+        op.create_index('ix_links_custom_alias', 'links', ['custom_alias'], unique=True, postgresql_concurrently=True)
+        # hash-индекс: long_link может быть длиннее предела строки btree, а ищем только по равенству
+        op.create_index('ix_links_long_link', 'links', ['long_link'], postgresql_using='hash', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_links_long_link', table_name='links', postgresql_concurrently=True)
+        op.drop_index('ix_links_custom_alias', table_name='links', postgresql_concurrently=True)
@@ -0,0 +1,28 @@
+"""Add expires_at index to links
+
+Revision ID: 8d41b7c2e6f0
+Revises: 5c0f2e8a9b31
+Create Date: 2026-10-18 12:40:51.903412
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d41b7c2e6f0'
+down_revision: Union[str, None] = '5c0f2e8a9b31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_links_expires_at', 'links', ['expires_at'], postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_links_expires_at', table_name='links', postgresql_concurrently=True)
@@ -0,0 +1,190 @@
+"""Partition links by expires_at
+
+Revision ID: a7d3e5b90c12
+Revises: f2c8d6a1b934
+Create Date: 2026-10-18 21:14:52.730615
+
+"""
+import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d3e5b90c12'
+down_revision: Union[str, None] = 'f2c8d6a1b934'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = (
+    "id, user_id, long_link, long_link_hash, custom_alias, expires_at, "
+    "last_usage, creation_date, number_of_usages, is_authorized"
+)
+# ссылки без срока жизни живут в DEFAULT бессрочно
+SOURCE_COLUMNS = (
+    "id, user_id, long_link, long_link_hash, custom_alias, COALESCE(expires_at, 'infinity'), "
+    "last_usage, creation_date, number_of_usages, is_authorized"
+)
+# разбиение зафиксировано в ревизии и не зависит от настроек и кода приложения: недельные секции
+# с понедельника на 8 недель вперед, дальше секции создает обслуживание links/partitions.py
+PARTITION_STEP = datetime.timedelta(weeks=1)
+PARTITION_PREMAKE = 8
+DEFAULT_PARTITION = "links_default"
+EXPIRED_PARTITION = "links_expired"
+OLD_INDEXES = (
+    'ix_links_id', 'ix_links_custom_alias', 'ix_links_long_link_hash_id', 'ix_links_expires_at',
+    'ix_links_user_id_id', 'ix_links_user_id_usages_id',
+)
+
+# link_aliases -- таблица маршрутизации: уникальность короткой ссылки и секция, в которой она лежит.
+# Ее ведут триггеры links, поэтому любой INSERT/UPDATE/DELETE по links (из приложения, бенчмарков,
+# psql) оставляет ее согласованной. DROP секции триггеры не вызывает -- перед ним очистка
+# освобождает короткие ссылки секции сама (links/partitions.py).
+TRIGGER_FUNCTIONS = (
+    # занятая короткая ссылка: строка не вставляется (RETURN NULL), как при ON CONFLICT DO NOTHING;
+    # своя запись (та же link_id) -- строка переносится из DEFAULT в новую секцию
+    """
+    CREATE FUNCTION links_claim_alias() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO link_aliases (custom_alias, link_id, expires_at)
+        VALUES (NEW.custom_alias, NEW.id, NEW.expires_at)
+        ON CONFLICT (custom_alias) DO UPDATE SET expires_at = EXCLUDED.expires_at
+        WHERE link_aliases.link_id = EXCLUDED.link_id;
+        IF NOT FOUND THEN
+            RETURN NULL;
+        END IF;
+        RETURN NEW;
+    END
+    $$
+    """,
+    """
+    CREATE FUNCTION links_move_alias() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF NEW.custom_alias <> OLD.custom_alias THEN
+            INSERT INTO link_aliases (custom_alias, link_id, expires_at)
+            VALUES (NEW.custom_alias, NEW.id, NEW.expires_at)
+            ON CONFLICT (custom_alias) DO NOTHING;
+            IF NOT FOUND THEN
+                RAISE EXCEPTION 'short link % already exists', NEW.custom_alias USING ERRCODE = 'unique_violation';
+            END IF;
+            DELETE FROM link_aliases WHERE custom_alias = OLD.custom_alias AND link_id = OLD.id;
+        ELSE
+            UPDATE link_aliases SET expires_at = NEW.expires_at
+            WHERE custom_alias = OLD.custom_alias AND link_id = OLD.id;
+        END IF;
+        RETURN NEW;
+    END
+    $$
+    """,
+    """
+    CREATE FUNCTION links_release_alias() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        DELETE FROM link_aliases WHERE custom_alias = OLD.custom_alias AND link_id = OLD.id;
+        RETURN OLD;
+    END
+    $$
+    """,
+)
+TRIGGERS = (
+    "CREATE TRIGGER links_claim_alias BEFORE INSERT ON links FOR EACH ROW EXECUTE FUNCTION links_claim_alias()",
+    "CREATE TRIGGER links_move_alias BEFORE UPDATE OF custom_alias, expires_at ON links "
+    "FOR EACH ROW EXECUTE FUNCTION links_move_alias()",
+    "CREATE TRIGGER links_release_alias BEFORE DELETE ON links FOR EACH ROW EXECUTE FUNCTION links_release_alias()",
+)
+
+
+def partition_ranges(now):
+    lower = datetime.datetime(now.year, now.month, now.day)
+    lower -= datetime.timedelta(days=lower.weekday())
+    end = now + PARTITION_PREMAKE * PARTITION_STEP
+    ranges = []
+    while lower <= end:
+        ranges.append((lower, lower + PARTITION_STEP))
+        lower += PARTITION_STEP
+    return ranges
+
+
+def bound(moment):
+    return "MINVALUE" if moment is None else f"'{moment:%Y-%m-%d %H:%M:%S}+00'"
+
+
+def create_partition(name, lower, upper):
+    op.execute(f"CREATE TABLE {name} PARTITION OF links FOR VALUES FROM ({bound(lower)}) TO ({bound(upper)})")
+
+
+def create_indexes():
+    op.create_index('ix_links_custom_alias', 'links', ['custom_alias'])
+    op.create_index('ix_links_long_link_hash_id', 'links', ['long_link_hash', 'id'])
+    op.create_index(
+        'ix_links_user_id_id', 'links', ['user_id', 'id'],
+        postgresql_include=['custom_alias', 'expires_at', 'creation_date', 'number_of_usages'],
+    )
+    op.create_index('ix_links_user_id_usages_id', 'links', ['user_id', 'number_of_usages', 'id'])
+
+
+def upgrade() -> None:
+    # таблица переписывается целиком в одной транзакции под эксклюзивной блокировкой:
+    # на больших базах миграцию нужно запускать в окно обслуживания
+    op.rename_table('links', 'links_unpartitioned')
+    for name in OLD_INDEXES:
+        op.drop_index(name, table_name='links_unpartitioned')
+    op.execute("ALTER TABLE links_unpartitioned RENAME CONSTRAINT links_pkey TO links_unpartitioned_pkey")
+    op.execute("ALTER SEQUENCE links_id_seq OWNED BY NONE")
+
+    op.execute("CREATE TABLE links (LIKE links_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (expires_at)")
+    op.alter_column('links', 'expires_at', nullable=False)
+    op.create_primary_key('links_pkey', 'links', ['id', 'expires_at'])
+
+    op.create_table(
+        'link_aliases',
+        sa.Column('custom_alias', sa.String(), nullable=False),
+        sa.Column('link_id', sa.Integer(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('custom_alias'),
+    )
+
+    ranges = partition_ranges(datetime.datetime.utcnow())
+    # все, что истекло до текущей секции, -- одна секция: первая же очистка удалит ее целиком
+    create_partition(EXPIRED_PARTITION, None, ranges[0][0])
+    for lower, upper in ranges:
+        create_partition(f"links_p{lower:%Y%m%d}", lower, upper)
+    op.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF links DEFAULT")
+
+    op.execute(f"INSERT INTO links ({COLUMNS}) SELECT {SOURCE_COLUMNS} FROM links_unpartitioned")
+    op.execute("INSERT INTO link_aliases (custom_alias, link_id, expires_at) SELECT custom_alias, id, expires_at FROM links")
+    op.execute("ALTER SEQUENCE links_id_seq OWNED BY links.id")
+
+    create_indexes()
+    op.create_index('ix_link_aliases_expires_at', 'link_aliases', ['expires_at'])
+    for statement in TRIGGER_FUNCTIONS + TRIGGERS:
+        op.execute(statement)
+    op.drop_table('links_unpartitioned')
+
+
+def downgrade() -> None:
+    op.execute("CREATE TABLE links_unpartitioned (LIKE links INCLUDING DEFAULTS)")
+    op.execute(f"INSERT INTO links_unpartitioned ({COLUMNS}) SELECT {COLUMNS} FROM links")
+    op.execute("ALTER SEQUENCE links_id_seq OWNED BY NONE")
+    for name in ('links_release_alias', 'links_move_alias', 'links_claim_alias'):
+        op.execute(f"DROP TRIGGER {name} ON links")
+        op.execute(f"DROP FUNCTION {name}()")
+    op.drop_table('links')
+    op.drop_index('ix_link_aliases_expires_at', table_name='link_aliases')
+    op.drop_table('link_aliases')
+
+    op.rename_table('links_unpartitioned', 'links')
+    op.alter_column('links', 'expires_at', nullable=True)
+    op.create_primary_key('links_pkey', 'links', ['id'])
+    op.execute("ALTER SEQUENCE links_id_seq OWNED BY links.id")
+    op.create_index('ix_links_id', 'links', ['id'])
+    op.create_index('ix_links_custom_alias', 'links', ['custom_alias'], unique=True)
+    op.create_index('ix_links_long_link_hash_id', 'links', ['long_link_hash', 'id'])
+    op.create_index('ix_links_expires_at', 'links', ['expires_at'])
+    op.create_index(
+        'ix_links_user_id_id', 'links', ['user_id', 'id'],
+        postgresql_include=['custom_alias', 'expires_at', 'creation_date', 'number_of_usages'],
+    )
+    op.create_index('ix_links_user_id_usages_id', 'links', ['user_id', 'number_of_usages', 'id'])
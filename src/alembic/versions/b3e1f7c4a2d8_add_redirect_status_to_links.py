@@ -0,0 +1,28 @@
+"""Add redirect_status to links
+
+Revision ID: b3e1f7c4a2d8
+Revises: a7d3e5b90c12
+Create Date: 2026-10-18 22:03:41.582904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e1f7c4a2d8'
+down_revision: Union[str, None] = 'a7d3e5b90c12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # постоянное значение по умолчанию хранится в каталоге: секции не переписываются,
+    # существующие ссылки сохраняют прежний 301
+    op.add_column('links', sa.Column('redirect_status', sa.SmallInteger(), server_default=sa.text('301'), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('links', 'redirect_status')
@@ -0,0 +1,46 @@
+"""Add click rollup tables
+
+Revision ID: b73e05d19a4c
+Revises: 8d41b7c2e6f0
+Create Date: 2026-10-18 14:05:37.552190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b73e05d19a4c'
+down_revision: Union[str, None] = '8d41b7c2e6f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('link_click_rollups',
+    sa.Column('custom_alias', sa.String(), nullable=False),
+    sa.Column('granularity', sa.String(length=8), nullable=False),
+    sa.Column('bucket', sa.DateTime(), nullable=False),
+    sa.Column('clicks', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('custom_alias', 'granularity', 'bucket')
+    )
+    op.create_table('link_click_sources',
+    sa.Column('custom_alias', sa.String(), nullable=False),
+    sa.Column('day', sa.DateTime(), nullable=False),
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('value', sa.String(length=255), nullable=False),
+    sa.Column('clicks', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('custom_alias', 'day', 'kind', 'value')
+    )
+    # индексы для очистки старых корзин по времени
+    op.create_index('ix_link_click_rollups_granularity_bucket', 'link_click_rollups', ['granularity', 'bucket'])
+    op.create_index('ix_link_click_sources_day', 'link_click_sources', ['day'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_link_click_sources_day', table_name='link_click_sources')
+    op.drop_index('ix_link_click_rollups_granularity_bucket', table_name='link_click_rollups')
+    op.drop_table('link_click_sources')
+    op.drop_table('link_click_rollups')
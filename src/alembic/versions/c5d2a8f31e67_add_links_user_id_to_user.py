@@ -0,0 +1,34 @@
+"""Add links_user_id to user
+
+Revision ID: c5d2a8f31e67
+Revises: b3e1f7c4a2d8
+Create Date: 2026-10-19 10:12:08.264913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d2a8f31e67'
+down_revision: Union[str, None] = 'b3e1f7c4a2d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # каждый зарегистрированный пользователь получает свой links.user_id; бенчмарки создают ссылки
+    # с отрицательными user_id, поэтому последовательность начинается с 1 и с ними не пересекается
+    op.execute("CREATE SEQUENCE user_links_user_id_seq")
+    op.add_column('user', sa.Column(
+        'links_user_id', sa.Integer(), server_default=sa.text("nextval('user_links_user_id_seq')"), nullable=False,
+    ))
+    op.execute('ALTER SEQUENCE user_links_user_id_seq OWNED BY "user".links_user_id')
+    op.create_unique_constraint('uq_user_links_user_id', 'user', ['links_user_id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_user_links_user_id', 'user', type_='unique')
+    op.drop_column('user', 'links_user_id')
@@ -0,0 +1,106 @@
+"""Add long_link_hash to links
+
+Revision ID: e4a9c3f17b52
+Revises: b73e05d19a4c
+Create Date: 2026-10-18 16:41:09.305118
+
+"""
+import hashlib
+import re
+import string
+from typing import Sequence, Union
+from urllib.parse import urlsplit, urlunsplit
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a9c3f17b52'
+down_revision: Union[str, None] = 'b73e05d19a4c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+
+# канонический вид URL на момент ревизии (копия links/urls.py): миграция должна заполнять отпечатки
+# одинаково, как бы потом ни менялся код приложения. Изменение канонизации в links/urls.py
+# требует своей миграции, пересчитывающей long_link_hash
+DEFAULT_PORTS = {"http": 80, "https": 443}
+PERCENT_ESCAPE = re.compile(r"%([0-9A-Fa-f]{2})")
+UNRESERVED = frozenset(string.ascii_letters + string.digits + "-._~")
+
+
+def normalize_escapes(part):
+    def replace(match):
+        char = chr(int(match.group(1), 16))
+        return char if char in UNRESERVED else "%" + match.group(1).upper()
+    return PERCENT_ESCAPE.sub(replace, part)
+
+
+def canonicalize_url(url):
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if not scheme or not host:
+        return url
+    netloc = f"[{host}]" if ":" in host else host
+    if parts.username is not None:
+        credentials = parts.username + (f":{parts.password}" if parts.password is not None else "")
+        netloc = f"{credentials}@{netloc}"
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+    path = normalize_escapes(parts.path) or "/"
+    query = normalize_escapes(parts.query)
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def url_fingerprint(url):
+    return hashlib.sha256(canonicalize_url(url).encode("UTF-8")).hexdigest()
+
+
+def upgrade() -> None:
+    op.add_column('links', sa.Column('long_link_hash', sa.String(length=64), nullable=True))
+
+    # заполнение пачками: каждая пачка -- отдельная транзакция, таблица не блокируется целиком
+    bind = op.get_bind()
+    select_batch = sa.text(
+        "SELECT id, long_link FROM links WHERE id > :last_id AND long_link_hash IS NULL ORDER BY id LIMIT :limit"
+    )
+    update_batch = sa.text(
+        "UPDATE links SET long_link_hash = batch.hash "
+        "FROM unnest(CAST(:ids AS integer[]), CAST(:hashes AS varchar[])) AS batch(id, hash) "
+        "WHERE links.id = batch.id"
+    )
+    with op.get_context().autocommit_block():
+        last_id = 0
+        while True:
+            rows = bind.execute(select_batch, {"last_id": last_id, "limit": BATCH_SIZE}).all()
+            if not rows:
+                break
+            bind.execute(update_batch, {
+                "ids": [row.id for row in rows],
+                "hashes": [url_fingerprint(row.long_link) for row in rows],
+            })
+            last_id = rows[-1].id
+
+        op.create_index('ix_links_long_link_hash_id', 'links', ['long_link_hash', 'id'], postgresql_concurrently=True)
+        op.drop_index('ix_links_long_link', table_name='links', postgresql_concurrently=True)
+
+    # NOT NULL через проверенный CHECK: SET NOT NULL не сканирует таблицу под эксклюзивной блокировкой
+    op.execute("ALTER TABLE links ADD CONSTRAINT links_long_link_hash_not_null CHECK (long_link_hash IS NOT NULL) NOT VALID")
+    op.execute("ALTER TABLE links VALIDATE CONSTRAINT links_long_link_hash_not_null")
+    op.alter_column('links', 'long_link_hash', nullable=False)
+    op.drop_constraint('links_long_link_hash_not_null', 'links', type_='check')
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_links_long_link', 'links', ['long_link'], postgresql_using='hash', postgresql_concurrently=True)
+        op.drop_index('ix_links_long_link_hash_id', table_name='links', postgresql_concurrently=True)
+    op.drop_column('links', 'long_link_hash')
@@ -1,7 +1,8 @@
 from fastapi import Depends
 from fastapi_users.db import SQLAlchemyBaseUserTableUUID, SQLAlchemyUserDatabase
+from sqlalchemy import Integer, text
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from database import engine, get_async_session
 
 
@@ -10,7 +11,11 @@ class Base(DeclarativeBase):
 
 
 class User(SQLAlchemyBaseUserTableUUID, Base):
-    pass
+    # links.user_id пользователя: выдается из последовательности при регистрации,
+    # по нему GET /links/mine отдает только ссылки самого пользователя
+    links_user_id: Mapped[int] = mapped_column(
+        Integer, server_default=text("nextval('user_links_user_id_seq')"), unique=True, nullable=False
+    )
 
 async def create_db_and_tables():
     async with engine.begin() as conn:
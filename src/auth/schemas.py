@@ -4,7 +4,8 @@ from fastapi_users import schemas
 
 
 class UserRead(schemas.BaseUser[uuid.UUID]):
-    pass
+    # user_id для создания ссылок и GET /links/mine
+    links_user_id: int
 
 
 class UserCreate(schemas.BaseUserCreate):
@@ -0,0 +1,62 @@
+"""Бенчмарк стратегий генерации коротких ссылок
+
+Запуск из папки src:
+    python -m benchmarks.alias_generators --iterations 100000
+"""
+import argparse
+import time
+
+from links.aliases import ALIAS_GENERATORS
+
+LONG_LINK = "https://example.com/some/long/path?utm_source=benchmark&utm_medium=cli"
+
+
+def measure(generator, iterations):
+    """Функция замера скорости генерации
+
+    params:
+        generator: AliasGenerator
+        iterations: int
+
+    returns: dict
+        strategy: str
+        per_second: float
+        microseconds: float
+        unique: int
+    """
+    aliases = set()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        aliases.add(generator.generate(LONG_LINK))
+    elapsed = time.perf_counter() - started
+    return {
+        "strategy": generator.name,
+        "per_second": iterations / elapsed,
+        "microseconds": elapsed / iterations * 1e6,
+        "unique": len(aliases),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--pbkdf2-iterations", type=int, default=50,
+                        help="pbkdf2 слишком медленный для полного прогона")
+    args = parser.parse_args()
+
+    results = []
+    for name, generator_class in ALIAS_GENERATORS.items():
+        iterations = args.pbkdf2_iterations if name == "pbkdf2" else args.iterations
+        results.append((iterations, measure(generator_class(), iterations)))
+
+    baseline = next(result["per_second"] for _, result in results if result["strategy"] == "pbkdf2")
+    print(f"{'strategy':<12}{'creates/sec':>14}{'us/alias':>12}{'x pbkdf2':>12}{'unique':>16}")
+    for iterations, result in results:
+        print(
+            f"{result['strategy']:<12}{result['per_second']:>14.0f}{result['microseconds']:>12.2f}"
+            f"{result['per_second'] / baseline:>12.0f}{result['unique']:>9}/{iterations}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Бенчмарк массового создания ссылок: POST /links/shorten/bulk против цикла POST /links/shorten
+
+Запуск из папки src (нужна база данных из .env с примененными миграциями):
+    python -m benchmarks.bulk_shorten --links 100000 --single-links 2000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+from sqlalchemy import text
+
+from database import engine
+from main import app
+
+SEED_USER_ID = -1
+
+
+def item(i):
+    return {
+        "user_id": SEED_USER_ID,
+        "long_link": f"https://example.com/bulk/{i}",
+        "custom_alias": "",
+        "expires_at": "2099-01-01T00:00:00Z",
+    }
+
+
+async def ndjson_body(count):
+    for i in range(count):
+        yield (json.dumps(item(i)) + "\n").encode()
+
+
+async def run_single(client, count):
+    started = time.perf_counter()
+    for i in range(count):
+        response = await client.post("/links/shorten", json=item(i))
+        response.raise_for_status()
+    return count / (time.perf_counter() - started)
+
+
+async def run_bulk(client, count):
+    started = time.perf_counter()
+    created = 0
+    async with client.stream(
+        "POST", "/links/shorten/bulk", content=ndjson_body(count), headers={"Content-Type": "application/x-ndjson"}
+    ) as response:
+        async for line in response.aiter_lines():
+            result = json.loads(line)
+            if result["status"] == "done":
+                created = result["created"]
+    return created / (time.perf_counter() - started)
+
+
+async def run(links, single_links):
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            single = await run_single(client, single_links)
+            bulk = await run_bulk(client, links)
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text("DELETE FROM links WHERE user_id = :user_id"), {"user_id": SEED_USER_ID})
+        await engine.dispose()
+    print(f"single endpoint: {single:>10.0f} links/sec ({single_links} links)")
+    print(f"bulk endpoint:   {bulk:>10.0f} links/sec ({links} links)")
+    print(f"speedup:         {bulk / single:>10.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--links", type=int, default=100000)
+    parser.add_argument("--single-links", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(args.links, args.single_links))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Бенчмарк разгрузки сервиса кэширующим прокси: какая доля переходов не доходит до приложения
+
+Нужен поднятый docker-compose с кэширующим прокси (docker compose --profile cache up):
+--origin-url -- само приложение, --cache-url -- nginx_cache перед ним (замена CDN).
+Через приложение создается --links ссылок, доля --temporary из них с redirect_status 302, остальные с 301.
+Затем через прокси отправляется --requests переходов с распределением популярности Ципфа
+(немного ссылок получают большую часть переходов) и по заголовку X-Cache-Status считается,
+сколько ответов отдал кэш прокси. Переходы по 301 кэшируются до max-age и в статистике
+переходов не учитываются, по 302 -- всегда доходят до приложения и учитываются.
+Отдельно проверяется условный запрос /links/{short_code}/stats: повтор с If-None-Match получает 304.
+Запуск из папки src:
+    python -m benchmarks.cdn_offload --links 1000 --requests 50000 --temporary 0.2
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import time
+from collections import Counter
+
+import httpx
+
+SEED_USER_ID = -3
+CACHE_STATUS_HEADER = "x-cache-status"
+
+
+async def create_links(client, count, temporary_share, expires_in, rng):
+    """Функция создания ссылок через POST /links/shorten/bulk
+
+    returns:
+        links: list of (short_link, redirect_status)
+    """
+    expires_at = (datetime.datetime.utcnow() + expires_in).strftime("%Y-%m-%dT%H:%M:%SZ")
+    statuses = [302 if rng.random() < temporary_share else 301 for _ in range(count)]
+
+    async def body():
+        for index, redirect_status in enumerate(statuses):
+            yield (json.dumps({
+                "user_id": SEED_USER_ID,
+                "long_link": f"https://example.com/offload/{index}",
+                "custom_alias": "",
+                "expires_at": expires_at,
+                "redirect_status": redirect_status,
+            }) + "\n").encode()
+
+    links = []
+    async with client.stream(
+        "POST", "/links/shorten/bulk", content=body(), headers={"Content-Type": "application/x-ndjson"}
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            result = json.loads(line)
+            if result.get("status") == "success":
+                links.append((result["short_link"], statuses[result["index"]]))
+    return links
+
+
+async def send_clicks(client, plan, concurrency):
+    """Функция отправки переходов через прокси
+
+    returns:
+        counts: Counter ((redirect_status, X-Cache-Status) -> число ответов)
+        seconds: float
+    """
+    counts = Counter()
+    queue = iter(plan)
+
+    async def worker():
+        for short_link, redirect_status in queue:
+            response = await client.get(f"/links/{short_link}")
+            counts[redirect_status, response.headers.get(CACHE_STATUS_HEADER, "NONE")] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return counts, time.perf_counter() - started
+
+
+async def check_conditional_stats(client, short_link):
+    first = await client.get(f"/links/{short_link}/stats")
+    etag = first.headers.get("etag")
+    if etag is None:
+        return first.status_code, None
+    second = await client.get(f"/links/{short_link}/stats", headers={"If-None-Match": etag})
+    return first.status_code, second.status_code
+
+
+async def run(origin_url, cache_url, links, requests, temporary_share, zipf, concurrency, expires_hours):
+    rng = random.Random(0)
+    async with httpx.AsyncClient(base_url=origin_url, timeout=None) as origin:
+        created = await create_links(origin, links, temporary_share, datetime.timedelta(hours=expires_hours), rng)
+        stats_codes = await check_conditional_stats(origin, created[0][0])
+    print(f"created {len(created)} links, {sum(status == 302 for _, status in created)} of them with 302")
+
+    weights = [1 / (rank + 1) ** zipf for rank in range(len(created))]
+    plan = rng.choices(created, weights=weights, k=requests)
+    async with httpx.AsyncClient(base_url=cache_url, timeout=None, follow_redirects=False) as proxy:
+        counts, seconds = await send_clicks(proxy, plan, concurrency)
+
+    print(f"{'policy':<8}{'clicks':>10}{'from cache':>12}{'to origin':>12}{'offload':>10}")
+    for redirect_status in (301, 302, None):
+        selected = {key: value for key, value in counts.items() if redirect_status is None or key[0] == redirect_status}
+        total = sum(selected.values())
+        hits = sum(value for (_, cache_status), value in selected.items() if cache_status == "HIT")
+        label = "all" if redirect_status is None else str(redirect_status)
+        print(f"{label:<8}{total:>10}{hits:>12}{total - hits:>12}{(hits / total if total else 0):>10.1%}")
+    print(f"{requests / seconds:.0f} req/s through proxy, X-Cache-Status: {dict(Counter(s for (_, s) in counts.elements()))}")
+    print(f"/stats: first {stats_codes[0]}, repeat with If-None-Match {stats_codes[1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--origin-url", default="http://localhost:9999")
+    parser.add_argument("--cache-url", default="http://localhost:9998")
+    parser.add_argument("--links", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--temporary", type=float, default=0.2, help="доля ссылок с redirect_status 302")
+    parser.add_argument("--zipf", type=float, default=1.1, help="показатель распределения популярности ссылок")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--expires-hours", type=float, default=24)
+    args = parser.parse_args()
+    asyncio.run(run(
+        args.origin_url, args.cache_url, args.links, args.requests, args.temporary, args.zipf, args.concurrency,
+        args.expires_hours,
+    ))
+
+
+if __name__ == "__main__":
+    main()
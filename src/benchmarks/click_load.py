@@ -0,0 +1,85 @@
+"""Нагрузочный тест учета переходов
+
+Создает короткую ссылку, делает --clicks параллельных переходов (--concurrency
+одновременно) и записывает буфер, после чего проверяет, что number_of_usages вырос
+ровно на --clicks, и считает, сколько запросов на запись (UPDATE счетчиков и INSERT
+корзин статистики) ушло в базу данных на один переход.
+Запуск из папки src (нужны база данных и Redis из .env):
+    python -m benchmarks.click_load --clicks 20000 --concurrency 200
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from sqlalchemy import event, select, delete, insert
+
+from database import engine
+from links.aliases import alias_generator
+from links.clicks import click_aggregator
+from links.models import linking, click_rollups, click_sources
+from links.urls import url_fingerprint
+from main import app
+
+
+async def run(clicks, concurrency):
+    alias = alias_generator.generate("https://example.com/click-load")
+    async with engine.begin() as conn:
+        await conn.execute(insert(linking).values(
+            user_id=-1, long_link="https://example.com/click-load",
+            long_link_hash=url_fingerprint("https://example.com/click-load"), custom_alias=alias,
+            expires_at=None, last_usage=None, number_of_usages=0, is_authorized=True,
+        ))
+
+    writes = 0
+
+    def count_writes(conn, cursor, statement, parameters, context, executemany):
+        nonlocal writes
+        if statement.lstrip().upper().startswith(("UPDATE", "INSERT")):
+            writes += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count_writes)
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    flusher = asyncio.create_task(click_aggregator.run())
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def click():
+                async with semaphore:
+                    response = await client.get(f"/links/{alias}")
+                    assert response.status_code == 301, response.status_code
+
+            started = time.perf_counter()
+            await asyncio.gather(*(click() for _ in range(clicks)))
+            elapsed = time.perf_counter() - started
+    finally:
+        flusher.cancel()
+        await asyncio.gather(flusher, return_exceptions=True)
+        # в режиме redis при остановке приращения только отдаются в Redis -- записываем их явно
+        await click_aggregator.flush()
+        event.remove(engine.sync_engine, "before_cursor_execute", count_writes)
+
+    async with engine.begin() as conn:
+        counted = await conn.scalar(select(linking.c.number_of_usages).where(linking.c.custom_alias == alias))
+        await conn.execute(delete(linking).where(linking.c.custom_alias == alias))
+        await conn.execute(delete(click_rollups).where(click_rollups.c.custom_alias == alias))
+        await conn.execute(delete(click_sources).where(click_sources.c.custom_alias == alias))
+    await engine.dispose()
+
+    print(f"backend:           {click_aggregator.backend}")
+    print(f"redirects/sec:     {clicks / elapsed:.0f}")
+    print(f"clicks sent:       {clicks}")
+    print(f"clicks counted:    {counted}  ({'OK' if counted == clicks else 'LOST ' + str(clicks - counted)})")
+    print(f"write statements:  {writes}  ({writes / clicks:.5f} per redirect)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clicks", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.clicks, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Бенчмарк задержки POST /links/shorten в зависимости от размера таблицы links
+
+Таблица наполняется синтетическими строками (user_id = SEED_USER_ID) до каждого
+размера из --sizes, после чего замеряется задержка создания ссылки. При индексированных
+точечных проверках задержка не должна расти вместе с таблицей.
+Запуск из папки src (нужна база данных из .env с примененными миграциями):
+    python -m benchmarks.create_latency --sizes 0 10000 100000 1000000 --requests 300
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from sqlalchemy import text
+
+from database import engine
+from main import app
+
+SEED_USER_ID = -1
+
+
+async def seed_to(size):
+    """Функция дозаполнения таблицы links синтетическими строками до размера size"""
+    async with engine.begin() as conn:
+        current = await conn.scalar(text("SELECT count(*) FROM links WHERE user_id = :user_id"), {"user_id": SEED_USER_ID})
+        if current >= size:
+            return
+        await conn.execute(text(
+            "INSERT INTO links (user_id, long_link, long_link_hash, custom_alias, expires_at, last_usage, number_of_usages, is_authorized) "
+            # адреса уже канонические, поэтому отпечаток совпадает с links.urls.url_fingerprint
+            "SELECT :user_id, 'https://example.com/seed/' || g, encode(sha256(convert_to('https://example.com/seed/' || g, 'UTF8')), 'hex'), "
+            "'seed' || lpad(g::text, 6, '0'), "
+            "now() + interval '30 days', now(), 0, true "
+            "FROM generate_series(:start, :stop) AS g"
+        ), {"user_id": SEED_USER_ID, "start": current, "stop": size - 1})
+
+
+async def cleanup():
+    async with engine.begin() as conn:
+        await conn.execute(text("DELETE FROM links WHERE user_id = :user_id"), {"user_id": SEED_USER_ID})
+
+
+async def measure(client, requests):
+    latencies = []
+    for i in range(requests):
+        payload = {
+            "user_id": SEED_USER_ID,
+            "long_link": f"https://example.com/bench/{time.time_ns()}/{i}",
+            "custom_alias": "",
+            "expires_at": "2099-01-01T00:00:00Z",
+        }
+        started = time.perf_counter()
+        response = await client.post("/links/shorten", json=payload)
+        latencies.append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+    latencies.sort()
+    return {
+        "mean_ms": statistics.fmean(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+async def run(sizes, requests):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{'rows':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        try:
+            for size in sorted(sizes):
+                await seed_to(size)
+                result = await measure(client, requests)
+                print(f"{size:>10}{result['mean_ms']:>10.2f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}")
+        finally:
+            await cleanup()
+            await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 10000, 100000, 1000000])
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.requests))
+
+
+if __name__ == "__main__":
+    main()
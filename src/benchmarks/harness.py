@@ -0,0 +1,318 @@
+"""Нагрузочный бенчмарк ручек коротких ссылок: задержка p50/p95/p99 и пропускная способность
+
+Для каждого размера из --sizes таблица links дозаполняется синтетическими ссылками
+(user_id = SEED_USER_ID), после чего прогоняются сценарии из --scenarios: переходы по
+ссылкам из кэша и мимо кэша, по несуществующим ссылкам, создание, поиск и статистика
+с попаданием и промахом кэша ответов. Результат сохраняется в JSON с хэшем коммита,
+чтобы сравнивать прогоны между коммитами.
+
+Режимы:
+    asgi -- приложение в этом процессе (httpx.ASGITransport, lifespan запускается),
+            нужны база данных и Redis из .env с примененными миграциями;
+            таблица заполняется одним INSERT ... SELECT generate_series на миллион строк
+    http -- уже запущенный стенд docker-compose (--base-url), таблица заполняется через
+            POST /admin/links/import (COPY, нужен JWT superuser в --admin-token),
+            без --admin-token -- через POST /links/shorten/bulk
+
+Запуск из папки src:
+    python -m benchmarks.harness --sizes 10000 100000 1000000 --requests 2000 --concurrency 32
+    python -m benchmarks.harness --mode http --base-url http://localhost:9999 --sizes 10000
+    python -m benchmarks.harness --mode http --admin-token $TOKEN --sizes 1000000 10000000
+    python -m benchmarks.harness --compare benchmarks/results/old.json benchmarks/results/new.json
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import pathlib
+import random
+import string
+import subprocess
+import time
+
+import httpx
+
+SEED_USER_ID = -1
+# на каждую оригинальную ссылку приходится LINKS_PER_URL коротких -- для поиска с несколькими результатами
+LINKS_PER_URL = 4
+SEED_CHUNK = 1_000_000
+# строк CSV в одном куске тела POST /admin/links/import
+SEED_COPY_LINES = 10_000
+HOT_KEYS = 20
+RESULTS_DIR = pathlib.Path(__file__).parent / "results"
+SCENARIOS = [
+    "redirect_hot", "redirect_cold", "redirect_missing",
+    "create", "search_hot", "search_cold", "stats_hot", "stats_cold",
+]
+
+
+def seed_alias(number):
+    return f"b{number:09d}"
+
+
+def seed_url(number):
+    return f"https://example.com/seed/{number // LINKS_PER_URL}"
+
+
+def commit_hash():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+
+def summarize(latencies, statuses, elapsed):
+    """Функция расчета перцентилей задержки (мс) и пропускной способности (запросов в секунду)"""
+    latencies = sorted(latencies)
+
+    def percentile(share):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * share))], 3)
+
+    return {
+        "requests": len(latencies),
+        "status_codes": {str(code): statuses.count(code) for code in sorted(set(statuses))},
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(latencies[-1], 3),
+    }
+
+
+class Seeder:
+    """Дозаполнение таблицы links синтетическими ссылками seed_alias(0..size-1)"""
+
+    def __init__(self, client, mode, admin_token=None):
+        self.client = client
+        self.mode = mode
+        self.admin_token = admin_token
+
+    async def count(self):
+        if self.mode == "http":
+            # в http-режиме база данных недоступна напрямую: ищем последнюю ссылку последовательности
+            low, high = 0, 1
+            while (await self.client.get(f"/links/{seed_alias(high - 1)}")).status_code in (301, 410):
+                low, high = high, high * 2
+            while low < high:
+                middle = (low + high) // 2
+                exists = (await self.client.get(f"/links/{seed_alias(middle)}")).status_code in (301, 410)
+                low, high = (middle + 1, high) if exists else (low, middle)
+            return low
+        from sqlalchemy import text
+        from database import engine
+        async with engine.connect() as conn:
+            return await conn.scalar(text("SELECT count(*) FROM links WHERE user_id = :user_id"), {"user_id": SEED_USER_ID})
+
+    async def seed_to(self, size):
+        current = await self.count()
+        if current >= size:
+            return 0
+        if self.mode == "http" and self.admin_token:
+            await self._seed_copy(current, size)
+        elif self.mode == "http":
+            await self._seed_bulk(current, size)
+        else:
+            await self._seed_sql(current, size)
+        return size - current
+
+    async def _seed_bulk(self, start, stop):
+        def body():
+            for number in range(start, stop):
+                yield (json.dumps({
+                    "user_id": SEED_USER_ID, "long_link": seed_url(number), "custom_alias": seed_alias(number),
+                    "expires_at": "2099-01-01T00:00:00Z",
+                }) + "\n").encode()
+
+        response = await self.client.post("/links/shorten/bulk", content=body(), timeout=None)
+        response.raise_for_status()
+
+    async def _seed_copy(self, start, stop):
+        def body():
+            # отпечаток long_link считает сама загрузка (admin/transfer.py)
+            yield b"user_id,long_link,custom_alias,expires_at\n"
+            for chunk_start in range(start, stop, SEED_COPY_LINES):
+                lines = []
+                for number in range(chunk_start, min(chunk_start + SEED_COPY_LINES, stop)):
+                    lines.append(f"{SEED_USER_ID},{seed_url(number)},{seed_alias(number)},2099-01-01T00:00:00Z\n")
+                yield "".join(lines).encode()
+
+        response = await self.client.post(
+            "/admin/links/import", params={"format": "csv"}, content=body(), timeout=None,
+            headers={"Authorization": f"Bearer {self.admin_token}", "Content-Type": "text/csv"},
+        )
+        response.raise_for_status()
+
+    async def _seed_sql(self, start, stop):
+        from sqlalchemy import text
+        from database import engine, async_session_maker
+        from links.bloom import alias_filter, FILTER_KEY
+        statement = text(
+            "INSERT INTO links (user_id, long_link, long_link_hash, custom_alias, expires_at, last_usage, number_of_usages, is_authorized) "
+            # адреса уже канонические, поэтому отпечаток совпадает с links.urls.url_fingerprint
+            "SELECT :user_id, 'https://example.com/seed/' || (g / :per_url), "
+            "encode(sha256(convert_to('https://example.com/seed/' || (g / :per_url), 'UTF8')), 'hex'), "
+            "'b' || lpad(g::text, 9, '0'), now() + interval '30 days', now(), 0, true "
+            "FROM generate_series(:start, :stop) AS g"
+        )
+        for chunk_start in range(start, stop, SEED_CHUNK):
+            async with engine.begin() as conn:
+                await conn.execute(statement, {
+                    "user_id": SEED_USER_ID, "per_url": LINKS_PER_URL,
+                    "start": chunk_start, "stop": min(chunk_start + SEED_CHUNK, stop) - 1,
+                })
+        # строки вставлены мимо приложения -- фильтр Блума о них не знает, пересобираем
+        await alias_filter.redis.delete(FILTER_KEY)
+        await alias_filter.build(async_session_maker)
+
+    async def cleanup(self):
+        if self.mode == "http":
+            return
+        from sqlalchemy import text
+        from database import engine
+        async with engine.begin() as conn:
+            await conn.execute(text("DELETE FROM links WHERE user_id = :user_id"), {"user_id": SEED_USER_ID})
+
+
+def build_requests(scenario, size, count):
+    """Функция построения списка запросов сценария: (метод, путь, тело)"""
+    rng = random.Random(f"{scenario}-{size}")
+    hot = [rng.randrange(size) for _ in range(HOT_KEYS)]
+    # холодные ключи не повторяются, пока их хватает
+    cold = rng.sample(range(size), min(count, size)) if size else []
+    cold = (cold * (count // max(len(cold), 1) + 1))[:count]
+    if scenario == "redirect_hot":
+        return [("GET", f"/links/{seed_alias(rng.choice(hot))}", None) for _ in range(count)]
+    if scenario == "redirect_cold":
+        return [("GET", f"/links/{seed_alias(number)}", None) for number in cold]
+    if scenario == "redirect_missing":
+        alphabet = string.ascii_letters + string.digits
+        return [("GET", "/links/z" + "".join(rng.choices(alphabet, k=9)), None) for _ in range(count)]
+    if scenario == "create":
+        return [("POST", "/links/shorten", {
+            "user_id": SEED_USER_ID, "long_link": f"https://example.com/bench/{time.time_ns()}/{i}",
+            "custom_alias": "", "expires_at": "2099-01-01T00:00:00Z",
+        }) for i in range(count)]
+    if scenario == "search_hot":
+        return [("GET", f"/links/links/search?url={seed_url(rng.choice(hot))}", None) for _ in range(count)]
+    if scenario == "search_cold":
+        return [("GET", f"/links/links/search?url={seed_url(number)}", None) for number in cold]
+    if scenario == "stats_hot":
+        return [("GET", f"/links/{seed_alias(rng.choice(hot))}/stats", None) for _ in range(count)]
+    if scenario == "stats_cold":
+        return [("GET", f"/links/{seed_alias(number)}/stats", None) for number in cold]
+    raise ValueError(f"unknown scenario {scenario!r}, expected one of {SCENARIOS}")
+
+
+async def run_scenario(client, requests, concurrency):
+    latencies, statuses = [], []
+    queue = iter(requests)
+
+    async def worker():
+        for method, path, body in queue:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                statuses.append(response.status_code)
+            except httpx.HTTPError:
+                statuses.append(0)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, statuses, time.perf_counter() - started)
+
+
+@contextlib.asynccontextmanager
+async def open_client(mode, base_url):
+    if mode == "http":
+        async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+            yield client
+        return
+    from database import engine
+    from main import app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            yield client
+    await engine.dispose()
+
+
+async def run(args):
+    report = {
+        "commit": commit_hash(),
+        "started_at": datetime.datetime.utcnow().isoformat(),
+        "mode": args.mode,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "results": [],
+    }
+    print(f"{'rows':>10} {'scenario':<18}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  statuses")
+    async with open_client(args.mode, args.base_url) as client:
+        seeder = Seeder(client, args.mode, args.admin_token)
+        try:
+            for size in sorted(args.sizes):
+                started = time.perf_counter()
+                seeded = await seeder.seed_to(size)
+                seed_seconds = round(time.perf_counter() - started, 1)
+                for scenario in args.scenarios:
+                    requests = build_requests(scenario, size, args.requests)
+                    if scenario.endswith("_hot"):
+                        # первый проход наполняет кэш и в результат не входит
+                        await run_scenario(client, requests[:HOT_KEYS * 2], args.concurrency)
+                    result = await run_scenario(client, requests, args.concurrency)
+                    result.update({"size": size, "scenario": scenario, "seeded": seeded, "seed_seconds": seed_seconds})
+                    report["results"].append(result)
+                    print(f"{size:>10} {scenario:<18}{result['throughput_rps']:>10.1f}{result['p50_ms']:>10.2f}"
+                          f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}  {result['status_codes']}")
+        finally:
+            if args.cleanup:
+                await seeder.cleanup()
+
+    output = args.output or RESULTS_DIR / f"{report['started_at'][:19].replace(':', '-')}-{report['commit']}.json"
+    output = pathlib.Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"saved to {output}")
+
+
+def compare(old_path, new_path):
+    """Функция сравнения двух сохраненных прогонов по p50/p99 и пропускной способности"""
+    old, new = (json.loads(pathlib.Path(path).read_text()) for path in (old_path, new_path))
+    baseline = {(result["size"], result["scenario"]): result for result in old["results"]}
+    print(f"{old['commit']} -> {new['commit']}")
+    print(f"{'rows':>10} {'scenario':<18}{'rps':>18}{'p50 ms':>18}{'p99 ms':>18}")
+    for result in new["results"]:
+        before = baseline.get((result["size"], result["scenario"]))
+        if before is None:
+            continue
+        cells = "".join(
+            f"{before[field]:>8.1f}->{result[field]:<8.1f}" for field in ("throughput_rps", "p50_ms", "p99_ms")
+        )
+        print(f"{result['size']:>10} {result['scenario']:<18}{cells}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["asgi", "http"], default="asgi")
+    parser.add_argument("--base-url", default="http://localhost:9999")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--admin-token", help="JWT superuser: заполнение таблицы через COPY (http)")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--output", help="путь к JSON с результатом (по умолчанию benchmarks/results/<время>-<коммит>.json)")
+    parser.add_argument("--cleanup", action="store_true", help="удалить синтетические ссылки после прогона (asgi)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="сравнить два сохраненных прогона")
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+    else:
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Бенчмарк очистки истекших ссылок: построчный DELETE против удаления секций
+
+В отдельной схеме (--schema, по умолчанию bench_sweep) создаются две копии links на --rows строк
+со сроками, равномерно распределенными по --weeks неделям:
+    plain -- несекционированная таблица со старыми индексами, очищается прежним
+             пакетным DELETE ... WHERE id IN (SELECT ... ORDER BY expires_at LIMIT ...);
+    links -- секционированная по неделям с таблицей маршрутизации link_aliases, очищается
+             как tasks/expiry.py: освобождение коротких ссылок пачками и DROP TABLE секции.
+Истекшими считаются первые --expired недель. Для каждого способа выводятся время, строк в секунду,
+объем WAL, размер таблиц после очистки, число мертвых строк и время VACUUM, который
+после построчного DELETE должен пройти по всей таблице.
+Запуск из папки src (нужна база данных из .env, схема удаляется после замера):
+    python -m benchmarks.partition_sweep --rows 50000000 --weeks 52 --expired 1
+"""
+import argparse
+import asyncio
+import datetime
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from config import SWEEP_BATCH_SIZE
+from database import DATABASE_URL
+from links.partitions import Partition, partition_name, create_partition_sql, release_batch, drop_partition
+
+SEED_CHUNK = 1000000
+BASE = datetime.datetime(2000, 1, 3)  # понедельник: границы недель совпадают с partition_start
+COLUMNS = (
+    "id integer NOT NULL, user_id integer, long_link varchar NOT NULL, long_link_hash varchar(64) NOT NULL, "
+    "custom_alias varchar NOT NULL, expires_at timestamptz NOT NULL, last_usage timestamptz, "
+    "creation_date timestamptz, number_of_usages integer NOT NULL, is_authorized boolean NOT NULL"
+)
+SEED = (
+    "SELECT g, 1, 'https://example.com/sweep/' || g, md5(g::text) || md5(g::text), 'w' || lpad(g::text, 9, '0'), "
+    "CAST(:base AS timestamptz) + (g::float8 / :rows) * :weeks * interval '1 week', now(), now(), 0, true "
+    "FROM generate_series(:start, :stop) AS g"
+)
+OLD_SWEEP = text(
+    "DELETE FROM plain WHERE id IN ("
+    "SELECT id FROM plain WHERE expires_at < :cutoff ORDER BY expires_at LIMIT :limit FOR UPDATE SKIP LOCKED"
+    ") RETURNING custom_alias, long_link"
+)
+
+
+async def setup(engine, rows, weeks):
+    """Функция создания и наполнения обеих копий links"""
+    async with engine.begin() as conn:
+        await conn.execute(text(f"CREATE TABLE plain ({COLUMNS}, PRIMARY KEY (id))"))
+        await conn.execute(text(f"CREATE TABLE links ({COLUMNS}, PRIMARY KEY (id, expires_at)) PARTITION BY RANGE (expires_at)"))
+        await conn.execute(text(
+            "CREATE TABLE link_aliases (custom_alias varchar PRIMARY KEY, link_id integer NOT NULL, "
+            "expires_at timestamptz NOT NULL)"
+        ))
+        # release_batch удаляет статистику освобожденных ссылок: пустые копии таблиц статистики
+        for table in ("link_click_rollups", "link_click_sources"):
+            await conn.execute(text(f"CREATE TABLE {table} (LIKE public.{table} INCLUDING ALL)"))
+        for week in range(weeks + 1):
+            lower = BASE + datetime.timedelta(weeks=week)
+            await conn.execute(text(create_partition_sql(partition_name(lower), lower, lower + datetime.timedelta(weeks=1))))
+    params = {"base": BASE, "rows": rows, "weeks": weeks}
+    for start in range(1, rows + 1, SEED_CHUNK):
+        bounds = dict(params, start=start, stop=min(start + SEED_CHUNK, rows + 1) - 1)
+        async with engine.begin() as conn:
+            await conn.execute(text(f"INSERT INTO plain {SEED}"), bounds)
+            await conn.execute(text(f"INSERT INTO links {SEED}"), bounds)
+            await conn.execute(text(
+                "INSERT INTO link_aliases SELECT 'w' || lpad(g::text, 9, '0'), g, "
+                "CAST(:base AS timestamptz) + (g::float8 / :rows) * :weeks * interval '1 week' "
+                "FROM generate_series(:start, :stop) AS g"
+            ), bounds)
+    # индексы строятся после наполнения, как у таблицы, выросшей за годы работы
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE UNIQUE INDEX ON plain (custom_alias)"))
+        await conn.execute(text("CREATE INDEX ON plain (expires_at)"))
+        await conn.execute(text("CREATE INDEX ON plain (long_link_hash, id)"))
+        await conn.execute(text("CREATE INDEX ON links (custom_alias)"))
+        await conn.execute(text("CREATE INDEX ON links (long_link_hash, id)"))
+        await conn.execute(text("CREATE INDEX ON link_aliases (expires_at)"))
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for table in ("plain", "links", "link_aliases"):
+            await conn.execute(text(f"VACUUM ANALYZE {table}"))
+
+
+async def wal_position(engine):
+    async with engine.connect() as conn:
+        return await conn.scalar(text("SELECT pg_current_wal_lsn()"))
+
+
+async def table_state(engine, tables):
+    """Функция получения суммарного размера и числа мертвых строк таблиц"""
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT pg_stat_force_next_flush()"))
+        size = dead = 0
+        for table in tables:
+            size += await conn.scalar(text("SELECT pg_total_relation_size(CAST(:table AS regclass))"), {"table": table})
+            dead += await conn.scalar(
+                text("SELECT coalesce(n_dead_tup, 0) FROM pg_stat_user_tables WHERE relid = CAST(:table AS regclass)"),
+                {"table": table},
+            ) or 0
+    return size, dead
+
+
+async def measure(engine, sweep, tables):
+    """Функция замера одного способа очистки: sweep -- корутина, возвращающая число удаленных строк"""
+    wal_before = await wal_position(engine)
+    started = time.perf_counter()
+    deleted = await sweep()
+    seconds = time.perf_counter() - started
+    async with engine.connect() as conn:
+        wal_bytes = await conn.scalar(
+            text("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), CAST(:before AS pg_lsn))"), {"before": wal_before}
+        )
+    size, dead = await table_state(engine, tables)
+    started = time.perf_counter()
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for table in tables:
+            await conn.execute(text(f"VACUUM {table}"))
+    return {
+        "deleted": deleted,
+        "seconds": seconds,
+        "rows_per_sec": deleted / seconds if seconds else 0.0,
+        "wal_mb": float(wal_bytes) / 2 ** 20,
+        "size_mb": size / 2 ** 20,
+        "dead_rows": dead,
+        "vacuum_seconds": time.perf_counter() - started,
+    }
+
+
+async def run(rows, weeks, expired, batch_size, schema):
+    admin = create_async_engine(DATABASE_URL)
+    async with admin.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {schema}"))
+    engine = create_async_engine(DATABASE_URL, connect_args={"server_settings": {"search_path": schema}})
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    cutoff = BASE + datetime.timedelta(weeks=expired)
+    try:
+        print(f"seeding {rows} rows over {weeks} weeks...")
+        await setup(engine, rows, weeks)
+
+        async def delete_rows():
+            deleted = 0
+            while True:
+                async with session_maker() as session:
+                    batch = (await session.execute(OLD_SWEEP, {"cutoff": cutoff, "limit": batch_size})).all()
+                    await session.commit()
+                deleted += len(batch)
+                if len(batch) < batch_size:
+                    return deleted
+
+        async def drop_partitions():
+            deleted = 0
+            for week in range(expired):
+                lower = BASE + datetime.timedelta(weeks=week)
+                partition = Partition(partition_name(lower), lower, lower + datetime.timedelta(weeks=1))
+                last_id = 0
+                while True:
+                    batch = await release_batch(session_maker, partition, last_id, batch_size)
+                    if not batch:
+                        break
+                    deleted += len(batch)
+                    last_id = batch[-1].id
+                await drop_partition(session_maker, partition)
+            return deleted
+
+        results = {
+            "DELETE": await measure(engine, delete_rows, ["plain"]),
+            "DROP PARTITION": await measure(engine, drop_partitions, ["links", "link_aliases"]),
+        }
+        print(f"{'method':<16}{'rows':>12}{'seconds':>10}{'rows/s':>12}{'WAL MB':>10}{'size MB':>10}{'dead':>12}{'vacuum s':>10}")
+        for method, result in results.items():
+            print(
+                f"{method:<16}{result['deleted']:>12}{result['seconds']:>10.2f}{result['rows_per_sec']:>12.0f}"
+                f"{result['wal_mb']:>10.1f}{result['size_mb']:>10.1f}{result['dead_rows']:>12}{result['vacuum_seconds']:>10.2f}"
+            )
+    finally:
+        await engine.dispose()
+        async with admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        await admin.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000000)
+    parser.add_argument("--weeks", type=int, default=52)
+    parser.add_argument("--expired", type=int, default=1, help="сколько первых недель считать истекшими")
+    parser.add_argument("--batch-size", type=int, default=SWEEP_BATCH_SIZE)
+    parser.add_argument("--schema", default="bench_sweep")
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.weeks, args.expired, args.batch_size, args.schema))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Бенчмарк переходов: RedirectFastPath против ручки activate_link
+
+Запросы GET /links/{short_code} подаются приложению main.app напрямую через ASGI, без сети
+и HTTP-сервера, поэтому замер показывает, сколько переходов в секунду выдерживает один воркер
+только за счет работы самого приложения. Кэш переходов процесса заранее заполняется --links
+ссылками, так что переходы не обращаются ни к Redis, ни к базе данных; --expired доля запросов
+приходится на истекшие ссылки (ответ 410). Каждый способ прогоняется --rounds раз, берется лучший.
+Оба способа проходят через одни и те же middleware (в том числе MetricsMiddleware),
+fast path лишь включается и выключается.
+Запуск из папки src:
+    python -m benchmarks.redirect_fast_path --requests 50000 --concurrency 1 16
+"""
+import argparse
+import asyncio
+import datetime
+import random
+import statistics
+import time
+
+from main import app
+from links.cache import redirect_cache, make_entry
+from links.redirects import RedirectFastPath
+
+HEADERS = [(b"host", b"localhost"), (b"user-agent", b"Mozilla/5.0 Firefox/120.0"), (b"referer", b"https://example.com/")]
+
+
+def find_fast_path(asgi_app):
+    """Функция поиска экземпляра RedirectFastPath в собранном стеке middleware приложения"""
+    if asgi_app.middleware_stack is None:
+        asgi_app.middleware_stack = asgi_app.build_middleware_stack()
+    layer = asgi_app.middleware_stack
+    while layer is not None:
+        if isinstance(layer, RedirectFastPath):
+            return layer
+        layer = getattr(layer, "app", None)
+    raise RuntimeError("RedirectFastPath is not installed, check EDGE_REDIRECT_ENABLED")
+
+
+def prime_cache(links, expired_share, rng):
+    """Функция заполнения кэша переходов процесса: возвращает список коротких ссылок для запросов"""
+    aliases = []
+    past = datetime.datetime(2000, 1, 1)
+    for index in range(links):
+        alias = f"bench{index:05d}"
+        expires_at = past if rng.random() < expired_share else None
+        redirect_cache._set_local(alias, make_entry(f"https://example.com/page/{index}?utm_source=bench", expires_at))
+        aliases.append(alias)
+    return aliases
+
+
+async def call(path):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"", "headers": HEADERS,
+        "client": ("127.0.0.1", 50000), "server": ("localhost", 80),
+    }
+    status_code = None
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status_code
+        if message["type"] == "http.response.start":
+            status_code = message["status"]
+
+    await app(scope, receive, send)
+    return status_code
+
+
+async def measure(paths, concurrency):
+    """Функция прогона запросов по paths в concurrency параллельных потоков
+
+    returns: dict (rps, p50_us, p99_us, statuses)
+    """
+    latencies = []
+    statuses = {}
+    queue = iter(paths)
+
+    async def worker():
+        for path in queue:
+            started = time.perf_counter()
+            status_code = await call(path)
+            latencies.append(time.perf_counter() - started)
+            statuses[status_code] = statuses.get(status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "rps": len(paths) / elapsed,
+        "p50_us": statistics.median(latencies) * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99) - 1] * 1e6,
+        "statuses": statuses,
+    }
+
+
+async def run(requests, links, expired_share, concurrency_levels, rounds):
+    rng = random.Random(0)
+    aliases = prime_cache(links, expired_share, rng)
+    paths = [f"/links/{rng.choice(aliases)}" for _ in range(requests)]
+    fast_path = find_fast_path(app)
+    await measure(paths[:1000], 1)  # прогрев: импорт ленивых модулей, кэши pydantic
+
+    print(f"{'mode':<8}{'conc':>6}{'req/s':>12}{'p50 us':>10}{'p99 us':>10}  statuses")
+    results = {}
+    for concurrency in concurrency_levels:
+        for mode, enabled in (("route", False), ("fast", True)):
+            fast_path.enabled = enabled
+            best = max([await measure(paths, concurrency) for _ in range(rounds)], key=lambda result: result["rps"])
+            results[mode, concurrency] = best
+            print(f"{mode:<8}{concurrency:>6}{best['rps']:>12.0f}{best['p50_us']:>10.1f}{best['p99_us']:>10.1f}  {best['statuses']}")
+        gain = results["fast", concurrency]["rps"] / results["route", concurrency]["rps"]
+        print(f"{'gain':<8}{concurrency:>6}{gain:>11.2f}x")
+    fast_path.enabled = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--links", type=int, default=10000)
+    parser.add_argument("--expired", type=float, default=0.05, help="доля истекших ссылок")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.links, args.expired, args.concurrency, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
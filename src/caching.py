@@ -0,0 +1,351 @@
+import asyncio
+import json
+import logging
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+from fastapi_cache.backends.redis import RedisBackend
+from redis.exceptions import RedisError
+
+from config import (
+    RESPONSE_CACHE_L1_SIZE, RESPONSE_CACHE_L1_BYTES, RESPONSE_CACHE_STALE_TTL, RESPONSE_CACHE_COALESCE_TIMEOUT,
+)
+from metrics import count_cache_event
+
+logger = logging.getLogger(__name__)
+
+# канал, по которому воркеры сообщают друг другу о сброшенных тегах кэша ответов
+RESPONSE_INVALIDATION_CHANNEL = "cache:invalidate"
+
+
+class TTLCache:
+    """Ограниченный по размеру LRU-кэш внутри процесса с временем жизни записей
+
+    Размер ограничен числом записей maxsize и, если передан sizeof, суммарным размером maxbytes.
+    Не потокобезопасен: рассчитан на использование из одного event loop.
+    """
+
+    def __init__(self, maxsize, ttl, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _remove(self, key):
+        deadline, value, size = self._data.pop(key)
+        self.bytes -= size
+        return value
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        deadline, value, _ = item
+        if deadline <= time.monotonic():
+            self._remove(key)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl=None):
+        size = self.sizeof(value) if self.sizeof else 0
+        if key in self._data:
+            self._remove(key)
+        if self.maxbytes and size > self.maxbytes:
+            return
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value, size)
+        self.bytes += size
+        while len(self._data) > self.maxsize or (self.maxbytes and self.bytes > self.maxbytes):
+            self._remove(next(iter(self._data)))
+            self.evictions += 1
+
+    def discard_expired(self, key):
+        """Функция удаления записи, только если ее время жизни уже истекло"""
+        item = self._data.get(key)
+        if item is not None and item[0] <= time.monotonic():
+            self._remove(key)
+
+    def pop(self, key):
+        return self._remove(key) if key in self._data else None
+
+    def clear(self):
+        self._data.clear()
+        self.bytes = 0
+
+    def keys(self):
+        return self._data.keys()
+
+
+async def listen(redis, channel, on_message, on_reconnect):
+    """Функция подписки на канал Redis pub/sub с переподключением
+
+    params:
+        redis: Redis
+        channel: str
+        on_message: функция от разобранного JSON сообщения
+        on_reconnect: функция без аргументов, вызывается после каждой (пере)подписки:
+            пока подписки не было, сообщения терялись
+    """
+    while True:
+        pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(channel)
+            on_reconnect()
+            async for message in pubsub.listen():
+                on_message(json.loads(message["data"]))
+        except RedisError:
+            logger.warning("redis pub/sub is unavailable, reconnecting", exc_info=True)
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.reset()
+
+
+class TaggedRedisBackend(RedisBackend):
+    """Бэкенд fastapi-cache, который умеет удалять все варианты ответа по тегу
+
+    Ключ имеет вид "{tag}:{variant}": тег -- то, от чего зависит ответ (например, короткая ссылка),
+    вариант -- остальные параметры запроса. При записи ключ добавляется в множество "{tag}:keys",
+    поэтому invalidate удаляет все варианты тега без перебора ключей Redis.
+    """
+
+    @staticmethod
+    def tag_of(key):
+        return key.rsplit(":", 1)[0]
+
+    async def set(self, key, value, expire=None):
+        index = f"{self.tag_of(key)}:keys"
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(key, value, ex=expire)
+            pipe.sadd(index, key)
+            if expire:
+                # множество живет не меньше самого долгого из своих ключей
+                pipe.expire(index, expire, gt=True)
+                pipe.expire(index, expire, nx=True)
+            await pipe.execute()
+
+    async def invalidate(self, *tags):
+        """Функция удаления всех закэшированных ответов с указанными тегами
+
+        returns:
+            deleted: int (сколько ключей удалено)
+        """
+        if not tags:
+            return 0
+        indexes = [f"{tag}:keys" for tag in tags]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for index in indexes:
+                pipe.smembers(index)
+            members = await pipe.execute()
+        keys = [key for keys in members for key in keys]
+        await self.redis.delete(*keys, *indexes)
+        return len(keys)
+
+
+class TieredBackend(TaggedRedisBackend):
+    """Двухуровневый бэкенд fastapi-cache: LRU внутри процесса (L1) перед общим Redis (L2)
+
+    - L1 ограничен числом записей и суммарным размером ответов, попадание в него не ходит в Redis;
+    - одновременные промахи по одному ключу схлопываются: ответ считает первый запрос (лидер),
+      остальные ждут его результат до coalesce_timeout секунд, поэтому всплеск запросов
+      дает один запрос к базе данных на воркер;
+    - после expire ответ еще stale_ttl секунд отдается устаревшим, пока один запрос его пересчитывает;
+    - invalidate рассылается через pub/sub, и каждый воркер сбрасывает теги в своем L1.
+
+    В Redis значение хранится как "{момент устаревания, мс}\\n{ответ}".
+    """
+
+    def __init__(self, redis, maxsize=RESPONSE_CACHE_L1_SIZE, maxbytes=RESPONSE_CACHE_L1_BYTES,
+                 stale_ttl=RESPONSE_CACHE_STALE_TTL, coalesce_timeout=RESPONSE_CACHE_COALESCE_TIMEOUT, name="responses"):
+        super().__init__(redis)
+        self.name = name
+        # запись L1: (момент устаревания по time.monotonic, ответ)
+        self.local = TTLCache(maxsize, 0, maxbytes=maxbytes, sizeof=lambda entry: len(entry[1]))
+        self.stale_ttl = stale_ttl
+        self.coalesce_timeout = coalesce_timeout
+        self.counters = Counter()
+        # растет при каждой инвалидации: ответ, посчитанный до нее, не попадает в кэш
+        self.generation = 0
+        self._tags = defaultdict(set)
+        self._inflight = {}
+        self._pending = {}
+        self._revalidating = {}
+
+    def _count(self, name):
+        self.counters[name] += 1
+        count_cache_event(self.name, name)
+
+    def _set_local(self, key, fresh_for, value, ttl):
+        self.local.set(key, (time.monotonic() + fresh_for, value), ttl)
+        self._tags[self.tag_of(key)].add(key)
+        if len(self._tags) > 2 * self.local.maxsize:
+            # ключи, вытесненные из L1, остаются в индексе тегов -- пересобираем его
+            self._tags = defaultdict(set)
+            for cached_key in self.local.keys():
+                self._tags[self.tag_of(cached_key)].add(cached_key)
+
+    async def _get_remote(self, key):
+        """Функция чтения ответа из Redis в L1
+
+        returns:
+            entry: (момент устаревания, ответ) или None
+        """
+        try:
+            ttl, raw = await super().get_with_ttl(key)
+        except RedisError:
+            self._count("l2_errors")
+            logger.warning("redis is unavailable, response cache works only in process", exc_info=True)
+            return None
+        if raw is None:
+            self._count("l2_misses")
+            return None
+        try:
+            stale_at, value = raw.split(b"\n", 1)
+            fresh_for = int(stale_at) / 1000 - time.time()
+        except ValueError:
+            # значение записано не этим бэкендом -- считаем промахом, set его перезапишет
+            self._count("l2_misses")
+            return None
+        self._count("l2_hits")
+        self._set_local(key, fresh_for, value, ttl if ttl > 0 else self.stale_ttl)
+        return self.local.get(key)
+
+    def _miss(self, key):
+        # вызывающий код посчитает ответ и вызовет set;
+        # если он упадет, запись останется -- поэтому словари ограничены по размеру
+        for marks in (self._pending, self._revalidating):
+            if len(marks) > self.local.maxsize:
+                marks.clear()
+        self._pending[key] = self.generation
+        return 0, None
+
+    def _serve(self, key, entry, now):
+        stale_at, value = entry
+        if now < stale_at:
+            return int(stale_at - now), value
+        self._count("stale")
+        if self._revalidating.get(key, 0) > now:
+            return 0, value
+        # ответ пересчитывает один запрос, остальные пока получают устаревший
+        self._revalidating[key] = now + self.coalesce_timeout
+        self._count("revalidations")
+        return self._miss(key)
+
+    def _release(self, key, future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if not future.done():
+            future.set_result(None)
+
+    async def get_with_ttl(self, key):
+        entry = self.local.get(key)
+        if entry is not None:
+            self._count("l1_hits")
+            now = time.monotonic()
+            if entry[0] <= now and self._revalidating.get(key, 0) <= now:
+                # другой воркер мог уже обновить ответ в Redis
+                entry = await self._get_remote(key) or entry
+                now = time.monotonic()
+            return self._serve(key, entry, now)
+        self._count("l1_misses")
+
+        leader = self._inflight.get(key)
+        if leader is not None:
+            self._count("coalesced")
+            try:
+                entry = await asyncio.wait_for(asyncio.shield(leader), self.coalesce_timeout)
+            except asyncio.TimeoutError:
+                entry = None
+            return self._serve(key, entry, time.monotonic()) if entry is not None else self._miss(key)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        # если лидер упадет, не дойдя до set, ожидающие освободятся вместе с его задачей
+        task = asyncio.current_task()
+        if task is not None:
+            task.add_done_callback(lambda _: self._release(key, future))
+        entry = await self._get_remote(key)
+        if entry is None:
+            return self._miss(key)
+        del self._inflight[key]
+        future.set_result(entry)
+        return self._serve(key, entry, time.monotonic())
+
+    async def get(self, key):
+        entry = self.local.get(key) or await self._get_remote(key)
+        return entry and entry[1]
+
+    async def set(self, key, value, expire=None):
+        expire = expire or 60
+        self._revalidating.pop(key, None)
+        fresh = self._pending.pop(key, self.generation) == self.generation
+        future = self._inflight.pop(key, None)
+        if fresh:
+            self._set_local(key, expire, value, expire + self.stale_ttl)
+        if future is not None and not future.done():
+            future.set_result((time.monotonic() + expire, value))
+        if not fresh:
+            # пока ответ считался, его теги сбросили -- он мог устареть
+            return
+        stale_at = int((time.time() + expire) * 1000)
+        try:
+            await super().set(key, b"%d\n" % stale_at + value, expire + self.stale_ttl)
+        except RedisError:
+            self._count("l2_errors")
+            logger.warning("redis is unavailable, response cached only in process", exc_info=True)
+
+    async def clear(self, namespace=None, key=None):
+        if key:
+            self.local.pop(key)
+        elif namespace:
+            self.local.clear()
+        return await super().clear(namespace, key)
+
+    def _drop_local(self, tags):
+        self.generation += 1
+        for tag in tags:
+            for key in self._tags.pop(tag, ()):
+                self.local.pop(key)
+
+    async def invalidate(self, *tags):
+        """Функция удаления ответов с указанными тегами из Redis и из L1 всех воркеров"""
+        if not tags:
+            return 0
+        self._drop_local(tags)
+        deleted = await super().invalidate(*tags)
+        await self.redis.publish(RESPONSE_INVALIDATION_CHANNEL, json.dumps(tags))
+        return deleted
+
+    def _reset_local(self):
+        self.generation += 1
+        self.local.clear()
+        self._tags.clear()
+
+    async def run_invalidation_listener(self):
+        """Функция приема инвалидаций от других воркеров, запускается в lifespan"""
+        await listen(self.redis, RESPONSE_INVALIDATION_CHANNEL, self._drop_local, self._reset_local)
+
+    def stats(self):
+        counters = self.counters
+        return {
+            "l1": {
+                "size": len(self.local),
+                "bytes": self.local.bytes,
+                "hits": counters["l1_hits"],
+                "misses": counters["l1_misses"],
+                "evictions": self.local.evictions,
+            },
+            "l2": {
+                "hits": counters["l2_hits"],
+                "misses": counters["l2_misses"],
+                "errors": counters["l2_errors"],
+            },
+            "coalesced": counters["coalesced"],
+            "stale": counters["stale"],
+            "revalidations": counters["revalidations"],
+        }
@@ -9,3 +9,98 @@ DB_PASS = os.getenv("DB_PASS")
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
+
+ALIAS_STRATEGY = os.getenv("ALIAS_STRATEGY", "keyed_hash")
+ALIAS_SECRET = os.getenv("ALIAS_SECRET")
+ALIAS_WORKER_ID = os.getenv("ALIAS_WORKER_ID")
+ALIAS_MAX_ATTEMPTS = int(os.getenv("ALIAS_MAX_ATTEMPTS", 5))
+
+CPU_EXECUTOR = os.getenv("CPU_EXECUTOR", "thread")
+CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", 2))
+CPU_EXECUTOR_QUEUE = int(os.getenv("CPU_EXECUTOR_QUEUE", 32))
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost")
+
+REDIRECT_CACHE_SIZE = int(os.getenv("REDIRECT_CACHE_SIZE", 100000))
+REDIRECT_CACHE_TTL = int(os.getenv("REDIRECT_CACHE_TTL", 3600))
+REDIRECT_TOMBSTONE_TTL = int(os.getenv("REDIRECT_TOMBSTONE_TTL", 10))
+REDIRECT_DEFAULT_STATUS = int(os.getenv("REDIRECT_DEFAULT_STATUS", 301))
+# pydantic не проверяет значения по умолчанию: неверный код попал бы в каждую созданную ссылку
+if REDIRECT_DEFAULT_STATUS not in (301, 302, 307, 308):
+    raise ValueError(f"REDIRECT_DEFAULT_STATUS must be 301, 302, 307 or 308, got {REDIRECT_DEFAULT_STATUS}")
+REDIRECT_MAX_AGE = int(os.getenv("REDIRECT_MAX_AGE", 3600))
+STATS_CACHE_TTL = int(os.getenv("STATS_CACHE_TTL", 180))
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", 3600))
+RESPONSE_CACHE_L1_SIZE = int(os.getenv("RESPONSE_CACHE_L1_SIZE", 10000))
+RESPONSE_CACHE_L1_BYTES = int(os.getenv("RESPONSE_CACHE_L1_BYTES", 64 * 1024 * 1024))
+RESPONSE_CACHE_STALE_TTL = int(os.getenv("RESPONSE_CACHE_STALE_TTL", 60))
+RESPONSE_CACHE_COALESCE_TIMEOUT = float(os.getenv("RESPONSE_CACHE_COALESCE_TIMEOUT", 2.0))
+CLICK_FLUSH_INTERVAL = float(os.getenv("CLICK_FLUSH_INTERVAL", 1.0))
+CLICK_BACKEND = os.getenv("CLICK_BACKEND", "redis")
+CLICK_FLUSH_BATCH_SIZE = int(os.getenv("CLICK_FLUSH_BATCH_SIZE", 1000))
+CLICK_FLUSH_IN_CELERY = os.getenv("CLICK_FLUSH_IN_CELERY", "false").lower() == "true"
+CLICK_CELERY_FLUSH_INTERVAL = float(os.getenv("CLICK_CELERY_FLUSH_INTERVAL", 10))
+
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", 1000))
+BULK_MAX_ITEM_BYTES = int(os.getenv("BULK_MAX_ITEM_BYTES", 65536))
+COPY_MERGE_BATCH_SIZE = int(os.getenv("COPY_MERGE_BATCH_SIZE", 50000))
+COPY_QUEUE_SIZE = int(os.getenv("COPY_QUEUE_SIZE", 64))
+
+ALIAS_POOL_ENABLED = os.getenv("ALIAS_POOL_ENABLED", "true").lower() == "true"
+ALIAS_POOL_STRATEGY = os.getenv("ALIAS_POOL_STRATEGY", "random")
+ALIAS_POOL_LOW = int(os.getenv("ALIAS_POOL_LOW", 10000))
+ALIAS_POOL_HIGH = int(os.getenv("ALIAS_POOL_HIGH", 100000))
+ALIAS_POOL_REFILL_BATCH = int(os.getenv("ALIAS_POOL_REFILL_BATCH", 5000))
+ALIAS_POOL_REFILL_INTERVAL = int(os.getenv("ALIAS_POOL_REFILL_INTERVAL", 10))
+
+SWEEP_INTERVAL = int(os.getenv("SWEEP_INTERVAL", 120))
+SWEEP_BATCH_SIZE = int(os.getenv("SWEEP_BATCH_SIZE", 5000))
+SWEEP_BATCH_PAUSE = float(os.getenv("SWEEP_BATCH_PAUSE", 0.05))
+SWEEP_MAX_BATCHES = int(os.getenv("SWEEP_MAX_BATCHES", 0))
+
+LINKS_PARTITION_INTERVAL = os.getenv("LINKS_PARTITION_INTERVAL", "week")
+LINKS_PARTITION_PREMAKE = int(os.getenv("LINKS_PARTITION_PREMAKE", 8))
+LINKS_PARTITION_LOCK_TIMEOUT = float(os.getenv("LINKS_PARTITION_LOCK_TIMEOUT", 5))
+
+CLICK_MINUTE_RETENTION_DAYS = int(os.getenv("CLICK_MINUTE_RETENTION_DAYS", 7))
+CLICK_HOUR_RETENTION_DAYS = int(os.getenv("CLICK_HOUR_RETENTION_DAYS", 90))
+CLICK_SOURCES_RETENTION_DAYS = int(os.getenv("CLICK_SOURCES_RETENTION_DAYS", 365))
+STATS_MAX_BUCKETS = int(os.getenv("STATS_MAX_BUCKETS", 5000))
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", DB_POOL_SIZE))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+
+DB_REPLICA_URLS = [url.strip() for url in os.getenv("DB_REPLICA_URLS", "").split(",") if url.strip()]
+DB_REPLICA_STRATEGY = os.getenv("DB_REPLICA_STRATEGY", "round_robin")
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", 5))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", 5))
+
+ALIAS_FILTER_ENABLED = os.getenv("ALIAS_FILTER_ENABLED", "true").lower() == "true"
+ALIAS_FILTER_CAPACITY = int(os.getenv("ALIAS_FILTER_CAPACITY", 10_000_000))
+ALIAS_FILTER_ERROR_RATE = float(os.getenv("ALIAS_FILTER_ERROR_RATE", 0.01))
+ALIAS_FILTER_CHECK_INTERVAL = float(os.getenv("ALIAS_FILTER_CHECK_INTERVAL", 60))
+ALIAS_FILTER_REBUILD_INTERVAL = int(os.getenv("ALIAS_FILTER_REBUILD_INTERVAL", 86400))
+NEGATIVE_CACHE_TTL = int(os.getenv("NEGATIVE_CACHE_TTL", 60))
+
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", 20))
+SEARCH_MAX_PAGE_SIZE = int(os.getenv("SEARCH_MAX_PAGE_SIZE", 100))
+LISTING_PAGE_SIZE = int(os.getenv("LISTING_PAGE_SIZE", 50))
+LISTING_MAX_PAGE_SIZE = int(os.getenv("LISTING_MAX_PAGE_SIZE", 500))
+
+CACHE_WARMUP_SIZE = int(os.getenv("CACHE_WARMUP_SIZE", 10000))
+CACHE_WARMUP_WINDOW_HOURS = int(os.getenv("CACHE_WARMUP_WINDOW_HOURS", 24))
+CACHE_WARMUP_FALLBACK_DAYS = int(os.getenv("CACHE_WARMUP_FALLBACK_DAYS", 30))
+CACHE_WARMUP_CONCURRENCY = int(os.getenv("CACHE_WARMUP_CONCURRENCY", 4))
+CACHE_WARMUP_BUDGET = float(os.getenv("CACHE_WARMUP_BUDGET", 5))
+CACHE_WARMUP_REFRESH_INTERVAL = int(os.getenv("CACHE_WARMUP_REFRESH_INTERVAL", 300))
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+EDGE_REDIRECT_ENABLED = os.getenv("EDGE_REDIRECT_ENABLED", "true").lower() == "true"
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", 3))
@@ -1,14 +1,252 @@
+import asyncio
+import itertools
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
 from typing import AsyncGenerator
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 # from src import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER
-from config import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER
+from config import (
+    DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_POOL_WARMUP,
+    DB_STATEMENT_CACHE_SIZE, DB_PGBOUNCER,
+    DB_REPLICA_URLS, DB_REPLICA_STRATEGY, DB_REPLICA_MAX_LAG, DB_REPLICA_CHECK_INTERVAL,
+    METRICS_ENABLED,
+)
+from metrics import instrument_engine
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-engine = create_async_engine(DATABASE_URL)
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, который дополнительно считает ожидание свободного соединения"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_count = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.wait_count += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+
+def engine_options(pgbouncer=DB_PGBOUNCER):
+    """Функция сборки параметров create_async_engine из настроек config.py
+
+    В режиме PgBouncer (transaction pooling) подготовленные запросы не переживают
+    смену серверного соединения, поэтому кэши подготовленных запросов asyncpg
+    и SQLAlchemy отключаются, а имена запросов делаются уникальными.
+
+    returns: dict
+    """
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "connect_args": {"statement_cache_size": 0 if pgbouncer else DB_STATEMENT_CACHE_SIZE},
+    }
+    if pgbouncer:
+        options["connect_args"]["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid.uuid4()}__"
+    return options
+
+
+def make_engine(url):
+    engine = create_async_engine(url + ("?prepared_statement_cache_size=0" if DB_PGBOUNCER else ""), **engine_options())
+    if METRICS_ENABLED:
+        instrument_engine(engine)
+    return engine
+
+
+engine = make_engine(DATABASE_URL)
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
+
+
+# запрос статуса реплики: отставание в секундах, 0 -- если все полученные WAL уже применены
+# или если это не реплика (например, в DB_REPLICA_URLS для проверки указан сам primary)
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class Replica:
+    def __init__(self, url):
+        self.url = url
+        self.engine = make_engine(url)
+        self.session_maker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.healthy = True
+        self.lag = 0.0
+        self.latency = 0.0
+
+    @property
+    def name(self):
+        return self.engine.url.render_as_string(hide_password=True)
+
+
+class ReplicaRouter:
+    """Маршрутизатор читающих сессий между репликами
+
+    Реплика выбирается по кругу (round_robin) или с наименьшей задержкой ответа
+    (least_latency, сглаженное среднее по проверкам). Реплика, которая отстает
+    больше max_lag секунд или не отвечает, исключается до следующей удачной проверки,
+    а если здоровых реплик нет, читающая сессия открывается на primary.
+    """
+
+    def __init__(self, urls=DB_REPLICA_URLS, strategy=DB_REPLICA_STRATEGY, max_lag=DB_REPLICA_MAX_LAG):
+        if strategy not in ("round_robin", "least_latency"):
+            raise ValueError(f"unknown replica strategy {strategy!r}, expected round_robin or least_latency")
+        self.replicas = [Replica(url) for url in urls]
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self._counter = itertools.count()
+
+    @property
+    def enabled(self):
+        return bool(self.replicas)
+
+    def choose(self):
+        """Функция выбора реплики для чтения
+
+        returns:
+            replica: Replica или None (читать с primary)
+        """
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        if self.strategy == "least_latency":
+            return min(healthy, key=lambda replica: replica.latency)
+        return healthy[next(self._counter) % len(healthy)]
+
+    async def check(self, replica):
+        started = time.perf_counter()
+        try:
+            async with replica.engine.connect() as connection:
+                lag = float(await connection.scalar(REPLICA_LAG_QUERY))
+        except (OSError, DBAPIError, PoolTimeoutError):
+            if replica.healthy:
+                logger.warning("replica %s is unavailable, reading from primary", replica.name, exc_info=True)
+            replica.healthy = False
+            return
+        latency = time.perf_counter() - started
+        replica.latency = latency if not replica.latency else 0.8 * replica.latency + 0.2 * latency
+        replica.lag = lag
+        healthy = lag <= self.max_lag
+        if replica.healthy and not healthy:
+            logger.warning("replica %s lags %.1f s behind primary, skipping it", replica.name, lag)
+        replica.healthy = healthy
+
+    async def run_health_checks(self, interval=DB_REPLICA_CHECK_INTERVAL):
+        """Функция периодической проверки отставания и задержки реплик, запускается в lifespan"""
+        while True:
+            await asyncio.gather(*(self.check(replica) for replica in self.replicas))
+            await asyncio.sleep(interval)
+
+    @asynccontextmanager
+    async def session(self):
+        """Функция открытия читающей сессии: на реплике, а при ее отказе -- на primary"""
+        replica = self.choose()
+        if replica is not None:
+            session = replica.session_maker()
+            try:
+                # соединение берется сразу, чтобы отказ реплики заметить до запросов эндпоинта
+                await session.connection()
+            except (OSError, DBAPIError, PoolTimeoutError):
+                logger.warning("replica %s failed, reading from primary", replica.name, exc_info=True)
+                replica.healthy = False
+                await session.close()
+            else:
+                async with session:
+                    yield session
+                return
+        async with async_session_maker() as session:
+            yield session
+
+    def stats(self):
+        return [
+            {"replica": replica.name, "healthy": replica.healthy, "lag": replica.lag, "latency": replica.latency}
+            for replica in self.replicas
+        ]
+
+    async def dispose(self):
+        await asyncio.gather(*(replica.engine.dispose() for replica in self.replicas))
+
+
+replica_router = ReplicaRouter()
+
+
+async def get_read_session() -> AsyncGenerator[AsyncSession, None]:
+    """Зависимость для эндпоинтов только на чтение: сессия на реплике или на primary"""
+    async with replica_router.session() as session:
+        yield session
+
+
+async def warm_up_engine(connections=DB_POOL_WARMUP):
+    """Функция открытия соединений пула заранее, чтобы первые запросы не ждали подключения
+
+    params:
+        connections: int (не больше размера пула)
+
+    returns:
+        opened: int
+    """
+    connections = [engine.connect() for _ in range(min(connections, DB_POOL_SIZE))]
+    try:
+        await asyncio.gather(*(connection.start() for connection in connections))
+        await asyncio.gather(*(connection.execute(text("SELECT 1")) for connection in connections))
+    finally:
+        await asyncio.gather(*(connection.close() for connection in connections), return_exceptions=True)
+    return len(connections)
+
+
+def pool_stats():
+    """Функция получения состояния пула соединений текущего воркера
+
+    returns: dict
+        size: int
+        checked_in: int (свободные соединения)
+        checked_out: int (занятые соединения)
+        overflow: int (соединения сверх pool_size)
+        wait_count: int
+        wait_time_avg: float (сек)
+        wait_time_max: float (сек)
+        timeouts: int (сколько раз соединение не дождались за pool_timeout)
+    """
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "wait_count": pool.wait_count,
+        "wait_time_avg": pool.wait_time_total / pool.wait_count if pool.wait_count else 0.0,
+        "wait_time_max": pool.wait_time_max,
+        "timeouts": pool.timeouts,
+    }
@@ -0,0 +1,89 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from config import CPU_EXECUTOR, CPU_EXECUTOR_WORKERS, CPU_EXECUTOR_QUEUE
+from metrics import EXECUTOR_QUEUE_WAIT, EXECUTOR_RUN_TIME, EXECUTOR_REJECTED
+
+EXECUTOR_KINDS = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+
+
+class ExecutorSaturated(Exception):
+    """Очередь пула заполнена, задачу нужно отклонить"""
+
+
+def _timed(fn, args):
+    # выполняется в потоке или процессе пула; time.monotonic общий для процессов одной машины
+    started = time.monotonic()
+    result = fn(*args)
+    return started, time.monotonic(), result
+
+
+class BoundedExecutor:
+    """Пул потоков или процессов для работы, нагружающей CPU, с ограниченной очередью
+
+    Пока задача выполняется в пуле, event loop воркера продолжает обслуживать переходы.
+    Одновременно в пуле (выполняются и ждут) не больше workers + max_queue задач,
+    следующая сразу получает ExecutorSaturated -- роутер отвечает на нее 429.
+
+    Потоки подходят для функций, отпускающих GIL (hashlib, zlib), процессы -- для чистого Python;
+    в процесс функция и аргументы передаются через pickle. Пул создается при первой задаче,
+    то есть уже в воркере gunicorn, а не в мастер-процессе.
+    """
+
+    def __init__(self, kind=CPU_EXECUTOR, workers=CPU_EXECUTOR_WORKERS, max_queue=CPU_EXECUTOR_QUEUE, name="cpu"):
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"unknown executor kind {kind!r}, expected one of {sorted(EXECUTOR_KINDS)}")
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self.name = name
+        self.pending = 0
+        self.rejected = 0
+        self._pool = None
+
+    @property
+    def saturated(self):
+        return self.pending >= self.workers + self.max_queue
+
+    async def run(self, fn, *args):
+        """Функция выполнения fn(*args) в пуле
+
+        returns:
+            результат fn
+
+        raises:
+            ExecutorSaturated, если очередь заполнена
+        """
+        if self.saturated:
+            self.rejected += 1
+            EXECUTOR_REJECTED.labels(self.name).inc()
+            raise ExecutorSaturated(f"{self.name} executor queue is full")
+        if self._pool is None:
+            self._pool = EXECUTOR_KINDS[self.kind](max_workers=self.workers)
+        self.pending += 1
+        submitted = time.monotonic()
+        try:
+            started, finished, result = await asyncio.get_running_loop().run_in_executor(self._pool, _timed, fn, args)
+        finally:
+            self.pending -= 1
+        EXECUTOR_QUEUE_WAIT.labels(self.name).observe(max(started - submitted, 0))
+        EXECUTOR_RUN_TIME.labels(self.name).observe(finished - started)
+        return result
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "pending": self.pending,
+            "rejected": self.rejected,
+        }
+
+
+cpu_executor = BoundedExecutor()
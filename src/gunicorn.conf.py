@@ -0,0 +1,7 @@
+# gunicorn подхватывает этот файл сам, если он лежит в рабочем каталоге (docker/app.sh запускает его из src)
+from metrics import mark_process_dead
+
+
+def child_exit(server, worker):
+    # счетчики и гистограммы завершившегося воркера остаются в сумме, а его gauge-метрики (live*) убираются
+    mark_process_dead(worker.pid)
@@ -0,0 +1,136 @@
+import logging
+
+from redis.exceptions import RedisError
+from sqlalchemy import select
+
+from config import (
+    ALIAS_POOL_ENABLED, ALIAS_POOL_STRATEGY, ALIAS_POOL_LOW, ALIAS_POOL_HIGH, ALIAS_POOL_REFILL_BATCH,
+)
+from executor import ExecutorSaturated
+from redis_client import redis_client
+from .aliases import get_alias_generator, generate_aliases
+from .models import link_aliases
+
+logger = logging.getLogger(__name__)
+
+POOL_KEY = "aliases:pool"
+SERVED_KEY = "aliases:pool:served"
+EXHAUSTED_KEY = "aliases:pool:exhausted"
+REFILLED_KEY = "aliases:pool:refilled"
+REFILL_LOCK_KEY = "aliases:pool:refill_lock"
+# столько пачек подряд без единой свободной ссылки -- и пополнение прекращается до следующего запуска
+REFILL_MAX_EMPTY_ROUNDS = 3
+
+
+class AliasPool:
+    """Пул заранее сгенерированных коротких ссылок в списке Redis
+
+    Фоновая задача держит размер пула между low и high, а создание ссылки
+    забирает готовую ссылку одним LPOP. Если пул пуст или Redis недоступен,
+    pop возвращает None и вызывающий код генерирует ссылку сам.
+    """
+
+    def __init__(self, redis, enabled=ALIAS_POOL_ENABLED, low=ALIAS_POOL_LOW, high=ALIAS_POOL_HIGH,
+                 refill_batch=ALIAS_POOL_REFILL_BATCH, strategy=ALIAS_POOL_STRATEGY):
+        self.redis = redis
+        self.enabled = enabled
+        self.low = low
+        self.high = high
+        self.refill_batch = refill_batch
+        self.strategy = strategy
+
+    async def pop_many(self, count):
+        """Функция получения count коротких ссылок из пула
+
+        returns:
+            aliases: list of str (может быть короче count, если пул исчерпан)
+        """
+        if not self.enabled or count <= 0:
+            return []
+        try:
+            raw = await self.redis.lpop(POOL_KEY, count)
+            aliases = [alias.decode() for alias in raw or []]
+            async with self.redis.pipeline(transaction=False) as pipe:
+                if aliases:
+                    pipe.incrby(SERVED_KEY, len(aliases))
+                if len(aliases) < count:
+                    pipe.incr(EXHAUSTED_KEY)
+                await pipe.execute()
+            return aliases
+        except RedisError:
+            logger.warning("redis is unavailable, alias pool is skipped", exc_info=True)
+            return []
+
+    async def pop(self):
+        aliases = await self.pop_many(1)
+        return aliases[0] if aliases else None
+
+    async def refill(self, session_maker):
+        """Функция пополнения пула до high, если в нем меньше low ссылок
+        Кандидаты, уже занятые в базе данных, отбрасываются. Если REFILL_MAX_EMPTY_ROUNDS пачек подряд
+        целиком заняты (стратегия выдает одни и те же ссылки или пространство ссылок почти исчерпано),
+        пополнение прекращается
+
+        params:
+            session_maker: async_sessionmaker
+
+        returns:
+            added: int
+        """
+        if not self.enabled:
+            return 0
+        if not await self.redis.set(REFILL_LOCK_KEY, 1, nx=True, ex=300):
+            return 0
+        try:
+            depth = await self.redis.llen(POOL_KEY)
+            if depth >= self.low:
+                return 0
+            generator = get_alias_generator(self.strategy)
+            added = empty_rounds = 0
+            async with session_maker() as session:
+                while depth + added < self.high:
+                    size = min(self.refill_batch, self.high - depth - added)
+                    try:
+                        candidates = set(await generate_aliases([""] * size, generator))
+                    except ExecutorSaturated:
+                        # пул CPU занят запросами пользователей -- пополним в следующий раз
+                        break
+                    query = select(link_aliases.c.custom_alias).where(link_aliases.c.custom_alias.in_(candidates))
+                    taken = set((await session.execute(query)).scalars().all())
+                    fresh = list(candidates - taken)
+                    if fresh:
+                        await self.redis.rpush(POOL_KEY, *fresh)
+                        added += len(fresh)
+                        empty_rounds = 0
+                        continue
+                    empty_rounds += 1
+                    if empty_rounds >= REFILL_MAX_EMPTY_ROUNDS:
+                        logger.warning(
+                            "alias pool refill stopped: %s batches of %s strategy aliases were all taken",
+                            empty_rounds, self.strategy,
+                        )
+                        break
+            await self.redis.incrby(REFILLED_KEY, added)
+            return added
+        finally:
+            await self.redis.delete(REFILL_LOCK_KEY)
+
+    async def stats(self):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.llen(POOL_KEY)
+            pipe.get(SERVED_KEY)
+            pipe.get(EXHAUSTED_KEY)
+            pipe.get(REFILLED_KEY)
+            depth, served, exhausted, refilled = await pipe.execute()
+        return {
+            "enabled": self.enabled,
+            "depth": depth,
+            "low_watermark": self.low,
+            "high_watermark": self.high,
+            "served": int(served or 0),
+            "exhausted": int(exhausted or 0),
+            "refilled": int(refilled or 0),
+        }
+
+
+alias_pool = AliasPool(redis_client)
@@ -0,0 +1,189 @@
+import os
+import time
+import string
+import hashlib
+import secrets
+import itertools
+import threading
+from collections import deque
+
+from config import ALIAS_STRATEGY, ALIAS_SECRET, ALIAS_WORKER_ID
+from executor import cpu_executor
+
+ALIAS_LENGTH = 10
+BASE62_ALPHABET = string.digits + string.ascii_letters
+ALIAS_SPACE = len(BASE62_ALPHABET) ** ALIAS_LENGTH
+
+
+def base62_encode(number, length=ALIAS_LENGTH):
+    """Функция перевода неотрицательного числа в строку base62 фиксированной длины
+
+    params:
+        number: int (меньше 62 ** length)
+        length: int
+
+    returns:
+        alias: str
+    """
+    chars = []
+    for _ in range(length):
+        number, rest = divmod(number, 62)
+        chars.append(BASE62_ALPHABET[rest])
+    return "".join(reversed(chars))
+
+
+class AliasGenerator:
+    """Базовая стратегия генерации коротких ссылок
+
+    Каждая стратегия выдает кандидатов длины ALIAS_LENGTH, уникальных в пределах процесса.
+    Окончательную проверку на коллизию с базой данных делает вызывающий код.
+    """
+    name = "base"
+    # True, если генерация нагружает CPU и ее нельзя выполнять прямо в event loop
+    cpu_bound = False
+
+    def generate(self, long_link):
+        raise NotImplementedError
+
+    def generate_batch(self, long_links):
+        return [self.generate(long_link) for long_link in long_links]
+
+
+class KeyedHashGenerator(AliasGenerator):
+    """Ключевой blake2b от ссылки и счетчика процесса
+
+    Счетчик начинается со случайного значения, поэтому одна и та же ссылка
+    при повторном сокращении получает новую короткую ссылку.
+    """
+    name = "keyed_hash"
+
+    def __init__(self, secret=ALIAS_SECRET):
+        self._key = hashlib.blake2b(secret.encode("UTF-8")).digest() if secret else os.urandom(32)
+        self._counter = itertools.count(secrets.randbits(48))
+
+    def generate(self, long_link):
+        nonce = next(self._counter).to_bytes(8, "big")
+        digest = hashlib.blake2b(long_link.encode("UTF-8") + nonce, key=self._key, digest_size=8).digest()
+        return base62_encode(int.from_bytes(digest, "big") % ALIAS_SPACE)
+
+
+class SnowflakeGenerator(AliasGenerator):
+    """Snowflake-идентификатор, закодированный в base62
+
+    59 бит: 41 бит миллисекунд от EPOCH_MS, 8 бит номера воркера, 10 бит счетчика
+    внутри миллисекунды. 2 ** 59 < 62 ** 10, поэтому ссылка всегда помещается в 10 символов.
+    Ссылки монотонно растут, то есть их можно перебрать -- для приватных ссылок лучше keyed_hash.
+    """
+    name = "snowflake"
+    EPOCH_MS = 1735689600000  # 2025-01-01 UTC
+    WORKER_BITS = 8
+    SEQUENCE_BITS = 10
+
+    def __init__(self, worker_id=ALIAS_WORKER_ID):
+        if worker_id is None:
+            worker_id = os.getpid()
+        self._worker_id = int(worker_id) & ((1 << self.WORKER_BITS) - 1)
+        self._sequence_mask = (1 << self.SEQUENCE_BITS) - 1
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def _next_id(self):
+        with self._lock:
+            now_ms = max(int(time.time() * 1000) - self.EPOCH_MS, self._last_ms)
+            if now_ms == self._last_ms:
+                self._sequence = (self._sequence + 1) & self._sequence_mask
+                if self._sequence == 0:
+                    # счетчик исчерпан -- ждем следующую миллисекунду
+                    while now_ms <= self._last_ms:
+                        now_ms = int(time.time() * 1000) - self.EPOCH_MS
+            else:
+                self._sequence = 0
+            self._last_ms = now_ms
+            return (
+                (now_ms << (self.WORKER_BITS + self.SEQUENCE_BITS))
+                | (self._worker_id << self.SEQUENCE_BITS)
+                | self._sequence
+            )
+
+    def generate(self, long_link):
+        return base62_encode(self._next_id())
+
+
+class RandomPoolGenerator(AliasGenerator):
+    """Случайные ссылки, заранее сгенерированные пачками из secrets
+
+    Пространство 62 ** 10 (~8.4 * 10 ** 17), поэтому вероятность коллизии ничтожна,
+    а повторы внутри одной пачки отбрасываются.
+    """
+    name = "random"
+
+    def __init__(self, batch_size=1024):
+        self._batch_size = batch_size
+        self._pool = deque()
+
+    def _refill(self):
+        batch = {base62_encode(secrets.randbelow(ALIAS_SPACE)) for _ in range(self._batch_size)}
+        self._pool.extend(batch)
+
+    def generate(self, long_link):
+        while True:
+            try:
+                return self._pool.popleft()
+            except IndexError:
+                self._refill()
+
+
+class Pbkdf2Generator(AliasGenerator):
+    """Прежний способ: pbkdf2_hmac со 100000 итераций, оставлен для сравнения в бенчмарке"""
+    name = "pbkdf2"
+    cpu_bound = True
+
+    def generate(self, long_link):
+        salt = os.urandom(16)
+        hash_object = hashlib.pbkdf2_hmac('sha256', long_link.encode('UTF-8'), salt, 100000)
+        return hash_object.hex()[:ALIAS_LENGTH]
+
+
+ALIAS_GENERATORS = {
+    generator.name: generator
+    for generator in (KeyedHashGenerator, SnowflakeGenerator, RandomPoolGenerator, Pbkdf2Generator)
+}
+
+
+def get_alias_generator(strategy=ALIAS_STRATEGY):
+    """Функция получения стратегии генерации коротких ссылок по имени
+
+    params:
+        strategy: str (keyed_hash, snowflake, random, pbkdf2)
+
+    returns:
+        generator: AliasGenerator
+    """
+    try:
+        return ALIAS_GENERATORS[strategy]()
+    except KeyError:
+        raise ValueError(f"unknown alias strategy {strategy!r}, expected one of {sorted(ALIAS_GENERATORS)}")
+
+
+alias_generator = get_alias_generator()
+
+
+async def generate_aliases(long_links, generator=alias_generator, executor=cpu_executor):
+    """Функция генерации кандидатов в короткие ссылки, не блокирующая event loop
+    Стратегии, нагружающие CPU (cpu_bound), выполняются в пуле executor, остальные -- на месте
+
+    params:
+        long_links: list of str
+        generator: AliasGenerator
+        executor: BoundedExecutor
+
+    returns:
+        aliases: list of str
+
+    raises:
+        ExecutorSaturated, если очередь пула заполнена
+    """
+    if not generator.cpu_bound:
+        return generator.generate_batch(long_links)
+    return await executor.run(generator.generate_batch, long_links)
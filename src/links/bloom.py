@@ -0,0 +1,257 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+
+from redis.exceptions import RedisError
+from sqlalchemy import select
+
+from config import (
+    ALIAS_FILTER_ENABLED, ALIAS_FILTER_CAPACITY, ALIAS_FILTER_ERROR_RATE, ALIAS_FILTER_CHECK_INTERVAL,
+    NEGATIVE_CACHE_TTL,
+)
+from metrics import count_cache_event
+from redis_client import redis_client
+from .models import link_aliases
+
+logger = logging.getLogger(__name__)
+
+FILTER_KEY = "links:bloom"
+BUILDING_KEY = "links:bloom:building"
+BUILD_LOCK_KEY = "links:bloom:lock"
+MISSING_KEY = "links:missing:{}"
+
+# биты ставятся в готовый фильтр, только если он существует (иначе получился бы неполный фильтр),
+# и в строящийся, чтобы ссылки, созданные во время сборки, в него тоже попали
+ADD_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        for _, position in ipairs(ARGV) do
+            redis.call('SETBIT', key, position, 1)
+        end
+    end
+end
+return 1
+"""
+# запись в кэш отсутствующих после промаха в базе данных: если биты ссылки уже стоят в фильтре,
+# ссылку успели создать после чтения из базы и add уже удалил запись, поэтому она не пишется
+MISSING_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    local found = true
+    for i = 2, #ARGV do
+        if redis.call('GETBIT', KEYS[1], ARGV[i]) == 0 then
+            found = false
+            break
+        end
+    end
+    if found then
+        return 0
+    end
+end
+redis.call('SET', KEYS[2], 1, 'EX', ARGV[1])
+return 1
+"""
+
+
+def filter_size(capacity, error_rate):
+    """Функция расчета параметров фильтра Блума
+
+    params:
+        capacity: int (ожидаемое число коротких ссылок)
+        error_rate: float (допустимая доля ложных срабатываний)
+
+    returns:
+        bits: int (размер битовой карты, не больше 2 ** 32 -- предел строки Redis)
+        hashes: int (число хэш-функций)
+    """
+    bits = min(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2), 2 ** 32)
+    hashes = max(1, round(bits / capacity * math.log(2)))
+    return bits, hashes
+
+
+class AliasFilter:
+    """Фильтр Блума всех коротких ссылок в битовой карте Redis и кэш отсутствующих ссылок
+
+    Отрицательный ответ фильтра точный, поэтому переход по несуществующей ссылке отклоняется
+    без запроса к базе данных. Удаленные ссылки из фильтра не убираются: их отсекает
+    кэш отсутствующих ссылок MISSING_KEY на NEGATIVE_CACHE_TTL секунд, а периодическая
+    пересборка сбрасывает их биты.
+
+    Пока фильтра нет в Redis (первая сборка, перезапуск Redis) или Redis недоступен,
+    might_exist отвечает True и переход идет в базу данных. Если ссылку не удалось добавить
+    в фильтр, фильтр считается устаревшим: он удаляется из Redis и собирается заново.
+    """
+
+    def __init__(self, redis, enabled=ALIAS_FILTER_ENABLED, capacity=ALIAS_FILTER_CAPACITY,
+                 error_rate=ALIAS_FILTER_ERROR_RATE, negative_ttl=NEGATIVE_CACHE_TTL):
+        self.redis = redis
+        self.enabled = enabled
+        self.capacity = capacity
+        self.bits, self.hashes = filter_size(capacity, error_rate)
+        self.negative_ttl = negative_ttl
+        # ссылку не удалось добавить, а фильтр не удалось удалить: без нее фильтр дал бы ложный отказ,
+        # поэтому до удаления фильтра в run он не используется
+        self._stale = False
+        self._add = redis.register_script(ADD_SCRIPT)
+        self._remember_missing = redis.register_script(MISSING_SCRIPT)
+
+    def positions(self, alias):
+        digest = hashlib.blake2b(alias.encode("UTF-8"), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big") | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    async def might_exist(self, alias):
+        """Функция проверки, может ли короткая ссылка существовать
+
+        returns:
+            bool (False -- ссылки точно нет)
+        """
+        if not self.enabled:
+            return True
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.exists(MISSING_KEY.format(alias))
+                pipe.exists(FILTER_KEY)
+                for position in self.positions(alias):
+                    pipe.getbit(FILTER_KEY, position)
+                missing, ready, *bits = await pipe.execute()
+        except RedisError:
+            count_cache_event("alias_filter", "errors")
+            logger.warning("redis is unavailable, alias filter is skipped", exc_info=True)
+            return True
+        if missing:
+            count_cache_event("alias_filter", "negative_hits")
+            return False
+        if ready and not self._stale and not all(bits):
+            count_cache_event("alias_filter", "rejected")
+            return False
+        count_cache_event("alias_filter", "passed")
+        return True
+
+    async def add(self, *aliases):
+        """Функция добавления созданных коротких ссылок в фильтр, вызывается после commit
+        Сначала ставятся биты, затем удаляется кэш отсутствующих: remember_missing после этого
+        видит биты и запись не возвращает. Если Redis недоступен, фильтр удаляется (или помечается
+        устаревшим, если удалить не удалось) и переходы идут в базу данных до пересборки
+        """
+        if not self.enabled or not aliases:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                positions = [position for alias in aliases for position in self.positions(alias)]
+                await self._add(keys=[FILTER_KEY, BUILDING_KEY], args=positions, client=pipe)
+                pipe.delete(*(MISSING_KEY.format(alias) for alias in aliases))
+                await pipe.execute()
+        except RedisError:
+            logger.warning("redis is unavailable, alias filter is invalidated after adding %s", aliases, exc_info=True)
+            self._stale = True
+            await self.invalidate()
+
+    async def invalidate(self):
+        """Функция удаления устаревшего фильтра: might_exist отвечает True, пока run не соберет новый
+        Пока идет сборка, фильтр не удаляется (сборка переименовала бы неполный фильтр после удаления),
+        отметка _stale остается до следующей проверки
+
+        returns:
+            bool (фильтр удален)
+        """
+        try:
+            if await self.redis.exists(BUILD_LOCK_KEY):
+                return False
+            await self.redis.delete(FILTER_KEY)
+        except RedisError:
+            logger.warning("redis is unavailable, alias filter stays stale", exc_info=True)
+            return False
+        self._stale = False
+        return True
+
+    async def remember_missing(self, *aliases, deleted=False):
+        """Функция записи несуществующих (или удаленных) ссылок в кэш отсутствующих
+
+        params:
+            aliases: str
+            deleted: bool (ссылки удалены, а не просто не найдены: их биты остаются в фильтре,
+                поэтому запись делается без проверки битов)
+        """
+        if not self.enabled or not aliases:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for alias in aliases:
+                    if deleted:
+                        pipe.set(MISSING_KEY.format(alias), 1, ex=self.negative_ttl)
+                    else:
+                        await self._remember_missing(
+                            keys=[FILTER_KEY, MISSING_KEY.format(alias)],
+                            args=[self.negative_ttl, *self.positions(alias)], client=pipe,
+                        )
+                await pipe.execute()
+        except RedisError:
+            logger.warning("redis is unavailable, negative cache is skipped", exc_info=True)
+
+    async def build(self, session_maker, batch_size=10000):
+        """Функция сборки фильтра по всей таблице links
+        Фильтр собирается в отдельном ключе и заменяет готовый одним RENAME
+
+        params:
+            session_maker: async_sessionmaker
+            batch_size: int
+
+        returns: dict
+            status: str (done, already running или disabled)
+            aliases: int
+            seconds: float
+        """
+        if not self.enabled:
+            return {"status": "disabled"}
+        if not await self.redis.set(BUILD_LOCK_KEY, 1, nx=True, ex=3600):
+            return {"status": "already running"}
+        started = time.monotonic()
+        try:
+            await self.redis.delete(BUILDING_KEY)
+            # битовая карта выделяется сразу целиком
+            await self.redis.setbit(BUILDING_KEY, self.bits - 1, 0)
+            count, last_alias = 0, ""
+            # короткие ссылки читаются из link_aliases по ее первичному ключу, а не по всем секциям links
+            query = select(link_aliases.c.custom_alias).order_by(link_aliases.c.custom_alias).limit(batch_size)
+            while True:
+                async with session_maker() as session:
+                    rows = (await session.execute(query.where(link_aliases.c.custom_alias > last_alias))).all()
+                if not rows:
+                    break
+                bitfield = self.redis.bitfield(BUILDING_KEY)
+                for row in rows:
+                    for position in self.positions(row.custom_alias):
+                        bitfield.set("u1", position, 1)
+                await bitfield.execute()
+                count += len(rows)
+                last_alias = rows[-1].custom_alias
+                await self.redis.expire(BUILD_LOCK_KEY, 3600)
+            await self.redis.rename(BUILDING_KEY, FILTER_KEY)
+        finally:
+            await self.redis.delete(BUILD_LOCK_KEY)
+        if count > self.capacity:
+            logger.warning("%s aliases exceed alias filter capacity %s, raise ALIAS_FILTER_CAPACITY", count, self.capacity)
+        return {"status": "done", "aliases": count, "seconds": round(time.monotonic() - started, 2)}
+
+    async def run(self, session_maker, interval=ALIAS_FILTER_CHECK_INTERVAL):
+        """Функция поддержки фильтра в воркере, запускается в lifespan
+        Удаляет устаревший фильтр и собирает фильтр, если его нет в Redis
+        """
+        if not self.enabled:
+            return
+        while True:
+            try:
+                if self._stale:
+                    await self.invalidate()
+                if not await self.redis.exists(FILTER_KEY):
+                    result = await self.build(session_maker)
+                    if result["status"] == "done":
+                        logger.info("alias filter built: %s aliases in %s s", result["aliases"], result["seconds"])
+            except Exception:
+                logger.warning("alias filter maintenance failed", exc_info=True)
+            await asyncio.sleep(interval)
+
+
+alias_filter = AliasFilter(redis_client)
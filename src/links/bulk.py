@@ -0,0 +1,215 @@
+import codecs
+import datetime
+import json
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+
+from config import ALIAS_MAX_ATTEMPTS, BULK_CHUNK_SIZE, BULK_MAX_ITEM_BYTES
+from database import async_session_maker
+from executor import ExecutorSaturated
+from .aliases import generate_aliases, ALIAS_LENGTH
+from .alias_pool import alias_pool
+from .bloom import alias_filter
+from .cache import invalidate_links
+from .models import linking
+from .schemas import LinksBulkItem
+from .urls import url_fingerprint
+
+JSON_SEPARATORS = " \t\r\n,"
+
+
+async def iter_json_objects(chunks, max_item_bytes=BULK_MAX_ITEM_BYTES):
+    """Функция потокового разбора тела запроса: JSON-массив объектов или NDJSON
+
+    В памяти хранится только текущий незаконченный объект, поэтому расход памяти
+    не зависит от размера тела запроса.
+
+    params:
+        chunks: асинхронный итератор bytes
+        max_item_bytes: int (максимальный размер одного объекта)
+
+    returns:
+        асинхронный итератор dict
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("UTF-8")()
+    buffer = ""
+    array_opened = array_closed = False
+
+    async for chunk in chunks:
+        buffer += text.decode(chunk)
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in JSON_SEPARATORS:
+                position += 1
+            if position == len(buffer):
+                break
+            char = buffer[position]
+            if array_closed:
+                raise ValueError("unexpected data after the end of JSON array")
+            if char == "[" and not array_opened:
+                array_opened = True
+                position += 1
+                continue
+            if char == "]" and array_opened:
+                array_closed = True
+                position += 1
+                continue
+            if char != "{":
+                raise ValueError(f"expected JSON object, got {char!r}")
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # объект еще не дочитан
+                break
+            yield item
+        buffer = buffer[position:]
+        if len(buffer) > max_item_bytes:
+            raise ValueError(f"JSON object is larger than {max_item_bytes} bytes or malformed")
+
+    buffer += text.decode(b"", final=True)
+    if buffer.strip(JSON_SEPARATORS):
+        raise ValueError("unexpected end of body: incomplete JSON object")
+    if array_opened and not array_closed:
+        raise ValueError("unexpected end of body: JSON array is not closed")
+
+
+async def iter_chunks(items, size):
+    chunk = []
+    async for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def insert_chunk(session, rows):
+    """Функция многострочной вставки с пропуском занятых коротких ссылок
+    Занятые короткие ссылки отсекает триггер links_claim_alias, такие строки не попадают в RETURNING
+
+    params:
+        session: AsyncSession
+        rows: list of dict
+
+    returns:
+        inserted: set (короткие ссылки, которые удалось вставить)
+    """
+    statement = insert(linking).values(rows).returning(linking.c.custom_alias)
+    result = await session.execute(statement)
+    return set(result.scalars().all())
+
+
+async def shorten_chunk(session, chunk):
+    """Функция создания коротких ссылок для пачки элементов
+
+    params:
+        session: AsyncSession
+        chunk: list of (index, dict)
+
+    returns:
+        results: list of dict (результат для каждого элемента в исходном порядке)
+    """
+    results = {}
+    custom, generated = [], []
+    now = datetime.datetime.utcnow()
+    for index, raw in chunk:
+        try:
+            item = LinksBulkItem.model_validate(raw)
+        except ValidationError as e:
+            results[index] = {"index": index, "status": "error", "data": e.errors(include_url=False, include_context=False)}
+            continue
+        row = {
+            'user_id': item.user_id,
+            'long_link': item.long_link,
+            'long_link_hash': url_fingerprint(item.long_link),
+            'custom_alias': item.custom_alias,
+            'expires_at': item.expires_at.replace(tzinfo=None),
+            'last_usage': now,
+            'number_of_usages': 0,
+            'is_authorized': True,
+            'redirect_status': item.redirect_status,
+        }
+        (custom if len(item.custom_alias) == ALIAS_LENGTH else generated).append((index, row))
+
+    # одинаковые кастомные ссылки внутри пачки: вставляем только первую
+    custom_rows = {}
+    for index, row in custom:
+        results[index] = {"index": index, "status": "error", "data": "This alias is already in database. Try another one!"}
+        custom_rows.setdefault(row['custom_alias'], (index, row))
+    if custom_rows:
+        inserted = await insert_chunk(session, [row for _, row in custom_rows.values()])
+        for alias, (index, _) in custom_rows.items():
+            if alias in inserted:
+                results[index] = {"index": index, "status": "success", "short_link": alias}
+
+    generated_rows = list(generated)
+    for _ in range(ALIAS_MAX_ATTEMPTS):
+        if not generated:
+            break
+        aliases = await alias_pool.pop_many(len(generated))
+        try:
+            aliases += await generate_aliases([row['long_link'] for _, row in generated[len(aliases):]])
+        except ExecutorSaturated:
+            # ответ уже отдается потоком, поэтому 429 вернуть нельзя -- ссылки без кандидата помечаются ошибкой
+            for index, _ in generated[len(aliases):]:
+                results[index] = {"index": index, "status": "error", "data": "server is busy, try again later"}
+            generated = generated[:len(aliases)]
+            if not generated:
+                break
+        for (_, row), alias in zip(generated, aliases):
+            row['custom_alias'] = alias
+        inserted = await insert_chunk(session, [row for _, row in generated])
+        retry = []
+        for index, row in generated:
+            if row['custom_alias'] in inserted:
+                inserted.discard(row['custom_alias'])
+                results[index] = {"index": index, "status": "success", "short_link": row['custom_alias']}
+            else:
+                retry.append((index, row))
+        generated = retry
+    for index, _ in generated:
+        results[index] = {"index": index, "status": "error", "data": "could not generate unique short link, try again"}
+
+    await session.commit()
+    created = {index for index, result in results.items() if result["status"] == "success"}
+    aliases = [results[index]["short_link"] for index in created]
+    await alias_filter.add(*aliases)
+    await invalidate_links(
+        long_links=[row['long_link'] for index, row in custom + generated_rows if index in created], created=aliases
+    )
+    return [results[index] for index, _ in chunk]
+
+
+async def bulk_shorten(chunks, chunk_size=BULK_CHUNK_SIZE):
+    """Функция массового создания коротких ссылок с потоковой выдачей результата в NDJSON
+
+    params:
+        chunks: асинхронный итератор bytes (тело запроса)
+        chunk_size: int (сколько ссылок вставляется одним INSERT)
+
+    returns:
+        асинхронный итератор строк NDJSON
+    """
+    created = failed = 0
+
+    async def numbered(items):
+        index = 0
+        async for item in items:
+            yield index, item
+            index += 1
+
+    async with async_session_maker() as session:
+        try:
+            async for chunk in iter_chunks(numbered(iter_json_objects(chunks)), chunk_size):
+                for result in await shorten_chunk(session, chunk):
+                    if result["status"] == "success":
+                        created += 1
+                    else:
+                        failed += 1
+                    yield json.dumps(result, default=str) + "\n"
+        except ValueError as e:
+            yield json.dumps({"status": "error", "data": str(e)}) + "\n"
+    yield json.dumps({"status": "done", "created": created, "failed": failed}) + "\n"
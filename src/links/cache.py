@@ -0,0 +1,358 @@
+import asyncio
+import datetime
+import functools
+import hashlib
+import heapq
+import json
+import logging
+import time
+from collections import Counter
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from redis.exceptions import RedisError
+
+from caching import TTLCache, TieredBackend, listen
+from config import REDIRECT_CACHE_SIZE, REDIRECT_CACHE_TTL, REDIRECT_TOMBSTONE_TTL
+from metrics import count_cache_event
+from redis_client import redis_client
+from .urls import url_fingerprint
+
+logger = logging.getLogger(__name__)
+
+REDIRECT_KEY = "links:redirect:{}"
+# канал, по которому воркеры сообщают друг другу об удаленных и измененных коротких ссылках
+INVALIDATION_CHANNEL = "links:invalidate"
+# значение ключа Redis для только что удаленной ссылки: запрещает записать ее обратно устаревшим чтением
+TOMBSTONE = b"-"
+
+RESPONSE_CACHE_PREFIX = "fastapi-cache"
+RESPONSE_CACHE_NAMESPACE = "links"
+
+
+def make_entry(long_link, expires_at, status=301):
+    """Функция создания записи кэша переходов
+
+    params:
+        long_link: str
+        expires_at: datetime или None
+        status: int (redirect_status ссылки)
+
+    returns: dict
+        long_link: str
+        expires_at: datetime или None
+        status: int
+    """
+    if expires_at is not None:
+        expires_at = expires_at.replace(tzinfo=None)
+    return {"long_link": long_link, "expires_at": expires_at, "status": status}
+
+
+def is_expired(entry, now=None):
+    expires_at = entry["expires_at"]
+    return expires_at is not None and expires_at <= (now or datetime.datetime.utcnow())
+
+
+def _dump_entry(entry):
+    expires_at = entry["expires_at"]
+    return json.dumps({
+        "long_link": entry["long_link"], "expires_at": expires_at and expires_at.isoformat(), "status": entry["status"],
+    })
+
+
+def _load_entry(raw):
+    entry = json.loads(raw)
+    expires_at = entry["expires_at"]
+    # записи, положенные в Redis до появления redirect_status, -- ссылки с прежним 301
+    return make_entry(entry["long_link"], expires_at and datetime.datetime.fromisoformat(expires_at), entry.get("status", 301))
+
+
+class RedirectCache:
+    """Кэш переходов по короткой ссылке: LRU внутри процесса перед общим Redis
+
+    Хранит только то, что нужно для редиректа, а не весь ответ. Недоступность Redis
+    не ломает переходы -- вызывающий код просто уходит в базу данных.
+    Запись хранит expires_at ссылки, а время жизни записи не превышает остаток жизни ссылки.
+    Ссылки, истекающие раньше TTL, лежат в куче, из которой run_expiry_evictor убирает
+    их из кэша процесса ровно в момент истечения.
+
+    Удаление ссылки оставляет в Redis метку TOMBSTONE на tombstone_ttl секунд и рассылается
+    всем воркерам через pub/sub, поэтому запись не живет в кэшах процессов до конца TTL.
+    """
+
+    def __init__(self, redis, maxsize=REDIRECT_CACHE_SIZE, ttl=REDIRECT_CACHE_TTL,
+                 tombstone_ttl=REDIRECT_TOMBSTONE_TTL):
+        self.redis = redis
+        self.ttl = ttl
+        self.tombstone_ttl = tombstone_ttl
+        self.local = TTLCache(maxsize, ttl)
+        self.counters = Counter()
+        # растет при каждой инвалидации: чтение из базы, начатое до нее, не попадает в кэш
+        self.generation = 0
+        self._expiry_heap = []
+        self._expiry_changed = None
+
+    def _count(self, name):
+        self.counters[name] += 1
+        count_cache_event("redirects", name)
+
+    def _entry_ttl(self, entry):
+        """Функция вычисления времени жизни записи: не больше TTL и не больше остатка жизни ссылки
+
+        returns:
+            ttl: float (сек), для уже истекшей ссылки -- полный TTL: она останется истекшей
+        """
+        if entry["expires_at"] is None:
+            return self.ttl
+        remaining = (entry["expires_at"] - datetime.datetime.utcnow()).total_seconds()
+        if remaining <= 0:
+            return self.ttl
+        return min(self.ttl, remaining)
+
+    def _set_local(self, alias, entry):
+        ttl = self._entry_ttl(entry)
+        self.local.set(alias, entry, ttl)
+        if ttl < self.ttl:
+            deadline = time.monotonic() + ttl
+            if self._expiry_changed is not None and (not self._expiry_heap or deadline < self._expiry_heap[0][0]):
+                self._expiry_changed.set()
+            heapq.heappush(self._expiry_heap, (deadline, alias))
+        return ttl
+
+    async def get(self, alias):
+        """Функция получения записи о короткой ссылке из кэша
+
+        params:
+            alias: str
+
+        returns:
+            entry: dict (long_link, expires_at) или None при промахе
+        """
+        entry = self.local.get(alias)
+        if entry is not None:
+            self._count("l1_hits")
+            return entry
+        self._count("l1_misses")
+        try:
+            raw = await self.redis.get(REDIRECT_KEY.format(alias))
+        except RedisError:
+            self._count("l2_errors")
+            logger.warning("redis is unavailable, redirect cache falls back to database", exc_info=True)
+            return None
+        if raw is None or raw == TOMBSTONE:
+            self._count("l2_misses")
+            return None
+        self._count("l2_hits")
+        entry = _load_entry(raw)
+        self._set_local(alias, entry)
+        return entry
+
+    async def set(self, alias, entry, generation=None):
+        """Функция записи ссылки в кэш
+
+        params:
+            alias: str
+            entry: dict (make_entry)
+            generation: int (значение self.generation до чтения из базы данных;
+                если с тех пор была инвалидация, запись пропускается -- она могла устареть)
+        """
+        if generation is not None and generation != self.generation:
+            return
+        ttl = self._set_local(alias, entry)
+        try:
+            # nx: не перезаписываем метку удаления и запись, положенную другим воркером
+            await self.redis.set(REDIRECT_KEY.format(alias), _dump_entry(entry), px=max(int(ttl * 1000), 1), nx=True)
+        except RedisError:
+            logger.warning("redis is unavailable, entry cached only in process", exc_info=True)
+
+    async def get_many(self, aliases):
+        """Функция получения записей о нескольких ссылках одним MGET, найденные попадают в кэш процесса
+
+        returns:
+            entries: dict (alias -> entry), только найденные
+        """
+        entries = {alias: entry for alias in aliases if (entry := self.local.get(alias)) is not None}
+        remote = [alias for alias in aliases if alias not in entries]
+        if not remote:
+            return entries
+        try:
+            values = await self.redis.mget([REDIRECT_KEY.format(alias) for alias in remote])
+        except RedisError:
+            logger.warning("redis is unavailable, redirect cache falls back to database", exc_info=True)
+            return entries
+        for alias, raw in zip(remote, values):
+            if raw is not None and raw != TOMBSTONE:
+                entries[alias] = _load_entry(raw)
+                self._set_local(alias, entries[alias])
+        return entries
+
+    async def set_many(self, entries):
+        """Функция записи нескольких ссылок в кэш одним конвейером Redis
+
+        params:
+            entries: dict (alias -> entry)
+        """
+        if not entries:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for alias, entry in entries.items():
+                    ttl = self._set_local(alias, entry)
+                    pipe.set(REDIRECT_KEY.format(alias), _dump_entry(entry), px=max(int(ttl * 1000), 1), nx=True)
+                await pipe.execute()
+        except RedisError:
+            logger.warning("redis is unavailable, entries cached only in process", exc_info=True)
+
+    def _drop_local(self, aliases):
+        self.generation += 1
+        for alias in aliases:
+            self.local.pop(alias)
+
+    async def delete(self, *aliases):
+        """Функция удаления ссылок из кэша во всех воркерах"""
+        if not aliases:
+            return
+        self._drop_local(aliases)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for alias in aliases:
+                    pipe.set(REDIRECT_KEY.format(alias), TOMBSTONE, ex=self.tombstone_ttl)
+                pipe.publish(INVALIDATION_CHANNEL, json.dumps(aliases))
+                await pipe.execute()
+        except RedisError:
+            logger.warning("redis is unavailable, could not evict %s", aliases, exc_info=True)
+
+    def _reset_local(self):
+        self.generation += 1
+        self.local.clear()
+
+    async def run_invalidation_listener(self):
+        """Функция приема инвалидаций от других воркеров, запускается в lifespan
+        Пока подписка разорвана, сообщения теряются, поэтому после переподключения кэш процесса очищается
+        """
+        await listen(self.redis, INVALIDATION_CHANNEL, self._drop_local, self._reset_local)
+
+    def evict_expired(self):
+        """Функция удаления из кэша процесса ссылок, время которых подошло
+
+        returns:
+            delay: float или None (сколько секунд до следующего истечения)
+        """
+        now = time.monotonic()
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            _, alias = heapq.heappop(self._expiry_heap)
+            # запись могли перезаписать с более поздним сроком -- тогда она не удалится
+            self.local.discard_expired(alias)
+        return self._expiry_heap[0][0] - now if self._expiry_heap else None
+
+    async def run_expiry_evictor(self):
+        """Функция фонового удаления истекающих ссылок из кэша процесса, запускается в lifespan"""
+        self._expiry_changed = asyncio.Event()
+        while True:
+            delay = self.evict_expired()
+            self._expiry_changed.clear()
+            try:
+                await asyncio.wait_for(self._expiry_changed.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+def _digest(value):
+    return hashlib.sha256(str(value).encode("UTF-8")).hexdigest()[:32]
+
+
+def stats_tag(alias):
+    return f"{RESPONSE_CACHE_PREFIX}:{RESPONSE_CACHE_NAMESPACE}:stats:{alias}"
+
+
+def search_tag(long_link):
+    # по отпечатку: все написания одного URL делят кэш и сбрасываются вместе
+    return f"{RESPONSE_CACHE_PREFIX}:{RESPONSE_CACHE_NAMESPACE}:search:{url_fingerprint(long_link)}"
+
+
+def stats_key_builder(func, namespace="", *, request=None, response=None, args=(), kwargs=None):
+    """Ключ кэша статистики: тег короткой ссылки и хэш периода (TaggedRedisBackend)"""
+    kwargs = kwargs or {}
+    variant = _digest((kwargs.get("from_"), kwargs.get("to"), kwargs.get("granularity")))
+    return f"{stats_tag(kwargs['short_code'])}:{variant}"
+
+
+def search_key_builder(func, namespace="", *, request=None, response=None, args=(), kwargs=None):
+    """Ключ кэша поиска: тег отпечатка оригинальной ссылки и хэш страницы"""
+    kwargs = kwargs or {}
+    return f"{search_tag(kwargs['url'])}:{_digest((kwargs.get('cursor'), kwargs.get('limit')))}"
+
+
+def _utc_isoformat(value):
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc).isoformat()
+
+
+def content_etag(result):
+    """Функция получения ETag ответа по его содержимому: одинаков во всех воркерах и после перезапуска
+    Даты приводятся к UTC: кэш ответов возвращает их с часовым поясом, а только что посчитанный
+    ответ содержит их без пояса -- ETag у обоих должен совпадать
+    """
+    content = jsonable_encoder(result, custom_encoder={datetime.datetime: _utc_isoformat})
+    body = json.dumps(content, sort_keys=True, separators=(",", ":")).encode("UTF-8")
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(etag, if_none_match):
+    # If-None-Match сравнивается слабо: W/"x" совпадает с "x" (nginx ослабляет ETag при сжатии)
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+def conditional_get(func):
+    """Декоратор ручки с кэшем ответов: ETag по содержимому ответа и 304 Not Modified на If-None-Match
+
+    fastapi-cache считает ETag через hash(), который в каждом процессе свой: воркеры gunicorn
+    выдают одному и тому же ответу разные ETag, и условный запрос почти никогда не получает 304.
+    Ставится над @cache и берет Request и Response из параметров, которые @cache добавил в сигнатуру.
+    """
+    @functools.wraps(func)
+    async def inner(*args, **kwargs):
+        request = next((value for value in kwargs.values() if isinstance(value, Request)), None)
+        response = next((value for value in kwargs.values() if isinstance(value, Response)), None)
+        result = await func(*args, **kwargs)
+        if response is None or isinstance(result, Response):
+            return result
+        etag = content_etag(result)
+        response.headers["ETag"] = etag
+        if request is not None and etag_matches(etag, request.headers.get("if-none-match")):
+            headers = {"ETag": etag}
+            if "cache-control" in response.headers:
+                headers["Cache-Control"] = response.headers["cache-control"]
+            return Response(status_code=304, headers=headers)
+        return result
+    return inner
+
+
+redirect_cache = RedirectCache(redis_client)
+response_cache = TieredBackend(redis_client)
+
+
+async def invalidate_links(aliases=(), long_links=(), cache=None, created=()):
+    """Функция удаления из всех кэшей данных о коротких ссылках после записи в базу данных
+    Вызывается после commit
+
+    params:
+        aliases: коллекция str (удаленные или переименованные короткие ссылки:
+            переходы во всех воркерах и закэшированная статистика)
+        long_links: коллекция str (оригинальные ссылки, для которых изменился результат поиска)
+        cache: RedirectCache (по умолчанию -- кэш переходов этого процесса)
+        created: коллекция str (новые короткие ссылки: для них могла закэшироваться статистика "не найдено")
+    """
+    cache = cache or redirect_cache
+    backend = response_cache if cache is redirect_cache else TieredBackend(cache.redis)
+    aliases, long_links = list(aliases), set(long_links)
+    await cache.delete(*aliases)
+    tags = [stats_tag(alias) for alias in [*aliases, *created]] + [search_tag(long_link) for long_link in long_links]
+    try:
+        await backend.invalidate(*tags)
+    except RedisError:
+        logger.warning("redis is unavailable, cached responses are kept until TTL", exc_info=True)
@@ -0,0 +1,362 @@
+import asyncio
+import datetime
+import json
+import logging
+import re
+from collections import Counter
+from urllib.parse import urlsplit
+
+from redis.exceptions import RedisError
+from sqlalchemy import update, select, bindparam, func, String, Integer, DateTime
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+
+from config import CLICK_BACKEND, CLICK_FLUSH_INTERVAL, CLICK_FLUSH_BATCH_SIZE, CLICK_FLUSH_IN_CELERY
+from database import async_session_maker
+from redis_client import redis_client
+from .models import linking, link_aliases, click_rollups, click_sources
+
+logger = logging.getLogger(__name__)
+
+DELTAS_KEY = "clicks:deltas"
+LAST_USAGE_KEY = "clicks:last_usage"
+BUCKETS_KEY = "clicks:buckets"
+SOURCES_KEY = "clicks:sources"
+PENDING_KEYS = [DELTAS_KEY, LAST_USAGE_KEY, BUCKETS_KEY, SOURCES_KEY]
+FLUSHING_KEYS = [f"clicks:flushing:{key.split(':', 1)[1]}" for key in PENDING_KEYS]
+FLUSH_LOCK_KEY = "clicks:flush_lock"
+
+GRANULARITIES = {
+    "minute": datetime.timedelta(minutes=1),
+    "hour": datetime.timedelta(hours=1),
+    "day": datetime.timedelta(days=1),
+}
+MAX_SOURCE_LENGTH = 255
+USER_AGENT_FAMILIES = [
+    ("bot", re.compile(r"bot|crawl|spider|slurp|preview", re.I)),
+    ("curl", re.compile(r"^curl/", re.I)),
+    ("Edge", re.compile(r"Edg/")),
+    ("Opera", re.compile(r"OPR/|Opera")),
+    ("Firefox", re.compile(r"Firefox/")),
+    ("Chrome", re.compile(r"Chrome/|CriOS/")),
+    ("Safari", re.compile(r"Safari/")),
+]
+
+# атомарно забирает накопленные счетчики в отдельные ключи, если прошлая запись не зависла
+TAKE_SNAPSHOT_SCRIPT = """
+local n = #KEYS / 2
+for i = 1, n do
+    if redis.call('EXISTS', KEYS[n + i]) == 1 then return 1 end
+end
+for i = 1, n do
+    if redis.call('EXISTS', KEYS[i]) == 1 then redis.call('RENAME', KEYS[i], KEYS[n + i]) end
+end
+for i = 1, n do
+    if redis.call('EXISTS', KEYS[n + i]) == 1 then return 1 end
+end
+return 0
+"""
+
+_usage = select(
+    func.unnest(bindparam("aliases", type_=ARRAY(String))).label("alias"),
+    func.unnest(bindparam("deltas", type_=ARRAY(Integer))).label("delta"),
+    func.unnest(bindparam("last_usages", type_=ARRAY(DateTime))).label("last_usage"),
+).subquery("v")
+
+# один UPDATE на пачку: три параметра-массива вместо VALUES на каждую ссылку,
+# поэтому подготовленный запрос один и тот же для любой длины пачки;
+# ссылка находится через link_aliases по (id, expires_at) -- в своей секции links
+BULK_USAGE_UPDATE = update(linking).where(
+    link_aliases.c.custom_alias == _usage.c.alias,
+    linking.c.id == link_aliases.c.link_id,
+    linking.c.expires_at == link_aliases.c.expires_at,
+).values(
+    number_of_usages=linking.c.number_of_usages + _usage.c.delta,
+    last_usage=func.greatest(linking.c.last_usage, _usage.c.last_usage),
+)
+
+_rollups = pg_insert(click_rollups).from_select(
+    ["custom_alias", "granularity", "bucket", "clicks"],
+    select(
+        func.unnest(bindparam("aliases", type_=ARRAY(String))),
+        func.unnest(bindparam("granularities", type_=ARRAY(String))),
+        func.unnest(bindparam("buckets", type_=ARRAY(DateTime))),
+        func.unnest(bindparam("clicks", type_=ARRAY(Integer))),
+    ),
+)
+BULK_ROLLUPS_UPSERT = _rollups.on_conflict_do_update(
+    index_elements=["custom_alias", "granularity", "bucket"],
+    set_={"clicks": click_rollups.c.clicks + _rollups.excluded.clicks},
+)
+
+_sources = pg_insert(click_sources).from_select(
+    ["custom_alias", "day", "kind", "value", "clicks"],
+    select(
+        func.unnest(bindparam("aliases", type_=ARRAY(String))),
+        func.unnest(bindparam("days", type_=ARRAY(DateTime))),
+        func.unnest(bindparam("kinds", type_=ARRAY(String))),
+        func.unnest(bindparam("values", type_=ARRAY(String))),
+        func.unnest(bindparam("clicks", type_=ARRAY(Integer))),
+    ),
+)
+BULK_SOURCES_UPSERT = _sources.on_conflict_do_update(
+    index_elements=["custom_alias", "day", "kind", "value"],
+    set_={"clicks": click_sources.c.clicks + _sources.excluded.clicks},
+)
+
+
+def truncate_time(moment, granularity):
+    """Функция округления времени вниз до начала минуты, часа или дня"""
+    if granularity == "minute":
+        return moment.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def referrer_host(referrer):
+    if not referrer:
+        return "(direct)"
+    host = urlsplit(referrer).hostname
+    return (host or "(unknown)")[:MAX_SOURCE_LENGTH]
+
+
+def user_agent_family(user_agent):
+    if not user_agent:
+        return "(unknown)"
+    for family, pattern in USER_AGENT_FAMILIES:
+        if pattern.search(user_agent):
+            return family
+    return "other"
+
+
+class ClickBatch:
+    """Накопленные переходы: приращения счетчиков, поминутные корзины и источники по дням"""
+
+    def __init__(self):
+        self.deltas = Counter()
+        self.last_usage = {}
+        self.buckets = Counter()
+        self.sources = Counter()
+
+    def __bool__(self):
+        return bool(self.deltas)
+
+    def add(self, alias, moment, referrer, user_agent, count=1):
+        self.deltas[alias] += count
+        self.last_usage[alias] = max(moment, self.last_usage.get(alias, moment))
+        self.buckets[(alias, truncate_time(moment, "minute"))] += count
+        day = truncate_time(moment, "day")
+        self.sources[(alias, day, "referrer", referrer)] += count
+        self.sources[(alias, day, "user_agent", user_agent)] += count
+
+    def merge(self, other):
+        self.deltas.update(other.deltas)
+        for alias, moment in other.last_usage.items():
+            self.last_usage[alias] = max(moment, self.last_usage.get(alias, moment))
+        self.buckets.update(other.buckets)
+        self.sources.update(other.sources)
+
+    def rollups(self):
+        """Функция сворачивания поминутных корзин в минуты, часы и дни
+
+        returns:
+            rollups: Counter ((короткая ссылка, гранулярность, начало корзины) -> переходы)
+        """
+        rollups = Counter()
+        for (alias, minute), count in self.buckets.items():
+            for granularity in GRANULARITIES:
+                rollups[(alias, granularity, truncate_time(minute, granularity))] += count
+        return rollups
+
+
+def _batches(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+async def write_clicks(batch, batch_size=CLICK_FLUSH_BATCH_SIZE):
+    """Функция записи накопленных переходов в базу данных пачками в одной транзакции:
+    приращения number_of_usages и last_usage, поминутные/почасовые/дневные корзины и источники
+
+    params:
+        batch: ClickBatch
+        batch_size: int
+
+    returns:
+        statements: int (количество выполненных запросов)
+    """
+    statements = 0
+    async with async_session_maker() as session:
+        for aliases in _batches(batch.deltas, batch_size):
+            await session.execute(BULK_USAGE_UPDATE, {
+                "aliases": aliases,
+                "deltas": [batch.deltas[alias] for alias in aliases],
+                "last_usages": [batch.last_usage[alias] for alias in aliases],
+            })
+            statements += 1
+        for rows in _batches(batch.rollups().items(), batch_size):
+            await session.execute(BULK_ROLLUPS_UPSERT, {
+                "aliases": [alias for (alias, _, _), _ in rows],
+                "granularities": [granularity for (_, granularity, _), _ in rows],
+                "buckets": [bucket for (_, _, bucket), _ in rows],
+                "clicks": [count for _, count in rows],
+            })
+            statements += 1
+        for rows in _batches(batch.sources.items(), batch_size):
+            await session.execute(BULK_SOURCES_UPSERT, {
+                "aliases": [alias for (alias, _, _, _), _ in rows],
+                "days": [day for (_, day, _, _), _ in rows],
+                "kinds": [kind for (_, _, kind, _), _ in rows],
+                "values": [value for (_, _, _, value), _ in rows],
+                "clicks": [count for _, count in rows],
+            })
+            statements += 1
+        await session.commit()
+    return statements
+
+
+def _timestamp(moment):
+    return moment.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def _from_timestamp(timestamp):
+    return datetime.datetime.utcfromtimestamp(float(timestamp))
+
+
+class ClickAggregator:
+    """Агрегатор переходов по коротким ссылкам
+
+    Переход только увеличивает счетчики в памяти процесса. Раз в interval секунд:
+      * backend "memory" -- каждый воркер сам записывает свои счетчики в базу данных;
+      * backend "redis" -- воркер переносит счетчики в общие хэши Redis (HINCRBY),
+        а в базу данных их записывает тот воркер, который взял блокировку
+        (с CLICK_FLUSH_IN_CELERY -- только периодическая Celery-задача).
+    В обоих случаях запись в базу данных -- один запрос на batch_size строк,
+    приращения складываются в SQL, поэтому параллельные переходы не теряются.
+    Кроме счетчика ссылки копятся корзины переходов для статистики по времени
+    и источники перехода (домен referrer и семейство браузера).
+    """
+
+    def __init__(self, redis, backend=CLICK_BACKEND, interval=CLICK_FLUSH_INTERVAL, batch_size=CLICK_FLUSH_BATCH_SIZE,
+                 write_to_database=not CLICK_FLUSH_IN_CELERY):
+        if backend not in ("memory", "redis"):
+            raise ValueError(f"unknown click backend {backend!r}, expected memory or redis")
+        self.redis = redis
+        self.backend = backend
+        # False: воркеры только переносят счетчики в Redis, в базу данных их пишет Celery-задача flush_clicks
+        self.write_to_database = write_to_database or backend == "memory"
+        self.interval = interval
+        self.batch_size = batch_size
+        self._batch = ClickBatch()
+
+    def record(self, alias, referrer=None, user_agent=None):
+        """Функция учета одного перехода, не обращается ни к базе данных, ни к сети
+
+        params:
+            alias: str
+            referrer: str (заголовок Referer)
+            user_agent: str (заголовок User-Agent)
+        """
+        self._batch.add(alias, datetime.datetime.utcnow(), referrer_host(referrer), user_agent_family(user_agent))
+
+    def _drain(self):
+        batch, self._batch = self._batch, ClickBatch()
+        return batch
+
+    async def _flush_memory(self):
+        batch = self._drain()
+        if not batch:
+            return 0
+        try:
+            await write_clicks(batch, self.batch_size)
+        except Exception:
+            # переходы не теряем: вернем их в буфер до следующей попытки
+            self._batch.merge(batch)
+            raise
+        return sum(batch.deltas.values())
+
+    async def _push_to_redis(self):
+        batch = self._drain()
+        if not batch:
+            return
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                for alias, delta in batch.deltas.items():
+                    pipe.hincrby(DELTAS_KEY, alias, delta)
+                pipe.zadd(LAST_USAGE_KEY, {alias: _timestamp(moment) for alias, moment in batch.last_usage.items()}, gt=True)
+                for (alias, minute), count in batch.buckets.items():
+                    pipe.hincrby(BUCKETS_KEY, json.dumps([alias, _timestamp(minute)]), count)
+                for (alias, day, kind, value), count in batch.sources.items():
+                    pipe.hincrby(SOURCES_KEY, json.dumps([alias, _timestamp(day), kind, value]), count)
+                await pipe.execute()
+        except RedisError:
+            self._batch.merge(batch)
+            raise
+
+    async def _read_snapshot(self):
+        deltas_key, last_usage_key, buckets_key, sources_key = FLUSHING_KEYS
+        batch = ClickBatch()
+        now = datetime.datetime.utcnow()
+        last_usage = dict(await self.redis.zrange(last_usage_key, 0, -1, withscores=True))
+        for alias, delta in (await self.redis.hgetall(deltas_key)).items():
+            batch.deltas[alias.decode()] = int(delta)
+            timestamp = last_usage.get(alias)
+            batch.last_usage[alias.decode()] = now if timestamp is None else _from_timestamp(timestamp)
+        for field, count in (await self.redis.hgetall(buckets_key)).items():
+            alias, minute = json.loads(field)
+            batch.buckets[(alias, _from_timestamp(minute))] = int(count)
+        for field, count in (await self.redis.hgetall(sources_key)).items():
+            alias, day, kind, value = json.loads(field)
+            batch.sources[(alias, _from_timestamp(day), kind, value)] = int(count)
+        return batch
+
+    async def _flush_redis(self):
+        await self._push_to_redis()
+        if not self.write_to_database:
+            return 0
+        if not await self.redis.set(FLUSH_LOCK_KEY, 1, nx=True, ex=max(int(self.interval * 10), 30)):
+            return 0
+        try:
+            keys = PENDING_KEYS + FLUSHING_KEYS
+            if not await self.redis.eval(TAKE_SNAPSHOT_SCRIPT, len(keys), *keys):
+                return 0
+            batch = await self._read_snapshot()
+            # если запись упадет, снимок останется в Redis и будет записан следующей попыткой
+            await write_clicks(batch, self.batch_size)
+            await self.redis.delete(*FLUSHING_KEYS)
+            return sum(batch.deltas.values())
+        finally:
+            await self.redis.delete(FLUSH_LOCK_KEY)
+
+    async def flush(self):
+        """Функция записи накопленных переходов
+
+        returns:
+            flushed: int (количество переходов, записанных в базу данных этим вызовом)
+        """
+        if self.backend == "redis":
+            return await self._flush_redis()
+        return await self._flush_memory()
+
+    async def run(self):
+        """Функция фоновой записи раз в interval секунд, запускается в lifespan"""
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                try:
+                    await self.flush()
+                except Exception:
+                    logger.exception("click flush failed, will retry")
+        finally:
+            try:
+                if self.backend == "redis":
+                    # при остановке воркера достаточно отдать счетчики в Redis
+                    await self._push_to_redis()
+                else:
+                    await self._flush_memory()
+            except Exception:
+                logger.exception("could not save buffered clicks on shutdown")
+
+
+click_aggregator = ClickAggregator(redis_client)
@@ -0,0 +1,131 @@
+import base64
+import json
+
+from sqlalchemy import select, tuple_
+
+from .models import linking
+
+# порядок выдачи: для каждого -- столбцы ключа курсора, по убыванию (сначала новые / популярные)
+SORT_KEYS = {
+    "created": (linking.c.id,),
+    "clicks": (linking.c.number_of_usages, linking.c.id),
+}
+EXPORT_BATCH_SIZE = 1000
+
+LISTING_COLUMNS = (
+    linking.c.id,
+    linking.c.custom_alias,
+    linking.c.long_link,
+    linking.c.expires_at,
+    linking.c.creation_date,
+    linking.c.number_of_usages,
+)
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode("UTF-8")).decode("ascii")
+
+
+def decode_cursor(cursor, sort):
+    """Функция разбора курсора страницы
+
+    returns:
+        values: list of int или None (первая страница)
+
+    raises:
+        ValueError, если курсор поврежден или выдан для другой сортировки
+    """
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise ValueError("invalid cursor")
+    if not isinstance(values, list) or len(values) != len(SORT_KEYS[sort]) or not all(isinstance(v, int) for v in values):
+        raise ValueError("invalid cursor")
+    return values
+
+
+def user_links_query(user_id, sort, after, limit):
+    """Функция построения запроса страницы ссылок пользователя
+
+    Страница читается диапазоном индекса от курсора (keyset), а не через OFFSET,
+    поэтому время ответа не зависит от номера страницы. Условие "после курсора" записано
+    сравнением строк (number_of_usages, id) < (...): Postgres использует его как границу
+    обратного просмотра индекса (user_id, number_of_usages, id).
+
+    params:
+        user_id: int
+        sort: str (created или clicks)
+        after: list of int (значения ключа последней ссылки предыдущей страницы) или None
+        limit: int
+
+    returns:
+        Select
+    """
+    keys = SORT_KEYS[sort]
+    query = select(*LISTING_COLUMNS).where(linking.c.user_id == user_id)
+    if after is not None:
+        query = query.where(tuple_(*keys) < tuple_(*after))
+    return query.order_by(*(key.desc() for key in keys)).limit(limit)
+
+
+def cursor_of(row, sort):
+    return encode_cursor([getattr(row, key.name) for key in SORT_KEYS[sort]])
+
+
+def serialize_link(row):
+    return {
+        "short_link": row.custom_alias,
+        "long_link": row.long_link,
+        "expires_at": row.expires_at,
+        "creation_date": row.creation_date,
+        "clicks": row.number_of_usages,
+    }
+
+
+async def user_links_page(session, user_id, sort, cursor, limit):
+    """Функция получения страницы ссылок пользователя
+
+    params:
+        session: AsyncSession
+        user_id: int
+        sort: str (created или clicks)
+        cursor: str (next_cursor предыдущей страницы) или None
+        limit: int
+
+    returns:
+        links: list of dict
+        next_cursor: str или None (последняя страница)
+    """
+    query = user_links_query(user_id, sort, decode_cursor(cursor, sort), limit + 1)
+    rows = (await session.execute(query)).all()
+    next_cursor = cursor_of(rows[limit - 1], sort) if len(rows) > limit else None
+    return [serialize_link(row) for row in rows[:limit]], next_cursor
+
+
+async def export_user_links(session_maker, user_id, sort="created", batch_size=EXPORT_BATCH_SIZE):
+    """Функция выгрузки всех ссылок пользователя в NDJSON
+
+    Ссылки читаются пачками по batch_size тем же keyset-запросом, что и страницы, каждая пачка --
+    в своей короткой сессии: в памяти одна пачка, а соединение не занято на все время выгрузки.
+
+    params:
+        session_maker: функция, возвращающая сессию (например, replica_router.session)
+        user_id: int
+        sort: str
+        batch_size: int
+
+    returns:
+        асинхронный итератор строк NDJSON
+    """
+    after = None
+    while True:
+        async with session_maker() as session:
+            rows = (await session.execute(user_links_query(user_id, sort, after, batch_size))).all()
+        if not rows:
+            return
+        yield "".join(json.dumps(serialize_link(row), default=str) + "\n" for row in rows)
+        if len(rows) < batch_size:
+            return
+        after = [getattr(rows[-1], key.name) for key in SORT_KEYS[sort]]
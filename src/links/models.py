@@ -1,16 +1,87 @@
-from sqlalchemy import Table, Column, Integer, DateTime, MetaData, String, Boolean
+from sqlalchemy import (
+    Table, Column, Integer, SmallInteger, DateTime, MetaData, String, Boolean, Index, PrimaryKeyConstraint, and_, select,
+    text,
+)
 metadata = MetaData()
 
+# секционирована по диапазонам expires_at (links/partitions.py): истекшие секции удаляются целиком,
+# поэтому custom_alias уникален не здесь, а в таблице маршрутизации link_aliases
 linking = Table(
     "links",
     metadata,
-    Column("id", Integer, primary_key=True),
+    Column("id", Integer, nullable=False),
     Column("user_id", Integer),
     Column("long_link", String, nullable=False),
+    # sha256 канонического long_link (links.urls.url_fingerprint): поиск и дедупликация по URL
+    Column("long_link_hash", String(64), nullable=False),
     Column("custom_alias", String, nullable=False),
     Column("expires_at", DateTime, nullable=False),
     Column("last_usage", DateTime, nullable=False),
     Column("creation_date", DateTime, nullable=False),
     Column("number_of_usages", Integer, nullable=False),
-    Column("is_authorized", Boolean, nullable=False)
+    Column("is_authorized", Boolean, nullable=False),
+    # код ответа при переходе: 301, 302, 307 или 308
+    Column("redirect_status", SmallInteger, nullable=False, server_default=text("301")),
+    PrimaryKeyConstraint("id", "expires_at"),
+    Index("ix_links_custom_alias", "custom_alias"),
+    Index("ix_links_long_link_hash_id", "long_link_hash", "id"),
+    # без long_link: длина URL не ограничена, а строка btree-индекса -- нет (около 2.7KB)
+    Index(
+        "ix_links_user_id_id", "user_id", "id",
+        postgresql_include=["custom_alias", "expires_at", "creation_date", "number_of_usages"],
+    ),
+    Index("ix_links_user_id_usages_id", "user_id", "number_of_usages", "id"),
+    postgresql_partition_by="RANGE (expires_at)",
+)
+
+# короткая ссылка -> секция links, в которой она лежит; заполняется триггерами links (см. миграцию)
+link_aliases = Table(
+    "link_aliases",
+    metadata,
+    Column("custom_alias", String, primary_key=True),
+    Column("link_id", Integer, nullable=False),
+    Column("expires_at", DateTime, nullable=False),
+    Index("ix_link_aliases_expires_at", "expires_at"),
+)
+
+
+def by_alias(alias):
+    """Функция построения условия поиска ссылки по короткой ссылке
+
+    Кроме custom_alias условие сравнивает expires_at с записью link_aliases: Postgres отбрасывает
+    все секции, кроме одной, еще при выполнении запроса, и ищет ссылку по индексу одной секции,
+    а не по индексам всех.
+
+    params:
+        alias: str
+
+    returns:
+        условие для where
+    """
+    expires_at = select(link_aliases.c.expires_at).where(link_aliases.c.custom_alias == alias).scalar_subquery()
+    return and_(linking.c.custom_alias == alias, linking.c.expires_at == expires_at)
+
+# переходы по корзинам времени: granularity -- minute, hour или day, bucket -- начало корзины
+click_rollups = Table(
+    "link_click_rollups",
+    metadata,
+    Column("custom_alias", String, nullable=False),
+    Column("granularity", String(8), nullable=False),
+    Column("bucket", DateTime, nullable=False),
+    Column("clicks", Integer, nullable=False),
+    PrimaryKeyConstraint("custom_alias", "granularity", "bucket"),
+    Index("ix_link_click_rollups_granularity_bucket", "granularity", "bucket"),
+)
+
+# источники переходов по дням: kind -- referrer (домен) или user_agent (семейство браузера)
+click_sources = Table(
+    "link_click_sources",
+    metadata,
+    Column("custom_alias", String, nullable=False),
+    Column("day", DateTime, nullable=False),
+    Column("kind", String(16), nullable=False),
+    Column("value", String(255), nullable=False),
+    Column("clicks", Integer, nullable=False),
+    PrimaryKeyConstraint("custom_alias", "day", "kind", "value"),
+    Index("ix_link_click_sources_day", "day"),
 )
@@ -0,0 +1,229 @@
+import datetime
+import logging
+import re
+from collections import namedtuple
+
+from sqlalchemy import delete, text
+
+from config import LINKS_PARTITION_INTERVAL, LINKS_PARTITION_PREMAKE, LINKS_PARTITION_LOCK_TIMEOUT
+from .models import click_rollups, click_sources
+
+logger = logging.getLogger(__name__)
+
+PARTITION_INTERVALS = {"day": datetime.timedelta(days=1), "week": datetime.timedelta(weeks=1)}
+# ссылки со сроком дальше заранее созданных секций; при создании секции они переносятся в нее
+DEFAULT_PARTITION = "links_default"
+# все, что истекло до первой секции, -- создается миграцией и удаляется первой же очисткой
+EXPIRED_PARTITION = "links_expired"
+
+Partition = namedtuple("Partition", ["name", "lower", "upper"])
+
+PARTITIONS_QUERY = text(
+    "SELECT child.relname AS name, pg_get_expr(child.relpartbound, child.oid) AS bound "
+    "FROM pg_inherits "
+    "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+    "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+    "WHERE parent.relname = 'links'"
+)
+BOUND = re.compile(r"FROM \((?:'([^']+)'|MINVALUE)\) TO \((?:'([^']+)'|MAXVALUE)\)")
+
+# освобождение коротких ссылок секции в таблице маршрутизации link_aliases перед ее удалением
+RELEASE_ALIASES = text(
+    "DELETE FROM link_aliases "
+    "USING unnest(CAST(:aliases AS varchar[]), CAST(:ids AS integer[])) AS released(alias, id) "
+    "WHERE link_aliases.custom_alias = released.alias AND link_aliases.link_id = released.id "
+    "RETURNING link_aliases.custom_alias"
+)
+
+
+def partition_start(moment, interval=LINKS_PARTITION_INTERVAL):
+    """Функция получения начала секции, в которую попадает момент (UTC, неделя -- с понедельника)"""
+    start = datetime.datetime(moment.year, moment.month, moment.day)
+    if interval == "week":
+        start -= datetime.timedelta(days=start.weekday())
+    return start
+
+
+def partition_ranges(start, end, interval=LINKS_PARTITION_INTERVAL):
+    """Функция разбиения отрезка времени на границы секций
+
+    params:
+        start: datetime
+        end: datetime
+        interval: str (day или week)
+
+    returns:
+        ranges: list of (lower, upper), первая секция содержит start, последняя -- end
+    """
+    step = PARTITION_INTERVALS[interval]
+    lower = partition_start(start, interval)
+    ranges = []
+    while lower <= end:
+        ranges.append((lower, lower + step))
+        lower += step
+    return ranges
+
+
+def partition_name(lower):
+    return f"links_p{lower:%Y%m%d}"
+
+
+def _literal(moment):
+    return f"'{moment:%Y-%m-%d %H:%M:%S}+00'"
+
+
+def create_partition_sql(name, lower, upper):
+    """Функция построения CREATE TABLE секции links
+
+    Границы подставляются литералами: DDL не принимает параметров, а значения получены из datetime.
+    """
+    lower_bound = "MINVALUE" if lower is None else _literal(lower)
+    return f"CREATE TABLE {name} PARTITION OF links FOR VALUES FROM ({lower_bound}) TO ({_literal(upper)})"
+
+
+def _parse_bound(value):
+    if value is None:
+        return None
+    # pg_get_expr печатает timestamptz в часовом поясе сессии: "2026-10-19 03:00:00+03"
+    if re.search(r"[+-]\d\d$", value):
+        value += ":00"
+    moment = datetime.datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+async def list_partitions(session):
+    """Функция получения секций links по каталогу Postgres
+
+    returns:
+        partitions: list of Partition (name, lower, upper), упорядочены по upper;
+            lower -- None для секции от MINVALUE, секция DEFAULT в список не входит
+    """
+    partitions = []
+    for row in (await session.execute(PARTITIONS_QUERY)).all():
+        match = BOUND.search(row.bound)
+        if match is None:
+            continue
+        partitions.append(Partition(row.name, _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+    return sorted(partitions, key=lambda partition: partition.upper)
+
+
+async def _set_lock_timeout(session, timeout):
+    # DDL над links ждет эксклюзивную блокировку; без таймаута очередь за ней остановила бы все переходы
+    await session.execute(text(f"SET LOCAL lock_timeout = '{int(timeout * 1000)}ms'"))
+
+
+async def create_partition(session, lower, upper, timeout=LINKS_PARTITION_LOCK_TIMEOUT):
+    """Функция создания секции [lower, upper) в текущей транзакции
+
+    Если в секции DEFAULT уже есть ссылки из этого диапазона, Postgres не даст создать секцию,
+    поэтому DEFAULT на время отсоединяется, а ссылки переносятся в новую секцию
+    (триггер links_claim_alias узнает их по id и оставляет записи link_aliases на месте).
+
+    returns:
+        name: str
+    """
+    name = partition_name(lower)
+    await _set_lock_timeout(session, timeout)
+    bounds = {"lower": lower, "upper": upper}
+    in_default = await session.scalar(
+        text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE expires_at >= :lower AND expires_at < :upper)"),
+        bounds,
+    )
+    if not in_default:
+        await session.execute(text(create_partition_sql(name, lower, upper)))
+        return name
+    await session.execute(text(f"ALTER TABLE links DETACH PARTITION {DEFAULT_PARTITION}"))
+    await session.execute(text(create_partition_sql(name, lower, upper)))
+    await session.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE expires_at >= :lower AND expires_at < :upper RETURNING *) "
+        "INSERT INTO links SELECT * FROM moved"
+    ), bounds)
+    await session.execute(text(f"ALTER TABLE links ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    return name
+
+
+async def ensure_partitions(session_maker, now=None, premake=LINKS_PARTITION_PREMAKE, interval=LINKS_PARTITION_INTERVAL):
+    """Функция создания секций links на premake интервалов вперед
+
+    Ссылки, для которых секции еще нет, попадают в DEFAULT, поэтому опоздание этой функции
+    не ломает создание ссылок, а лишь откладывает их удаление целой секцией.
+
+    params:
+        session_maker: async_sessionmaker
+        now: datetime (UTC)
+        premake: int
+        interval: str (day или week)
+
+    returns:
+        created: list of str (имена созданных секций)
+    """
+    now = now or datetime.datetime.utcnow()
+    async with session_maker() as session:
+        partitions = await list_partitions(session)
+    created = []
+    for lower, upper in partition_ranges(now, now + premake * PARTITION_INTERVALS[interval], interval):
+        overlapping = [p for p in partitions if (p.lower is None or p.lower < upper) and p.upper > lower]
+        if overlapping:
+            if any(p.lower != lower or p.upper != upper for p in overlapping if p.lower is not None):
+                logger.warning("partition %s..%s overlaps %s, LINKS_PARTITION_INTERVAL changed?", lower, upper,
+                               [p.name for p in overlapping])
+            continue
+        async with session_maker() as session:
+            created.append(await create_partition(session, lower, upper))
+            await session.commit()
+    return created
+
+
+async def expired_partitions(session_maker, cutoff):
+    """Функция получения секций, все ссылки которых истекли к моменту cutoff"""
+    async with session_maker() as session:
+        partitions = await list_partitions(session)
+    return [partition for partition in partitions if partition.upper <= cutoff]
+
+
+async def delete_click_stats(session, aliases):
+    """Функция удаления статистики переходов освобожденных коротких ссылок, как при DELETE /links/{short_code}:
+    иначе ссылка, получившая ту же короткую ссылку, показала бы переходы прежней
+    Вызывается в транзакции, освобождающей короткие ссылки
+
+    params:
+        session: AsyncSession
+        aliases: list of str
+    """
+    if aliases:
+        for table in (click_rollups, click_sources):
+            await session.execute(delete(table).where(table.c.custom_alias.in_(aliases)))
+
+
+async def release_batch(session_maker, partition, last_id, batch_size):
+    """Функция освобождения очередной пачки коротких ссылок секции в link_aliases
+    Статистика переходов освобожденных ссылок удаляется в той же транзакции
+
+    returns:
+        rows: list (id, custom_alias, long_link) -- пустой, когда секция пройдена
+    """
+    async with session_maker() as session:
+        rows = (await session.execute(
+            text(f"SELECT id, custom_alias, long_link FROM {partition.name} WHERE id > :last_id ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": batch_size},
+        )).all()
+        if rows:
+            # только действительно освобожденные: повторно прочитанная после сбоя пачка уже освобождена,
+            # и ее короткие ссылки могли занять новые ссылки со своей статистикой
+            released = (await session.execute(RELEASE_ALIASES, {
+                "aliases": [row.custom_alias for row in rows],
+                "ids": [row.id for row in rows],
+            })).scalars().all()
+            await delete_click_stats(session, released)
+            await session.commit()
+    return rows
+
+
+async def drop_partition(session_maker, partition, timeout=LINKS_PARTITION_LOCK_TIMEOUT):
+    """Функция удаления секции целиком: ни построчного DELETE, ни мертвых строк для VACUUM"""
+    async with session_maker() as session:
+        await _set_lock_timeout(session, timeout)
+        await session.execute(text(f"DROP TABLE {partition.name}"))
+        await session.commit()
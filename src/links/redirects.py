@@ -0,0 +1,168 @@
+import datetime
+import json
+from urllib.parse import quote
+
+from sqlalchemy import select
+
+from config import EDGE_REDIRECT_ENABLED, REDIRECT_MAX_AGE
+from database import async_session_maker, replica_router
+from .bloom import alias_filter
+from .cache import redirect_cache, make_entry, is_expired
+from .clicks import click_aggregator
+from .models import linking, by_alias
+
+NOT_FOUND_DETAIL = "long link not found! check short link"
+EXPIRED_DETAIL = "short link has expired"
+# те же символы, что оставляет без кодирования starlette.responses.RedirectResponse
+LOCATION_SAFE = ":/%#?=@[]!$&'()*+,;"
+# постоянные переходы кэшируются браузерами и CDN, временные всегда доходят до сервиса и учитываются
+PERMANENT_STATUSES = {301, 308}
+NO_STORE = "no-store"
+
+
+class LinkNotFound(Exception):
+    """Короткой ссылки нет в базе данных"""
+
+
+class LinkExpired(Exception):
+    """Срок жизни короткой ссылки истек"""
+
+
+async def resolve_link(short_code):
+    """Функция получения оригинальной ссылки для перехода
+
+    Оригинальная ссылка берется из кэша переходов, база данных (реплика) запрашивается только при промахе.
+    Если реплика еще не получила только что созданную ссылку, она перечитывается с primary.
+    Несуществующие ссылки отсекаются фильтром Блума и кэшем отсутствующих ссылок без запроса к базе данных.
+    Срок жизни ссылки проверяется по записи кэша.
+
+    params:
+        short_code: str
+
+    returns:
+        entry: dict (long_link, expires_at)
+
+    raises:
+        LinkNotFound, LinkExpired
+    """
+    entry = await redirect_cache.get(short_code)
+    if entry is None:
+        if not await alias_filter.might_exist(short_code):
+            raise LinkNotFound(short_code)
+        generation = redirect_cache.generation
+        query = select(linking.c.long_link, linking.c.expires_at, linking.c.redirect_status).where(by_alias(short_code))
+        async with replica_router.session() as session:
+            result = (await session.execute(query)).first()
+        if result is None and replica_router.enabled:
+            async with async_session_maker() as session:
+                result = (await session.execute(query)).first()
+
+        if result is None:
+            await alias_filter.remember_missing(short_code)
+            raise LinkNotFound(short_code)
+
+        entry = make_entry(result.long_link, result.expires_at, result.redirect_status)
+        await redirect_cache.set(short_code, entry, generation)
+
+    if is_expired(entry):
+        raise LinkExpired(short_code)
+    return entry
+
+
+def cache_control(entry, now=None, max_age=REDIRECT_MAX_AGE):
+    """Функция получения заголовка Cache-Control для перехода
+
+    Постоянный переход (301, 308) можно кэшировать до истечения ссылки, но не дольше max_age:
+    это предел, на который изменение или удаление ссылки может не дойти до браузеров и CDN.
+    Временный переход (302, 307) не кэшируется, поэтому каждый переход по нему учитывается.
+
+    params:
+        entry: dict (make_entry)
+        now: datetime (UTC)
+        max_age: int
+
+    returns:
+        value: str
+    """
+    if entry["status"] not in PERMANENT_STATUSES:
+        return NO_STORE
+    if entry["expires_at"] is not None:
+        remaining = (entry["expires_at"] - (now or datetime.datetime.utcnow())).total_seconds()
+        max_age = max(min(max_age, int(remaining)), 0)
+    return f"public, max-age={max_age}"
+
+
+def _error_headers(detail):
+    # как у JSONResponse FastAPI: ответы fast path и ручки совпадают байт в байт
+    body = json.dumps({"detail": detail}, ensure_ascii=False, separators=(",", ":")).encode("UTF-8")
+    # 404 и 410 не кэшируются: короткую ссылку могут создать или освободить
+    headers = [
+        (b"content-length", str(len(body)).encode("latin-1")),
+        (b"content-type", b"application/json"),
+        (b"cache-control", NO_STORE.encode("latin-1")),
+    ]
+    return headers, body
+
+
+# заголовки и тела, не зависящие от ссылки, собираются один раз при импорте; сами сообщения -- на каждый
+# ответ, потому что middleware снаружи (MetricsMiddleware с Server-Timing) заменяет в них заголовки
+ERRORS = {
+    LinkNotFound: (404, *_error_headers(NOT_FOUND_DETAIL)),
+    LinkExpired: (410, *_error_headers(EXPIRED_DETAIL)),
+}
+REDIRECT_HEADERS = [(b"content-length", b"0")]
+
+
+class RedirectFastPath:
+    """ASGI middleware, обслуживающее GET /links/{short_code} до маршрутизации FastAPI
+
+    Переход -- самый частый запрос, а разбор пути, валидация параметров, объект Request
+    и RedirectResponse FastAPI делают на каждый переход больше работы, чем сам поиск в кэше.
+    Middleware сам находит ссылку (resolve_link) и отвечает сырым ASGI-сообщением
+    с заранее собранными заголовками; сессия базы данных открывается только при промахе кэша.
+    Ответы совпадают с ответами activate_link, остальные запросы передаются приложению.
+
+    Пути, совпадающие с другими GET-ручками того же уровня (например, /links/mine), не перехватываются.
+    В scope записывается маршрут activate_link, поэтому MetricsMiddleware считает переходы
+    по тому же шаблону пути, что и без этого middleware.
+    """
+
+    def __init__(self, app, router, endpoint, enabled=EDGE_REDIRECT_ENABLED):
+        self.app = app
+        self.enabled = enabled
+        self.route = next(route for route in router.routes if getattr(route, "endpoint", None) is endpoint)
+        self.prefix = self.route.path.rsplit("/", 1)[0] + "/"
+        # соседние ручки с постоянным путем: их маршрутизирует FastAPI
+        self.reserved = {
+            route.path[len(self.prefix):] for route in router.routes
+            if route.path.startswith(self.prefix) and "{" not in route.path and "GET" in getattr(route, "methods", ())
+        }
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+        short_code = path[len(self.prefix):]
+        if not path.startswith(self.prefix) or not short_code or "/" in short_code or short_code in self.reserved:
+            await self.app(scope, receive, send)
+            return
+
+        scope["route"] = self.route
+        try:
+            entry = await resolve_link(short_code)
+        except (LinkNotFound, LinkExpired) as error:
+            status_code, headers, body = ERRORS[type(error)]
+        else:
+            referrer = user_agent = None
+            for name, value in scope["headers"]:
+                if name == b"referer":
+                    referrer = value.decode("latin-1")
+                elif name == b"user-agent":
+                    user_agent = value.decode("latin-1")
+            click_aggregator.record(short_code, referrer, user_agent)
+            location = quote(entry["long_link"], safe=LOCATION_SAFE).encode("latin-1")
+            headers = [*REDIRECT_HEADERS, (b"cache-control", cache_control(entry).encode("latin-1")), (b"location", location)]
+            status_code, body = entry["status"], b""
+        await send({"type": "http.response.start", "status": status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -1,18 +1,35 @@
-import os
-import hashlib
 import pytz
 import time, datetime
+from typing import Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Request, status
-from fastapi.responses import RedirectResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import RedirectResponse, StreamingResponse
 from fastapi_cache.decorator import cache
 
-from sqlalchemy import select, insert, delete, update
+from sqlalchemy import select, insert, delete, update, exists
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import get_async_session
+from config import (
+    ALIAS_MAX_ATTEMPTS, STATS_MAX_BUCKETS, STATS_CACHE_TTL, SEARCH_CACHE_TTL, SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE,
+    LISTING_PAGE_SIZE, LISTING_MAX_PAGE_SIZE,
+)
+from database import get_async_session, get_read_session, replica_router
+from executor import cpu_executor, ExecutorSaturated
 from .schemas import LinksCreate
-from .models import linking
+from .models import linking, link_aliases, click_rollups, click_sources, by_alias
+from .aliases import alias_generator, generate_aliases
+from .alias_pool import alias_pool
+from .bloom import alias_filter
+from .bulk import bulk_shorten
+from .cache import (
+    invalidate_links,
+    RESPONSE_CACHE_NAMESPACE, stats_key_builder, search_key_builder, conditional_get,
+)
+from .clicks import click_aggregator, GRANULARITIES
+from .listing import user_links_page, export_user_links
+from .redirects import resolve_link, cache_control, LinkNotFound, LinkExpired, NOT_FOUND_DETAIL, EXPIRED_DETAIL, NO_STORE
+from .stats import click_histogram, click_breakdown, to_utc_naive
+from .urls import url_fingerprint
 from models import User
 
 from auth.users import auth_backend, current_active_user, fastapi_users
@@ -37,20 +54,99 @@ def change_time(expires_at):
     datetime_str = datetime.datetime.strptime(datetime_str, "%Y-%m-%d %H:%M:%S.%f")
     return datetime_str
 
-def hash_with_salt(long_link):
-    """Функция генерации хэш-функции для замены ссылки 
-    Возвращает хэш-функцию с учетом небольшого рандома для исключения 
+async def insert_link(session, table_values):
+    """Функция вставки короткой ссылки одной командой INSERT
+    Занятость короткой ссылки проверяет триггер links_claim_alias по link_aliases:
+    при конфликте строка не вставляется и RETURNING ничего не возвращает
 
-    params: 
+    params:
+        session: AsyncSession
+        table_values: dict
+
+    returns:
+        inserted: bool (False, если такая короткая ссылка уже есть в базе данных)
+    """
+    statement = insert(linking).values(**table_values).returning(linking.c.id)
+    result = await session.execute(statement)
+    return result.first() is not None
+
+async def find_duplicate(session, table_values):
+    """Функция поиска уже созданной пользователем короткой ссылки на тот же URL
+    с тем же кодом перехода, которая проживет не меньше запрошенного срока
+
+    params:
+        session: AsyncSession
+        table_values: dict (user_id, long_link_hash, expires_at, redirect_status)
+
+    returns:
+        alias: str или None
+    """
+    query = select(linking.c.custom_alias).where(
+        linking.c.long_link_hash == table_values['long_link_hash'],
+        linking.c.user_id == table_values['user_id'],
+        linking.c.expires_at >= table_values['expires_at'],
+        linking.c.redirect_status == table_values['redirect_status'],
+    ).limit(1)
+    return await session.scalar(query)
+
+def owned_user_id(user, user_id):
+    """Функция получения links.user_id текущего пользователя
+
+    params:
+        user: User
+        user_id: int или None (переданный клиентом; должен совпадать с links_user_id пользователя)
+
+    returns:
+        user_id: int
+
+    raises:
+        HTTPException 403, если передан чужой user_id
+    """
+    if user_id is not None and user_id != user.links_user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="links of another user are not available")
+    return user.links_user_id
+
+def server_busy():
+    # пул CPU (executor.py) заполнен: клиенту лучше повторить запрос, чем ждать в очереди
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="server is busy, try again later", headers={"Retry-After": "1"}
+    )
+
+async def next_alias(long_link):
+    """Функция получения кандидата в короткие ссылки: из пула Redis, а если он пуст -- от генератора
+    Если генератору нужен пул CPU, а его очередь заполнена, возвращается 429
+
+    params:
         long_link: str
 
-    returns: 
-        hash_object: str
+    returns:
+        alias: str
     """
-    salt = os.urandom(16)
-    hash_object = hashlib.pbkdf2_hmac('sha256', long_link.encode('UTF-8'), salt, 100000)
+    alias = await alias_pool.pop()
+    if alias is not None:
+        return alias
+    try:
+        return (await generate_aliases([long_link]))[0]
+    except ExecutorSaturated:
+        raise server_busy()
+
+async def generate_unique_alias(session, long_link):
+    """Функция генерации короткой ссылки, которой еще нет в базе данных
+    При коллизии пробует следующего кандидата, не более ALIAS_MAX_ATTEMPTS раз
 
-    return hash_object
+    params:
+        session: AsyncSession
+        long_link: str
+
+    returns:
+        alias: str
+    """
+    for _ in range(ALIAS_MAX_ATTEMPTS):
+        alias = await next_alias(long_link)
+        query = select(exists().where(link_aliases.c.custom_alias == alias))
+        if not await session.scalar(query):
+            return alias
+    raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="could not generate unique short link, try again")
 
 @router.post("/shorten")
 async def add_link(
@@ -64,72 +160,162 @@ async def add_link(
         custom_alias: str (при передаче своей собственной короткой ссылки необходимо указать длину 10)
         expires_at: datetime
 
+    Если своя короткая ссылка не указана, а у пользователя уже есть ссылка на тот же URL
+    (с точностью до канонического вида) со сроком не меньше запрошенного, возвращается она.
+
     returns: dict
         status: str
         short_link: str
     """
     user_values = new_link.model_dump()
-    query = select(linking.c.long_link)
-    result = await session.execute(query)
-    result = result.scalars().all()
-
-    if len(user_values['custom_alias']) == 10:
-        query = select(linking.c.custom_alias)
-        result = await session.execute(query)
-        result = result.scalars().all()
-        if user_values['custom_alias'] in result:
-            return {"status": "error", "data": "This alias is already in database. Try another one!"}
-    else:
-
-        hash_object = hash_with_salt(long_link=user_values['long_link'])
-        user_values['custom_alias'] =  hash_object.hex()[:10]
-
     table_values = {
         'user_id': user_values['user_id'],
         'long_link': user_values['long_link'],
+        'long_link_hash': url_fingerprint(user_values['long_link']),
         'custom_alias': user_values['custom_alias'],
         'expires_at': change_time(user_values['expires_at']),
         'last_usage': datetime.datetime.utcnow(),
         'number_of_usages': 0,
-        'is_authorized': True
+        'is_authorized': True,
+        'redirect_status': user_values['redirect_status'],
     }
 
-    statement = insert(linking).values(**table_values)
-    await session.execute(statement)
+    if len(user_values['custom_alias']) == 10:
+        if not await insert_link(session, table_values):
+            return {"status": "error", "data": "This alias is already in database. Try another one!"}
+    else:
+        duplicate = await find_duplicate(session, table_values)
+        if duplicate is not None:
+            return {"status": "success", "short_link": duplicate}
+        for _ in range(ALIAS_MAX_ATTEMPTS):
+            table_values['custom_alias'] = await next_alias(user_values['long_link'])
+            if await insert_link(session, table_values):
+                break
+        else:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="could not generate unique short link, try again")
+
     await session.commit()
-    return {"status": "success", "short_link": user_values['custom_alias']}
+    await alias_filter.add(table_values['custom_alias'])
+    # поиск по этой оригинальной ссылке мог закэшировать "не найдено"
+    await invalidate_links(long_links=[table_values['long_link']], created=[table_values['custom_alias']])
+    return {"status": "success", "short_link": table_values['custom_alias']}
+
+@router.post("/shorten/bulk")
+async def add_links_bulk(request: Request):
+    """Функция массового создания коротких ссылок
+    Принимает JSON-массив или NDJSON (по объекту LinksCreate на строку, custom_alias необязателен),
+    читает тело потоково и вставляет ссылки пачками по BULK_CHUNK_SIZE
+
+    params:
+        тело запроса: list of LinksCreate
+
+    returns: NDJSON
+        по строке на каждую ссылку (index, status, short_link или data) и итоговая строка (status=done, created, failed)
+    """
+    if alias_generator.cpu_bound and cpu_executor.saturated:
+        raise server_busy()
+    return StreamingResponse(bulk_shorten(request.stream()), media_type="application/x-ndjson")
 
 @router.get("/links/search")
-@cache(expire=180)
+@cache(expire=SEARCH_CACHE_TTL, namespace=RESPONSE_CACHE_NAMESPACE, key_builder=search_key_builder)
 async def search_link(
     url: str, 
-    session: AsyncSession = Depends(get_async_session), 
+    cursor: int = 0,
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_read_session), 
     status_code=status.HTTP_200_OK
 ):
-    """Функция получения оригинальной ссылки по короткой ссылке 
+    """Функция получения всех коротких ссылок на оригинальную ссылку (с точностью до канонического вида URL)
+    Ищет по отпечатку long_link_hash, результат отдается страницами по limit ссылок
 
     params: 
         url: str
+        cursor: int (next_cursor предыдущей страницы, для первой страницы -- 0)
+        limit: int
 
     returns: dict
         status: str
         url: str
+        aliases: list of str
+        next_cursor: int или None (None -- страница последняя)
     """
-    query = select(linking.c.custom_alias).where(linking.c.long_link == url)
-    result = await session.execute(query)
-    result = result.all()
-    if len(result) == 0:
+    query = select(linking.c.id, linking.c.custom_alias).where(
+        linking.c.long_link_hash == url_fingerprint(url),
+        linking.c.id > cursor,
+    ).order_by(linking.c.id).limit(limit + 1)
+    result = (await session.execute(query)).all()
+    if len(result) == 0 and cursor == 0:
         return {"status": "failed", "data": f"no long link {url} in database"}
 
-    return result[0]
+    page = result[:limit]
+    return {
+        "status": "success",
+        "url": url,
+        "aliases": [row.custom_alias for row in page],
+        "next_cursor": page[-1].id if len(result) > limit else None,
+    }
 
-@router.get("/{short_code}")
-@cache(expire=180)
-async def activate_link(
-    short_code, 
-    session: AsyncSession = Depends(get_async_session)
+@router.get("/mine")
+async def list_user_links(
+    user_id: Optional[int] = None,
+    sort: Literal["created", "clicks"] = "created",
+    cursor: Optional[str] = None,
+    limit: int = Query(LISTING_PAGE_SIZE, ge=1, le=LISTING_MAX_PAGE_SIZE),
+    user: User = Depends(current_active_user),
+    session: AsyncSession = Depends(get_read_session),
 ):
+    """Функция получения ссылок текущего пользователя со статистикой переходов страницами
+    Отдаются только ссылки с user_id = links_user_id пользователя (выдается при регистрации).
+    Страницы читаются по курсору диапазоном индекса (user_id, ...), поэтому глубина страницы
+    не влияет ни на время ответа, ни на память
+
+    params:
+        user_id: int (необязательный; links_user_id пользователя, чужой -- 403)
+        sort: str (created -- сначала новые, clicks -- сначала популярные;
+            при clicks ссылка, набравшая переходы между запросами страниц, может сдвинуться)
+        cursor: str (next_cursor предыдущей страницы, для первой страницы не передается)
+        limit: int
+
+    returns: dict
+        status: str
+        links: list of dict (short_link, long_link, expires_at, creation_date, clicks)
+        next_cursor: str или None (None -- страница последняя)
+    """
+    try:
+        links, next_cursor = await user_links_page(session, owned_user_id(user, user_id), sort, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"status": "success", "links": links, "next_cursor": next_cursor}
+
+@router.get("/mine/export")
+async def export_user_links_ndjson(
+    user_id: Optional[int] = None,
+    sort: Literal["created", "clicks"] = "created",
+    user: User = Depends(current_active_user),
+):
+    """Функция выгрузки всех ссылок текущего пользователя
+    Ответ отдается потоком NDJSON, ссылки читаются из базы данных пачками
+
+    params:
+        user_id: int (необязательный; links_user_id пользователя, чужой -- 403)
+        sort: str (created или clicks)
+
+    returns: NDJSON
+        по строке на ссылку (short_link, long_link, expires_at, creation_date, clicks)
+    """
+    return StreamingResponse(
+        export_user_links(replica_router.session, owned_user_id(user, user_id), sort), media_type="application/x-ndjson"
+    )
+
+@router.get("/{short_code}")
+async def activate_link(short_code: str, request: Request):
     """Функция перехода на оригинальный сайт по короткой ссылке 
+    Ссылка ищется через resolve_link (links/redirects.py): кэш переходов, при промахе -- реплика.
+    Для несуществующей ссылки возвращается 404, для истекшей -- 410.
+    Переход учитывается в буфере и записывается в базу данных в фоне.
+    Код ответа -- redirect_status ссылки, Cache-Control -- по сроку жизни ссылки (links/redirects.cache_control).
+    При EDGE_REDIRECT_ENABLED эти запросы с теми же ответами обслуживает RedirectFastPath
+    до маршрутизации FastAPI, а ручка остается в схеме OpenAPI и работает при выключенном fast path
 
     params: 
         short_code: str
@@ -137,25 +323,17 @@ async def activate_link(
     returns: 
         Redirect
     """
-    query = select(linking.c.long_link).where(linking.c.custom_alias == short_code)
-    result = await session.execute(query)
-    result = result.scalars().all()
-    
-    if len(result) == 0:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="long link not found! check short link")
-
-    query_num_usages = select(linking.c.number_of_usages).where(linking.c.custom_alias == short_code)
-    result_num_usages = await session.execute(query_num_usages)
-    result_num_usages = result_num_usages.scalars().all()
-
-    statement = update(linking).where(linking.c.custom_alias == short_code).values(
-        {"number_of_usages": result_num_usages[0] + 1,
-        "last_usage": datetime.datetime.utcnow()}
+    try:
+        entry = await resolve_link(short_code)
+    except LinkNotFound:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail=NOT_FOUND_DETAIL, headers={"Cache-Control": NO_STORE})
+    except LinkExpired:
+        raise HTTPException(status.HTTP_410_GONE, detail=EXPIRED_DETAIL, headers={"Cache-Control": NO_STORE})
+
+    click_aggregator.record(short_code, request.headers.get("referer"), request.headers.get("user-agent"))
+    return RedirectResponse(
+        url=entry["long_link"], status_code=entry["status"], headers={"Cache-Control": cache_control(entry)}
     )
-    await session.execute(statement)
-    await session.commit()
-
-    return RedirectResponse(url=result[0], status_code=status.HTTP_301_MOVED_PERMANENTLY)
 
 @router.delete("/{short_code}")
 async def delete_link(
@@ -172,9 +350,13 @@ async def delete_link(
         status: str
     """
     
-    statement = delete(linking).where(linking.c.custom_alias == short_code)
-    await session.execute(statement)
+    statement = delete(linking).where(by_alias(short_code)).returning(linking.c.long_link)
+    long_links = (await session.execute(statement)).scalars().all()
+    await session.execute(delete(click_rollups).where(click_rollups.c.custom_alias == short_code))
+    await session.execute(delete(click_sources).where(click_sources.c.custom_alias == short_code))
     await session.commit()
+    await invalidate_links([short_code], long_links)
+    await alias_filter.remember_missing(short_code, deleted=True)
 
     return {"status": "success"}
 
@@ -194,51 +376,85 @@ async def change_link(
         short_link: str
     """
     
-    query = select(linking.c.long_link).where(linking.c.custom_alias == short_code)
+    query = select(linking.c.long_link).where(by_alias(short_code))
     result = await session.execute(query)
     result = result.all()
 
     if len(result) == 0:
         return {"status": "failed", "data": f"no short link {short_code} in database"}
 
-    hash_object = hash_with_salt(long_link=result[0][0])
-    new_short_link = hash_object.hex()[:10]
+    new_short_link = await generate_unique_alias(session, result[0][0])
 
-    statement = update(linking).where(linking.c.custom_alias == short_code).values(
+    statement = update(linking).where(by_alias(short_code)).values(
         {"custom_alias": new_short_link}
     )
     await session.execute(statement)
+    # статистика переходов переезжает вместе со ссылкой
+    for table in (click_rollups, click_sources):
+        await session.execute(
+            update(table).where(table.c.custom_alias == short_code).values(custom_alias=new_short_link)
+        )
     await session.commit()
+    await invalidate_links([short_code], [result[0][0]], created=[new_short_link])
+    await alias_filter.add(new_short_link)
+    await alias_filter.remember_missing(short_code, deleted=True)
 
     return {"status": "success", "short_link": new_short_link}
 
 @router.get("/{short_code}/stats")
-@cache(expire=180)
+@conditional_get
+@cache(expire=STATS_CACHE_TTL, namespace=RESPONSE_CACHE_NAMESPACE, key_builder=stats_key_builder)
 async def get_statistics_link(
     short_code: str, 
-    session: AsyncSession = Depends(get_async_session)
+    from_: Optional[datetime.datetime] = Query(None, alias="from"),
+    to: Optional[datetime.datetime] = None,
+    granularity: Literal["minute", "hour", "day"] = "hour",
+    session: AsyncSession = Depends(get_read_session)
 ):
     """Функция получения статистик короткой ссылки: оригинальная ссылка, дата создания, количество переходов, дата последнего использования
+    Если передан from, дополнительно возвращает переходы по корзинам времени и по источникам за период
+    Ответ содержит ETag по содержимому: запрос с совпадающим If-None-Match получает 304 без тела
 
     params: 
         short_code: str
+        from: datetime (необязательный, начало периода)
+        to: datetime (необязательный, конец периода, по умолчанию -- сейчас)
+        granularity: str (minute, hour или day, по умолчанию hour)
 
     returns: dict
         real_link: str
         creation_date: datetime
         number_of_usages: int
         time_of_last_usage: datetime
+        clicks by time: list of dict (bucket, clicks) -- только при from
+        referrers: dict (домен -> переходы) -- только при from
+        user agents: dict (семейство браузера -> переходы) -- только при from
     """
-    query = select(linking).where(linking.c.custom_alias == str(short_code))
+    query = select(
+        linking.c.long_link, linking.c.creation_date, linking.c.number_of_usages, linking.c.last_usage
+    ).where(by_alias(str(short_code)))
     result = await session.execute(query)
     result = result.all()
 
     if len(result) == 0:
         return {"status": "failed", "data": f"no short link {short_code} in database"}
 
-    return {
-        "real link": result[0][2],
-        "creation date": result[0][6],
-        "number of usages": result[0][7],
-        "time of last usage": result[0][5]
+    statistics = {
+        "real link": result[0].long_link,
+        "creation date": result[0].creation_date,
+        "number of usages": result[0].number_of_usages,
+        "time of last usage": result[0].last_usage
     }
+    if from_ is None:
+        return statistics
+
+    start = to_utc_naive(from_)
+    end = to_utc_naive(to) if to is not None else datetime.datetime.utcnow()
+    if (end - start) / GRANULARITIES[granularity] > STATS_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"too many {granularity} buckets in the period, use a coarser granularity",
+        )
+    statistics["clicks by time"] = await click_histogram(session, short_code, start, end, granularity)
+    statistics.update(await click_breakdown(session, short_code, start, end))
+    return statistics
@@ -1,12 +1,17 @@
 from datetime import datetime
+from typing import Literal
 
 from pydantic import BaseModel
 
+from config import REDIRECT_DEFAULT_STATUS
+
 class LinksCreate(BaseModel):
     user_id: int
     long_link: str
     custom_alias: str
     expires_at: datetime
+    # 301/308 браузеры и CDN кэшируют (переходы из их кэша не учитываются), 302/307 -- нет
+    redirect_status: Literal[301, 302, 307, 308] = REDIRECT_DEFAULT_STATUS
 
 class LinksRedirect(BaseModel):
     short_link: str
@@ -21,4 +26,7 @@ class LinkPopularity(BaseModel):
     short_link: str
 
 class LinkOriginal(BaseModel):
-    long_link: str
\ No newline at end of file
+    long_link: str
+
+class LinksBulkItem(LinksCreate):
+    custom_alias: str = ""
@@ -0,0 +1,64 @@
+import datetime
+
+from sqlalchemy import select, func
+
+from .clicks import truncate_time
+from .models import click_rollups, click_sources
+
+
+def to_utc_naive(moment):
+    """Функция перевода времени из запроса в UTC без часового пояса, как хранятся корзины"""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+async def click_histogram(session, alias, start, end, granularity):
+    """Функция получения числа переходов по корзинам времени из заранее свернутых корзин
+    Читает только корзины из диапазона по первичному ключу, то есть O(корзин), а не O(переходов)
+
+    params:
+        session: AsyncSession
+        alias: str
+        start: datetime (включительно, округляется вниз до начала корзины)
+        end: datetime (не включительно)
+        granularity: str (minute, hour или day)
+
+    returns:
+        histogram: list of dict (bucket, clicks), пустые корзины не возвращаются
+    """
+    query = (
+        select(click_rollups.c.bucket, click_rollups.c.clicks)
+        .where(
+            click_rollups.c.custom_alias == alias,
+            click_rollups.c.granularity == granularity,
+            click_rollups.c.bucket >= truncate_time(start, granularity),
+            click_rollups.c.bucket < end,
+        )
+        .order_by(click_rollups.c.bucket)
+    )
+    result = await session.execute(query)
+    return [{"bucket": bucket, "clicks": clicks} for bucket, clicks in result.all()]
+
+
+async def click_breakdown(session, alias, start, end):
+    """Функция получения переходов по источникам (домен referrer и семейство браузера) за период
+    Источники хранятся по дням, поэтому границы периода округляются до дня
+
+    returns: dict
+        referrers: dict (домен -> переходы)
+        user agents: dict (семейство браузера -> переходы)
+    """
+    query = (
+        select(click_sources.c.kind, click_sources.c.value, func.sum(click_sources.c.clicks))
+        .where(
+            click_sources.c.custom_alias == alias,
+            click_sources.c.day >= truncate_time(start, "day"),
+            click_sources.c.day < end,
+        )
+        .group_by(click_sources.c.kind, click_sources.c.value)
+    )
+    breakdown = {"referrers": {}, "user agents": {}}
+    for kind, value, clicks in (await session.execute(query)).all():
+        breakdown["referrers" if kind == "referrer" else "user agents"][value] = int(clicks)
+    return breakdown
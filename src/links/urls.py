@@ -0,0 +1,64 @@
+import re
+import string
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+PERCENT_ESCAPE = re.compile(r"%([0-9A-Fa-f]{2})")
+# символы, кодирование которых не меняет смысл URL (RFC 3986, 2.3)
+UNRESERVED = frozenset(string.ascii_letters + string.digits + "-._~")
+FINGERPRINT_LENGTH = 64
+
+
+def _normalize_escapes(part):
+    # %7e и ~, %2f и %2F -- один и тот же URL; закодированные разделители (%2F, %3F) остаются закодированными
+    def replace(match):
+        char = chr(int(match.group(1), 16))
+        return char if char in UNRESERVED else "%" + match.group(1).upper()
+    return PERCENT_ESCAPE.sub(replace, part)
+
+
+def canonicalize_url(url):
+    """Функция приведения URL к каноническому виду
+
+    Схема и хост приводятся к нижнему регистру, порт по умолчанию и фрагмент отбрасываются,
+    пустой путь заменяется на "/", процентное кодирование выравнивается.
+    Порядок параметров запроса сохраняется: для многих сайтов он значим.
+
+    params:
+        url: str
+
+    returns:
+        url: str
+    """
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if not scheme or not host:
+        return url
+    netloc = f"[{host}]" if ":" in host else host
+    if parts.username is not None:
+        credentials = parts.username + (f":{parts.password}" if parts.password is not None else "")
+        netloc = f"{credentials}@{netloc}"
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+    path = _normalize_escapes(parts.path) or "/"
+    query = _normalize_escapes(parts.query)
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def url_fingerprint(url):
+    """Функция вычисления отпечатка URL: sha256 канонического вида в hex
+
+    params:
+        url: str
+
+    returns:
+        fingerprint: str (FINGERPRINT_LENGTH символов)
+    """
+    return hashlib.sha256(canonicalize_url(url).encode("UTF-8")).hexdigest()
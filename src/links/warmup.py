@@ -0,0 +1,153 @@
+import asyncio
+import datetime
+import json
+import logging
+import time
+
+from redis.exceptions import RedisError
+from sqlalchemy import select, func
+
+from config import (
+    CACHE_WARMUP_SIZE, CACHE_WARMUP_WINDOW_HOURS, CACHE_WARMUP_FALLBACK_DAYS, CACHE_WARMUP_CONCURRENCY,
+    CACHE_WARMUP_BUDGET,
+)
+from .cache import make_entry
+from .models import linking, link_aliases, click_rollups
+
+logger = logging.getLogger(__name__)
+
+# список популярных ссылок, посчитанный первым стартовавшим воркером, -- остальные берут его из Redis
+TOP_ALIASES_KEY = "links:warmup:top"
+TOP_ALIASES_TTL = 300
+BATCH_SIZE = 500
+
+# итог последнего прогрева в этом воркере, отдается в /monitoring/cache
+last_warmup = {"status": "never"}
+
+
+def _popular(granularity, since, limit):
+    return (
+        select(click_rollups.c.custom_alias)
+        .where(click_rollups.c.granularity == granularity, click_rollups.c.bucket >= since)
+        .group_by(click_rollups.c.custom_alias)
+        .order_by(func.sum(click_rollups.c.clicks).desc())
+        .limit(limit)
+    )
+
+
+async def top_aliases(session, limit, window_hours, fallback_days=CACHE_WARMUP_FALLBACK_DAYS):
+    """Функция получения самых популярных коротких ссылок
+
+    Сначала -- по переходам за последние window_hours часов из почасовых корзин, если их
+    не хватает -- по переходам за последние fallback_days дней из дневных корзин. В обоих случаях
+    читается только диапазон индекса по (granularity, bucket), а не вся таблица links.
+
+    params:
+        session: AsyncSession
+        limit: int
+        window_hours: int
+        fallback_days: int (0 -- не добирать)
+
+    returns:
+        aliases: list of str
+    """
+    now = datetime.datetime.utcnow()
+    recent = _popular("hour", now - datetime.timedelta(hours=window_hours), limit)
+    aliases = list((await session.execute(recent)).scalars().all())
+    if len(aliases) < limit and fallback_days > 0:
+        overall = _popular("day", now - datetime.timedelta(days=fallback_days), limit)
+        seen = set(aliases)
+        for alias in (await session.execute(overall)).scalars().all():
+            if alias not in seen and len(aliases) < limit:
+                aliases.append(alias)
+    return aliases
+
+
+async def _load_top_aliases(redis, session_maker, limit, window_hours, refresh=False):
+    try:
+        raw = None if refresh else await redis.get(TOP_ALIASES_KEY)
+        if raw is not None:
+            return json.loads(raw)[:limit]
+    except RedisError:
+        logger.warning("redis is unavailable, top aliases are read from database", exc_info=True)
+    async with session_maker() as session:
+        aliases = await top_aliases(session, limit, window_hours)
+    try:
+        await redis.set(TOP_ALIASES_KEY, json.dumps(aliases), ex=TOP_ALIASES_TTL)
+    except RedisError:
+        pass
+    return aliases
+
+
+async def _warm_batch(cache, session_maker, aliases):
+    found = await cache.get_many(aliases)
+    missing = [alias for alias in aliases if alias not in found]
+    if not missing:
+        return len(found), 0
+    # секция каждой ссылки известна из link_aliases, поэтому ссылка ищется в одной секции
+    query = select(linking.c.custom_alias, linking.c.long_link, linking.c.expires_at, linking.c.redirect_status).select_from(
+        link_aliases.join(
+            linking, (linking.c.id == link_aliases.c.link_id) & (linking.c.expires_at == link_aliases.c.expires_at)
+        )
+    ).where(link_aliases.c.custom_alias.in_(missing))
+    async with session_maker() as session:
+        rows = (await session.execute(query)).all()
+    await cache.set_many({row.custom_alias: make_entry(row.long_link, row.expires_at, row.redirect_status) for row in rows})
+    return len(found), len(rows)
+
+
+async def warm_redirect_cache(cache, session_maker, limit=CACHE_WARMUP_SIZE, window_hours=CACHE_WARMUP_WINDOW_HOURS,
+                              concurrency=CACHE_WARMUP_CONCURRENCY, budget=CACHE_WARMUP_BUDGET, refresh=False):
+    """Функция прогрева кэша переходов самыми популярными ссылками перед приемом запросов
+
+    Ссылки берутся пачками по BATCH_SIZE: сначала одним MGET из Redis (после перезапуска
+    воркера он обычно еще теплый), недостающие -- одним запросом к базе данных.
+    Одновременно обрабатывается не больше concurrency пачек, а прогрев, не уложившийся
+    в budget секунд, прерывается: остальное догреют обычные запросы.
+    С refresh список популярных ссылок пересчитывается, а не берется из Redis, -- так его
+    периодически обновляет Celery-задача, заодно догревая Redis для следующих стартов воркеров.
+
+    params:
+        cache: RedirectCache
+        session_maker: async_sessionmaker или функция, возвращающая сессию (например, replica_router.session)
+        limit: int (сколько ссылок прогреть, 0 -- не прогревать)
+        window_hours: int
+        concurrency: int
+        budget: float (сек)
+        refresh: bool
+
+    returns: dict
+        status: str (done, timeout или disabled)
+        requested: int
+        warmed: int
+        from_redis: int
+        from_database: int
+        seconds: float
+    """
+    global last_warmup
+    if limit <= 0:
+        last_warmup = {"status": "disabled"}
+        return last_warmup
+    started = time.monotonic()
+    report = {"status": "done", "requested": 0, "warmed": 0, "from_redis": 0, "from_database": 0}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def warm(batch):
+        async with semaphore:
+            from_redis, from_database = await _warm_batch(cache, session_maker, batch)
+        report["from_redis"] += from_redis
+        report["from_database"] += from_database
+        report["warmed"] += from_redis + from_database
+
+    async def run():
+        aliases = await _load_top_aliases(cache.redis, session_maker, limit, window_hours, refresh)
+        report["requested"] = len(aliases)
+        await asyncio.gather(*(warm(aliases[i:i + BATCH_SIZE]) for i in range(0, len(aliases), BATCH_SIZE)))
+
+    try:
+        await asyncio.wait_for(run(), timeout=budget)
+    except asyncio.TimeoutError:
+        report["status"] = "timeout"
+    report["seconds"] = round(time.monotonic() - started, 3)
+    last_warmup = report
+    return report
@@ -1,27 +1,66 @@
+import asyncio
+import logging
 from fastapi import FastAPI, Depends, HTTPException
 from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
 from auth.users import auth_backend, current_active_user, fastapi_users
 from auth.schemas import UserCreate, UserRead #, UserUpdate
 from auth.db import User, create_db_and_tables
-from links.router import router as links_router
+from database import engine, async_session_maker, warm_up_engine, replica_router
+from executor import cpu_executor
+from links.router import router as links_router, activate_link
+from links.redirects import RedirectFastPath
+from links.cache import redirect_cache, response_cache, RESPONSE_CACHE_PREFIX
+from links.clicks import click_aggregator
+from links.bloom import alias_filter
+from links.warmup import warm_redirect_cache
 from tasks.router import router as tasks_router
-from redis import asyncio as aioredis
-# import redis
+from monitoring.router import router as monitoring_router, metrics_router
+from admin.router import router as admin_router
+from metrics import MetricsMiddleware
+from config import METRICS_ENABLED
 from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
 
 import uvicorn
 
+logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(_: FastAPI) -> AsyncIterator[None]:
-    redis = aioredis.from_url("redis://localhost")
-    FastAPICache.init(RedisBackend(redis), prefix="fastapi-cache")
+    FastAPICache.init(response_cache, prefix=RESPONSE_CACHE_PREFIX)
     # await create_db_and_tables()
+    try:
+        await warm_up_engine()
+    except Exception:
+        logger.warning("database warm-up failed, connections will be opened on demand", exc_info=True)
+    # воркер начинает принимать запросы с теплым кэшем переходов, но ждет не дольше CACHE_WARMUP_BUDGET
+    try:
+        report = await warm_redirect_cache(redirect_cache, replica_router.session)
+        logger.info("redirect cache warm-up: %s", report)
+    except Exception:
+        logger.warning("redirect cache warm-up failed", exc_info=True)
+    background = [
+        asyncio.create_task(click_aggregator.run()),
+        asyncio.create_task(redirect_cache.run_expiry_evictor()),
+        asyncio.create_task(redirect_cache.run_invalidation_listener()),
+        asyncio.create_task(response_cache.run_invalidation_listener()),
+        asyncio.create_task(alias_filter.run(async_session_maker)),
+    ]
+    if replica_router.enabled:
+        background.append(asyncio.create_task(replica_router.run_health_checks()))
     yield
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    cpu_executor.shutdown()
+    await engine.dispose()
+    await replica_router.dispose()
 
 app = FastAPI(lifespan=lifespan)
+# переходы обслуживаются до маршрутизации; добавлен раньше MetricsMiddleware, то есть внутри него
+app.add_middleware(RedirectFastPath, router=links_router, endpoint=activate_link)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
 
 app.include_router(
     fastapi_users.get_auth_router(auth_backend), prefix="/auth/jwt", tags=["auth"]
@@ -34,6 +73,9 @@ app.include_router(
 
 app.include_router(links_router)
 app.include_router(tasks_router)
+app.include_router(monitoring_router)
+app.include_router(metrics_router)
+app.include_router(admin_router)
 
 if __name__ == "__main__":
     uvicorn.run("main:app", reload=True, host="0.0.0.0", log_level="info")
@@ -0,0 +1,197 @@
+import contextvars
+import logging
+import os
+import time
+from collections import Counter as StatementCounter
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from sqlalchemy import event
+
+from config import SERVER_TIMING_ENABLED, N_PLUS_ONE_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+# под gunicorn каждый воркер пишет метрики в файлы этого каталога, а /metrics собирает их вместе
+MULTIPROCESS_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 10, 20, 50, 100)
+OPERATIONS = frozenset(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "COPY"))
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency by route template",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+REQUEST_QUERIES = Histogram(
+    "db_queries_per_request", "Database queries executed while handling a request",
+    ["route"], buckets=QUERY_COUNT_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    "db_time_per_request_seconds", "Time spent in database queries while handling a request",
+    ["route"], buckets=LATENCY_BUCKETS,
+)
+QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "Database query latency by statement type",
+    ["operation"], buckets=LATENCY_BUCKETS,
+)
+REPEATED_QUERIES = Counter(
+    "db_repeated_query_requests_total", "Requests that executed the same statement N_PLUS_ONE_THRESHOLD or more times",
+    ["route"],
+)
+EXECUTOR_QUEUE_WAIT = Histogram(
+    "executor_queue_wait_seconds", "Time a task waited for a free executor worker", ["executor"], buckets=LATENCY_BUCKETS,
+)
+EXECUTOR_RUN_TIME = Histogram(
+    "executor_run_seconds", "Time a task ran in an executor worker", ["executor"], buckets=LATENCY_BUCKETS,
+)
+EXECUTOR_REJECTED = Counter("executor_rejected_total", "Tasks rejected because the executor queue was full", ["executor"])
+CACHE_EVENTS = Counter("cache_events_total", "Cache hits, misses and errors", ["cache", "event"])
+
+
+class RequestStats:
+    """Запросы к базе данных, выполненные при обработке одного HTTP-запроса"""
+
+    __slots__ = ("queries", "db_time", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = StatementCounter()
+
+    def server_timing(self, total):
+        return f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries", app;dur={total * 1000:.1f}'
+
+
+_request_stats = contextvars.ContextVar("request_stats", default=None)
+_reported_routes = set()
+
+
+def count_cache_event(cache, name, amount=1):
+    """Функция учета события кэша (попадания, промаха, ошибки) в метрике cache_events_total
+
+    params:
+        cache: str (redirects, responses, alias_filter)
+        name: str (l1_hits, l2_misses, ...)
+        amount: int
+    """
+    CACHE_EVENTS.labels(cache, name).inc(amount)
+
+
+def _operation(statement):
+    word = statement.lstrip()[:6].upper()
+    return word if word in OPERATIONS else "OTHER"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_query_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    QUERY_LATENCY.labels(_operation(statement)).observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+        stats.statements[statement] += 1
+
+
+def instrument_engine(engine):
+    """Функция подключения учета запросов к движку SQLAlchemy
+
+    Время каждого запроса попадает в db_query_duration_seconds, а если запрос выполнен
+    при обработке HTTP-запроса -- еще и в счетчики этого запроса (RequestStats).
+
+    params:
+        engine: AsyncEngine
+    """
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _route_of(scope):
+    # шаблон пути (/links/{short_code}), а не сам путь: иначе число рядов метрики не ограничено
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def _report_repeated(route, stats):
+    statement, count = stats.statements.most_common(1)[0]
+    if count < N_PLUS_ONE_THRESHOLD:
+        return
+    REPEATED_QUERIES.labels(route).inc()
+    if route not in _reported_routes:
+        _reported_routes.add(route)
+        logger.warning("possible N+1 in %s: statement executed %s times: %s", route, count, statement)
+
+
+class MetricsMiddleware:
+    """ASGI middleware, записывающее время ответа и запросы к базе данных по шаблону пути
+
+    Для каждого HTTP-запроса заводит RequestStats в contextvar, куда пишут обработчики событий
+    движка (instrument_engine). Если один и тот же запрос выполнен N_PLUS_ONE_THRESHOLD раз и больше,
+    увеличивает db_repeated_query_requests_total и один раз на путь пишет предупреждение в лог.
+    С server_timing добавляет заголовок Server-Timing со временем в базе данных и общим временем.
+    """
+
+    def __init__(self, app, server_timing=SERVER_TIMING_ENABLED):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_metrics(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.server_timing:
+                    timing = stats.server_timing(time.perf_counter() - started)
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", timing.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            _request_stats.reset(token)
+            route = _route_of(scope)
+            REQUEST_LATENCY.labels(scope["method"], route, status_code).observe(time.perf_counter() - started)
+            REQUEST_QUERIES.labels(route).observe(stats.queries)
+            REQUEST_DB_TIME.labels(route).observe(stats.db_time)
+            if stats.queries:
+                _report_repeated(route, stats)
+
+
+def render_metrics():
+    """Функция выгрузки метрик в текстовом формате Prometheus
+
+    Под gunicorn (задан PROMETHEUS_MULTIPROC_DIR) метрики собираются со всех воркеров,
+    иначе отдаются метрики текущего процесса.
+
+    returns:
+        body: bytes
+        content_type: str
+    """
+    if os.getenv(MULTIPROCESS_DIR_ENV):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """Функция удаления файлов метрик завершившегося воркера, вызывается из gunicorn.conf.py"""
+    if os.getenv(MULTIPROCESS_DIR_ENV):
+        multiprocess.mark_process_dead(pid)
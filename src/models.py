@@ -1,10 +1,10 @@
 from datetime import datetime
 
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy import Column, Integer, SmallInteger, String, DateTime, Boolean, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship, declarative_base
 
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 
 Base = declarative_base()
 
@@ -19,20 +19,68 @@ class User(Base):
     is_active = Column(Boolean, default=True, nullable=False)
     is_superuser = Column(Boolean, default=True, nullable=False)
     is_verified = Column(Boolean, default=True, nullable=False)
+    links_user_id = Column(
+        Integer, server_default=text("nextval('user_links_user_id_seq')"), unique=True, nullable=False
+    )
 
     linkings = relationship("Linking", back_populates="user")
 
 class Linking(Base):
     __tablename__ = "links"
+    __table_args__ = (
+        Index("ix_links_custom_alias", "custom_alias"),
+        Index("ix_links_long_link_hash_id", "long_link_hash", "id"),
+        Index(
+            "ix_links_user_id_id", "user_id", "id",
+            postgresql_include=["custom_alias", "expires_at", "creation_date", "number_of_usages"],
+        ),
+        Index("ix_links_user_id_usages_id", "user_id", "number_of_usages", "id"),
+        {"postgresql_partition_by": "RANGE (expires_at)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     user_id = Column(Integer)
     long_link = Column(String, nullable=False)
+    long_link_hash = Column(String(64), nullable=False)
     custom_alias = Column(String, nullable=False)
-    expires_at = Column(DateTime(timezone=True))
+    expires_at = Column(DateTime(timezone=True), primary_key=True)
     last_usage = Column(DateTime(timezone=True))
     creation_date = Column(DateTime(timezone=True), server_default=func.now())
     number_of_usages = Column(Integer, nullable=False)
     is_authorized = Column(Boolean, nullable=False)
+    redirect_status = Column(SmallInteger, nullable=False, server_default="301")
 
     linkings = relationship("User", back_populates="links")
+
+class LinkAlias(Base):
+    __tablename__ = "link_aliases"
+    __table_args__ = (
+        Index("ix_link_aliases_expires_at", "expires_at"),
+    )
+
+    custom_alias = Column(String, primary_key=True)
+    link_id = Column(Integer, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+class LinkClickRollup(Base):
+    __tablename__ = "link_click_rollups"
+    __table_args__ = (
+        Index("ix_link_click_rollups_granularity_bucket", "granularity", "bucket"),
+    )
+
+    custom_alias = Column(String, primary_key=True)
+    granularity = Column(String(8), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    clicks = Column(Integer, nullable=False)
+
+class LinkClickSource(Base):
+    __tablename__ = "link_click_sources"
+    __table_args__ = (
+        Index("ix_link_click_sources_day", "day"),
+    )
+
+    custom_alias = Column(String, primary_key=True)
+    day = Column(DateTime, primary_key=True)
+    kind = Column(String(16), primary_key=True)
+    value = Column(String(255), primary_key=True)
+    clicks = Column(Integer, nullable=False)
@@ -0,0 +1,108 @@
+from fastapi import APIRouter, Response
+
+from database import pool_stats, replica_router
+from executor import cpu_executor
+from links.alias_pool import alias_pool
+from links.cache import redirect_cache, response_cache
+from links import warmup
+from metrics import render_metrics
+
+router = APIRouter(prefix="/monitoring", tags=["monitoring"])
+# /metrics без префикса: путь, который Prometheus опрашивает по умолчанию
+metrics_router = APIRouter(tags=["monitoring"])
+
+
+@metrics_router.get("/metrics")
+async def metrics():
+    """Функция выгрузки метрик в формате Prometheus (время ответа по путям, запросы к базе данных, кэши)
+    Под gunicorn метрики собираются со всех воркеров
+
+    returns:
+        Response (text/plain)
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@router.get("/alias_pool")
+async def alias_pool_stats():
+    """Функция получения состояния пула коротких ссылок
+
+    returns: dict
+        enabled: bool
+        depth: int (сколько ссылок сейчас в пуле)
+        low_watermark: int
+        high_watermark: int
+        served: int (сколько ссылок выдано из пула)
+        exhausted: int (сколько раз пула не хватило)
+        refilled: int (сколько ссылок добавлено в пул)
+    """
+    return await alias_pool.stats()
+
+
+@router.get("/executor")
+async def executor_stats():
+    """Функция получения состояния пула CPU воркера, обработавшего запрос
+
+    returns: dict
+        kind: str (thread или process)
+        workers: int
+        max_queue: int
+        pending: int (сколько задач выполняется и ждет)
+        rejected: int (сколько задач отклонено с 429)
+    """
+    return cpu_executor.stats()
+
+
+@router.get("/db_pool")
+async def db_pool_stats():
+    """Функция получения состояния пула соединений с базой данных воркера, обработавшего запрос
+
+    returns: dict
+        size: int
+        checked_in: int
+        checked_out: int
+        overflow: int
+        wait_count: int
+        wait_time_avg: float
+        wait_time_max: float
+        timeouts: int
+    """
+    return pool_stats()
+
+
+@router.get("/db_replicas")
+async def db_replicas_stats():
+    """Функция получения состояния реплик для чтения
+
+    returns: dict
+        strategy: str
+        max_lag: float
+        replicas: list of dict (replica, healthy, lag, latency)
+    """
+    return {"strategy": replica_router.strategy, "max_lag": replica_router.max_lag, "replicas": replica_router.stats()}
+
+
+@router.get("/cache")
+async def cache_stats():
+    """Функция получения счетчиков кэшей воркера, обработавшего запрос
+
+    returns: dict
+        responses: dict (кэш ответов stats и search)
+            l1: dict (size, bytes, hits, misses, evictions)
+            l2: dict (hits, misses, errors)
+            coalesced: int (сколько промахов дождались чужого запроса вместо своего)
+            stale: int (сколько раз отдан устаревший ответ)
+            revalidations: int
+        redirects: dict (кэш переходов: size, evictions, l1_hits, l1_misses, l2_hits, l2_misses, l2_errors)
+        warmup: dict (итог прогрева при старте воркера: status, requested, warmed, from_redis, from_database, seconds)
+    """
+    return {
+        "responses": response_cache.stats(),
+        "redirects": {
+            "size": len(redirect_cache.local),
+            "evictions": redirect_cache.local.evictions,
+            **{name: redirect_cache.counters[name] for name in ("l1_hits", "l1_misses", "l2_hits", "l2_misses", "l2_errors")},
+        },
+        "warmup": warmup.last_warmup,
+    }
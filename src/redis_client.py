@@ -0,0 +1,6 @@
+from redis import asyncio as aioredis
+
+from config import REDIS_URL
+
+# соединения открываются лениво, поэтому клиент можно создавать при импорте, как и engine
+redis_client = aioredis.from_url(REDIS_URL)
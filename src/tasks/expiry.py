@@ -0,0 +1,190 @@
+import asyncio
+import datetime
+import time
+
+from sqlalchemy import select, delete, literal_column, text
+
+from config import (
+    SWEEP_BATCH_SIZE, SWEEP_BATCH_PAUSE, SWEEP_MAX_BATCHES,
+    CLICK_MINUTE_RETENTION_DAYS, CLICK_HOUR_RETENTION_DAYS, CLICK_SOURCES_RETENTION_DAYS,
+)
+from links.cache import RedirectCache, invalidate_links
+from links.models import click_rollups, click_sources
+from links.partitions import (
+    DEFAULT_PARTITION, ensure_partitions, expired_partitions, release_batch, drop_partition, delete_click_stats,
+)
+
+PROGRESS_KEY = "expiry_sweep:progress"
+LOCK_KEY = "expiry_sweep:lock"
+
+
+async def get_sweep_progress(redis):
+    """Функция получения прогресса последней очистки истекших ссылок
+
+    returns: dict
+        status: str (running, done, failed или never)
+        cutoff: str (удаляются секции links, все ссылки которых истекли к cutoff)
+        deleted: int
+        batches: int
+        partitions: int (сколько секций удалено)
+        rows_per_sec: float
+        started_at: str
+        updated_at: str
+    """
+    raw = await redis.hgetall(PROGRESS_KEY)
+    if not raw:
+        return {"status": "never"}
+    progress = {key.decode(): value.decode() for key, value in raw.items()}
+    for field in ("deleted", "batches", "partitions", "last_id"):
+        progress[field] = int(progress.get(field, 0))
+    progress.setdefault("partition", "")
+    progress["rows_per_sec"] = float(progress["rows_per_sec"])
+    return progress
+
+
+async def sweep_expired_links(session_maker, redis, batch_size=SWEEP_BATCH_SIZE, pause=SWEEP_BATCH_PAUSE,
+                              max_batches=SWEEP_MAX_BATCHES):
+    """Функция удаления истекших ссылок целыми секциями links
+
+    Сначала заранее создаются секции на LINKS_PARTITION_PREMAKE интервалов вперед. Затем каждая секция,
+    все ссылки которой истекли к cutoff, удаляется через DROP TABLE: построчного DELETE по links нет,
+    поэтому нет ни мертвых строк, ни работы для VACUUM. Перед удалением ее короткие ссылки освобождаются
+    в link_aliases пачками по batch_size (отдельная транзакция на пачку) вместе со статистикой переходов
+    и вычищаются из кэша переходов и кэша ответов во всех воркерах. Истекшие ссылки, оставшиеся в секции DEFAULT, удаляются прежним
+    построчным DELETE. Между пачками делается пауза pause секунд, прерванная очистка продолжается
+    следующим запуском с той же секции и той же границы cutoff.
+
+    Ссылка удаляется вместе со своей секцией, то есть не позже чем через интервал секции после истечения;
+    до этого переход по ней уже отвечает 410.
+
+    params:
+        session_maker: async_sessionmaker
+        redis: Redis
+        batch_size: int
+        pause: float
+        max_batches: int (0 -- без ограничения)
+
+    returns: dict (итоговый прогресс, как в get_sweep_progress)
+    """
+    if not await redis.set(LOCK_KEY, 1, nx=True, ex=3600):
+        progress = await get_sweep_progress(redis)
+        progress["status"] = "already running"
+        return progress
+
+    redirect_cache = RedirectCache(redis)
+    try:
+        previous = await get_sweep_progress(redis)
+        if previous["status"] in ("running", "failed"):
+            # прошлая очистка не закончилась -- продолжаем ее
+            cutoff = datetime.datetime.fromisoformat(previous["cutoff"])
+            deleted, batches, dropped = previous["deleted"], previous["batches"], previous["partitions"]
+            resume = (previous["partition"], previous["last_id"])
+        else:
+            cutoff = datetime.datetime.utcnow()
+            deleted = batches = dropped = 0
+            resume = ("", 0)
+        progress = {
+            "status": "running",
+            "cutoff": cutoff.isoformat(),
+            "deleted": deleted,
+            "batches": batches,
+            "partitions": dropped,
+            "partition": "",
+            "last_id": 0,
+            "rows_per_sec": 0.0,
+            "started_at": datetime.datetime.utcnow().isoformat(),
+        }
+        started = time.monotonic()
+        deleted_this_run = batches_this_run = 0
+
+        async def record(rows, status="running", **fields):
+            nonlocal deleted, batches, deleted_this_run, batches_this_run
+            await invalidate_links([row.custom_alias for row in rows], [row.long_link for row in rows], redirect_cache)
+            deleted += len(rows)
+            deleted_this_run += len(rows)
+            batches += 1
+            batches_this_run += 1
+            elapsed = time.monotonic() - started
+            progress.update(fields)
+            progress.update({
+                "status": status,
+                "deleted": deleted,
+                "batches": batches,
+                "rows_per_sec": round(deleted_this_run / elapsed, 1) if elapsed else 0.0,
+                "updated_at": datetime.datetime.utcnow().isoformat(),
+            })
+            await redis.hset(PROGRESS_KEY, mapping=progress)
+            await redis.expire(LOCK_KEY, 3600)
+            return bool(max_batches and batches_this_run >= max_batches)
+
+        try:
+            await ensure_partitions(session_maker)
+            for partition in await expired_partitions(session_maker, cutoff):
+                last_id = resume[1] if partition.name == resume[0] else 0
+                while True:
+                    rows = await release_batch(session_maker, partition, last_id, batch_size)
+                    if not rows:
+                        break
+                    last_id = rows[-1].id
+                    if await record(rows, partition=partition.name, last_id=last_id):
+                        return progress
+                    await asyncio.sleep(pause)
+                await drop_partition(session_maker, partition)
+                dropped += 1
+                progress.update({"partitions": dropped, "partition": "", "last_id": 0})
+                await redis.hset(PROGRESS_KEY, mapping=progress)
+
+            default_batch = text(
+                f"DELETE FROM {DEFAULT_PARTITION} WHERE ctid IN ("
+                f"SELECT ctid FROM {DEFAULT_PARTITION} WHERE expires_at < :cutoff LIMIT :limit FOR UPDATE SKIP LOCKED"
+                ") RETURNING custom_alias, long_link"
+            )
+            while True:
+                async with session_maker() as session:
+                    rows = (await session.execute(default_batch, {"cutoff": cutoff, "limit": batch_size})).all()
+                    # короткие ссылки освобождает триггер links_release_alias
+                    await delete_click_stats(session, [row.custom_alias for row in rows])
+                    await session.commit()
+                done = len(rows) < batch_size
+                if await record(rows, status="done" if done else "running") or done:
+                    return progress
+                await asyncio.sleep(pause)
+        except Exception:
+            progress.update({"status": "failed", "updated_at": datetime.datetime.utcnow().isoformat()})
+            await redis.hset(PROGRESS_KEY, mapping=progress)
+            raise
+    finally:
+        await redis.delete(LOCK_KEY)
+
+
+async def _delete_in_batches(session_maker, table, condition, batch_size):
+    deleted = 0
+    rows = select(literal_column("ctid")).select_from(table).where(condition).limit(batch_size)
+    statement = delete(table).where(literal_column("ctid").in_(rows.scalar_subquery()))
+    while True:
+        async with session_maker() as session:
+            result = await session.execute(statement)
+            await session.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+
+
+async def prune_click_rollups(session_maker, batch_size=SWEEP_BATCH_SIZE):
+    """Функция удаления корзин переходов старше срока хранения своей гранулярности
+    Дневные корзины хранятся, пока жива ссылка: статистику истекших ссылок удаляет очистка (sweep_expired_links)
+
+    params:
+        session_maker: async_sessionmaker
+        batch_size: int
+
+    returns: dict (сколько строк удалено из каждой таблицы)
+    """
+    now = datetime.datetime.utcnow()
+    result = {}
+    for granularity, days in (("minute", CLICK_MINUTE_RETENTION_DAYS), ("hour", CLICK_HOUR_RETENTION_DAYS)):
+        condition = (click_rollups.c.granularity == granularity) & (click_rollups.c.bucket < now - datetime.timedelta(days=days))
+        result[f"{granularity}_rollups"] = await _delete_in_batches(session_maker, click_rollups, condition, batch_size)
+    condition = click_sources.c.day < now - datetime.timedelta(days=CLICK_SOURCES_RETENTION_DAYS)
+    result["sources"] = await _delete_in_batches(session_maker, click_sources, condition, batch_size)
+    return result
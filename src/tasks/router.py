@@ -1,4 +1,6 @@
 from fastapi import APIRouter, Depends, BackgroundTasks
+from redis_client import redis_client
+from .expiry import get_sweep_progress
 from .tasks import delete_old_links
 
 router = APIRouter(prefix="/expiration_delete")
@@ -6,8 +8,7 @@ router = APIRouter(prefix="/expiration_delete")
 @router.get('/delete')
 def delete_expired_links():
     try:
-        # print(1)
-        delete_old_links.apply_async()
+        result = delete_old_links.apply_async()
     except Exception as e:
         return {
             'status': 503,
@@ -15,5 +16,21 @@ def delete_expired_links():
         }
     return {
             'status': 200,
-            'details': 'All ok'
-        }
\ No newline at end of file
+            'details': 'All ok',
+            'task_id': result.id
+        }
+
+@router.get('/status')
+async def expired_links_status():
+    """Функция получения прогресса очистки истекших ссылок
+
+    returns: dict
+        status: str (running, done, failed или never)
+        cutoff: str
+        deleted: int
+        batches: int
+        rows_per_sec: float
+        started_at: str
+        updated_at: str
+    """
+    return await get_sweep_progress(redis_client)
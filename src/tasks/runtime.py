@@ -0,0 +1,67 @@
+import asyncio
+import logging
+import os
+import threading
+
+from database import engine
+from redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRuntime:
+    """Долгоживущий event loop для async-задач Celery, один на процесс воркера
+
+    Loop работает в отдельном потоке процесса, задача Celery отдает в него корутину
+    и ждет результат. Поэтому задачи одного процесса используют общий пул соединений
+    database.engine и общий redis_client, а не открывают соединения на каждую задачу.
+    С пулом prefork каждый дочерний процесс получает свой loop (worker_process_init),
+    с пулом threads задачи из разных потоков выполняются в одном loop одновременно.
+
+    Loop создается заново, если процесс сменился (fork): соединения родителя в дочернем
+    процессе не используются.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._pid == os.getpid():
+            return self._loop
+        with self._lock:
+            if self._pid != os.getpid():
+                # соединения, унаследованные от родителя, закрывать нельзя -- их просто забываем
+                engine.sync_engine.dispose(close=False)
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="celery-asyncio", daemon=True).start()
+                self._loop, self._pid = loop, os.getpid()
+        return self._loop
+
+    def run(self, coroutine_function, *args, **kwargs):
+        """Функция выполнения корутины в loop процесса
+
+        params:
+            coroutine_function: async-функция
+            *args, **kwargs: ее аргументы
+
+        returns:
+            результат корутины
+        """
+        loop = self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine_function(*args, **kwargs), loop).result()
+
+    def stop(self):
+        if self._pid != os.getpid():
+            return
+        try:
+            self.run(engine.dispose)
+            self.run(redis_client.aclose)
+        except Exception:
+            logger.warning("could not close task runtime connections", exc_info=True)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop, self._pid = None, None
+
+
+runtime = AsyncRuntime()
@@ -1,31 +1,113 @@
 from celery import Celery
 from celery.schedules import crontab
-from database import get_async_session
-from links.models import linking
-import datetime
-from fastapi import Depends
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import  delete
+from celery.signals import worker_process_init, worker_process_shutdown, worker_shutdown
+from config import (
+    REDIS_URL, ALIAS_POOL_REFILL_INTERVAL, SWEEP_INTERVAL, ALIAS_FILTER_REBUILD_INTERVAL,
+    CLICK_CELERY_FLUSH_INTERVAL, CACHE_WARMUP_REFRESH_INTERVAL,
+)
+from database import async_session_maker
+from links.alias_pool import alias_pool
+from links.bloom import alias_filter
+from links.cache import redirect_cache
+from links.clicks import ClickAggregator
+from links.warmup import warm_redirect_cache
+from redis_client import redis_client
 from datetime import timedelta
+from .expiry import sweep_expired_links, prune_click_rollups
+from .runtime import runtime
 
-celery = Celery('tasks', broker='redis://redis:5370')
+celery = Celery('tasks', broker=REDIS_URL)
 celery.conf.beat_schedule = {
     'task-name': {
         'task': 'tasks.tasks.delete_old_links',  # instead 'show'
         # 'schedule': crontab(hour=8, minute=0),
-        'schedule': timedelta(seconds=120),
+        'schedule': timedelta(seconds=SWEEP_INTERVAL),
+    },
+    'prune-click-rollups': {
+        'task': 'tasks.tasks.prune_old_click_rollups',
+        'schedule': timedelta(hours=1),
+    },
+    'refill-alias-pool': {
+        'task': 'tasks.tasks.refill_alias_pool',
+        'schedule': timedelta(seconds=ALIAS_POOL_REFILL_INTERVAL),
+    },
+    'rebuild-alias-filter': {
+        'task': 'tasks.tasks.rebuild_alias_filter',
+        'schedule': timedelta(seconds=ALIAS_FILTER_REBUILD_INTERVAL),
+    },
+    'flush-clicks': {
+        'task': 'tasks.tasks.flush_clicks',
+        'schedule': timedelta(seconds=CLICK_CELERY_FLUSH_INTERVAL),
+        # следующий запуск все равно запишет накопленное, старые сообщения копить незачем
+        'options': {'expires': CLICK_CELERY_FLUSH_INTERVAL},
+    },
+    'warm-redirect-cache': {
+        'task': 'tasks.tasks.warm_redirect_cache_task',
+        'schedule': timedelta(seconds=CACHE_WARMUP_REFRESH_INTERVAL),
+        'options': {'expires': CACHE_WARMUP_REFRESH_INTERVAL},
     },
 }
 celery.conf.timezone = 'UTC'
+# события задач: по ним Flower показывает время выполнения и число задач в секунду
+celery.conf.worker_send_task_events = True
+celery.conf.task_send_sent_event = True
+# задачи длинные и неравномерные: процесс не забирает себе очередь задач заранее
+celery.conf.worker_prefetch_multiplier = 1
+
+# задачи получают сессии из общего пула database.engine, а redis -- общий redis_client:
+# все они выполняются в одном долгоживущем event loop процесса (tasks/runtime.py)
+click_writer = ClickAggregator(redis_client, write_to_database=True)
+# прогрев в задаче не задерживает старт воркера, поэтому ему дается больше времени
+WARMUP_TASK_BUDGET = 60
+
+
+@worker_process_init.connect
+def start_runtime(**_):
+    runtime.start()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def stop_runtime(**_):
+    runtime.stop()
+
+
+@celery.task
+def refill_alias_pool():
+    """Задача пополнения пула коротких ссылок в Redis до верхней границы"""
+    added = runtime.run(alias_pool.refill, async_session_maker)
+    return {"status": "success", "added": added}
+
+
+@celery.task
+def delete_old_links():
+    """Задача создания секций links и удаления истекших секций, возвращает итоговый прогресс очистки"""
+    return runtime.run(sweep_expired_links, async_session_maker, redis_client)
+
+
+@celery.task
+def prune_old_click_rollups():
+    """Задача удаления корзин статистики переходов старше срока хранения"""
+    return runtime.run(prune_click_rollups, async_session_maker)
+
+
+@celery.task
+def rebuild_alias_filter():
+    """Задача пересборки фильтра Блума коротких ссылок: сбрасывает биты удаленных ссылок"""
+    return runtime.run(alias_filter.build, async_session_maker)
+
 
-@celery.task(bind=True)
-async def delete_old_links(session: AsyncSession = Depends(get_async_session)):
-    now = datetime.datetime.now()
-    statement = delete(linking).where(linking.c.expires_at < now)
-    print(2)
+@celery.task
+def flush_clicks():
+    """Задача записи переходов, накопленных воркерами в Redis, в базу данных
+    Основной способ записи при CLICK_FLUSH_IN_CELERY, иначе задача лишь подхватывает то, что не успели записать воркеры
+    """
+    return {"status": "success", "flushed": runtime.run(click_writer.flush)}
 
-    await session.execute(statement)
-    await session.commit()
-    # print({"status": "success"})
-    return {"status": "success"}
 
+@celery.task
+def warm_redirect_cache_task():
+    """Задача пересчета самых популярных ссылок и прогрева ими кэша переходов в Redis
+    Стартующие воркеры берут готовый список и записи из Redis, не обращаясь к базе данных
+    """
+    return runtime.run(warm_redirect_cache, redirect_cache, async_session_maker, budget=WARMUP_TASK_BUDGET, refresh=True)
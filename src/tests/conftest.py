@@ -0,0 +1,17 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# модули приложения импортируются от папки src, как при запуске сервиса
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# database.py строит адрес базы данных при импорте; подключений тесты не открывают
+for name, value in (("DB_USER", "test"), ("DB_PASS", "test"), ("DB_HOST", "localhost"), ("DB_PORT", "5432"), ("DB_NAME", "test")):
+    os.environ.setdefault(name, value)
+
+
+@pytest.fixture
+def run():
+    """Фикстура запуска корутины в отдельном event loop"""
+    return asyncio.run
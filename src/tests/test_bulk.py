@@ -0,0 +1,61 @@
+import pytest
+
+from links.bulk import iter_json_objects
+
+
+async def chunked(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def parse(*chunks, **kwargs):
+    return [item async for item in iter_json_objects(chunked(*chunks), **kwargs)]
+
+
+def test_json_array(run):
+    assert run(parse(b'[{"a": 1}, {"a": 2}]')) == [{"a": 1}, {"a": 2}]
+
+
+def test_ndjson(run):
+    assert run(parse(b'{"a": 1}\n{"a": 2}\n')) == [{"a": 1}, {"a": 2}]
+
+
+def test_object_split_between_chunks(run):
+    # граница куска внутри объекта и внутри многобайтного символа
+    body = '[{"url": "https://пример.рф/"}, {"a": 2}]'.encode("UTF-8")
+    chunks = [body[i:i + 3] for i in range(0, len(body), 3)]
+    assert run(parse(*chunks)) == [{"url": "https://пример.рф/"}, {"a": 2}]
+
+
+def test_empty_body(run):
+    assert run(parse(b"")) == []
+    assert run(parse(b"[]")) == []
+
+
+@pytest.mark.parametrize("body, message", [
+    (b'[1, 2]', "expected JSON object"),
+    (b'{"a": 1} "b"', "expected JSON object"),
+    (b'[{"a": 1}] {"a": 2}', "after the end of JSON array"),
+    (b'{"a": 1', "incomplete JSON object"),
+    (b'[{"a": 1}', "JSON array is not closed"),
+])
+def test_malformed_body(run, body, message):
+    with pytest.raises(ValueError, match=message):
+        run(parse(body))
+
+
+def test_object_too_large(run):
+    with pytest.raises(ValueError, match="larger than 16 bytes"):
+        run(parse(b'{"a": "' + b"x" * 32, b'"}', max_item_bytes=16))
+
+
+def test_items_before_error_are_returned(run):
+    items = []
+
+    async def consume():
+        async for item in iter_json_objects(chunked(b'{"a": 1}\n', b"oops")):
+            items.append(item)
+
+    with pytest.raises(ValueError):
+        run(consume())
+    assert items == [{"a": 1}]
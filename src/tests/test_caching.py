@@ -0,0 +1,137 @@
+import pytest
+from redis.exceptions import RedisError
+
+import caching
+from caching import TTLCache, TieredBackend
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(caching.time, "monotonic", clock)
+    return clock
+
+
+class UnavailableRedis:
+    """Redis, на любую команду которого приходит ошибка: бэкенд работает только с L1"""
+
+    def __getattr__(self, name):
+        raise RedisError("redis is unavailable")
+
+
+def test_ttl_cache_expires(clock):
+    cache = TTLCache(maxsize=10, ttl=5)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=20)
+    clock.now += 10
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert len(cache) == 1
+
+
+def test_ttl_cache_evicts_least_recently_used(clock):
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert list(cache.keys()) == ["a", "c"]
+    assert cache.evictions == 1
+
+
+def test_ttl_cache_limits_bytes(clock):
+    cache = TTLCache(maxsize=10, ttl=60, maxbytes=10, sizeof=len)
+    cache.set("a", b"12345")
+    cache.set("b", b"123456")
+    assert list(cache.keys()) == ["b"]
+    assert cache.bytes == 6
+    # запись больше maxbytes не кэшируется и не вытесняет остальные
+    cache.set("c", b"x" * 11)
+    assert list(cache.keys()) == ["b"]
+
+
+def test_ttl_cache_discard_expired(clock):
+    cache = TTLCache(maxsize=10, ttl=5)
+    cache.set("a", 1)
+    cache.discard_expired("a")
+    assert cache.get("a") == 1
+    clock.now += 10
+    cache.discard_expired("a")
+    assert len(cache) == 0 and cache.pop("a") is None
+
+
+@pytest.fixture
+def backend():
+    return TieredBackend(UnavailableRedis(), maxsize=100, maxbytes=1 << 20, stale_ttl=30, coalesce_timeout=1)
+
+
+def test_tiered_backend_caches_response(run, backend):
+    async def scenario():
+        assert await backend.get_with_ttl("stats:abc:1") == (0, None)
+        await backend.set("stats:abc:1", b"response", expire=60)
+        return await backend.get_with_ttl("stats:abc:1")
+
+    ttl, value = run(scenario())
+    assert value == b"response" and 0 < ttl <= 60
+    assert backend.stats()["l1"]["hits"] == 1
+
+
+def test_tiered_backend_skips_response_computed_before_invalidation(run, backend):
+    async def scenario():
+        await backend.get_with_ttl("stats:abc:1")
+        # пока ответ считался, другой воркер сбросил тег
+        backend._drop_local(["stats:abc"])
+        await backend.set("stats:abc:1", b"outdated", expire=60)
+        return await backend.get_with_ttl("stats:abc:1")
+
+    assert run(scenario()) == (0, None)
+
+
+def test_tiered_backend_skips_response_computed_before_resubscribe(run, backend):
+    async def scenario():
+        await backend.get_with_ttl("stats:abc:1")
+        # после переподключения к pub/sub инвалидации могли потеряться
+        backend._reset_local()
+        await backend.set("stats:abc:1", b"outdated", expire=60)
+        return await backend.get_with_ttl("stats:abc:1")
+
+    assert run(scenario()) == (0, None)
+
+
+def test_tiered_backend_invalidation_drops_only_its_tag(run, backend):
+    async def scenario():
+        for key in ("stats:abc:1", "stats:abc:2", "stats:xyz:1"):
+            await backend.get_with_ttl(key)
+            await backend.set(key, b"response", expire=60)
+        generation = backend.generation
+        backend._drop_local(["stats:abc"])
+        assert backend.generation == generation + 1
+        return [(await backend.get_with_ttl(key))[1] for key in ("stats:abc:1", "stats:abc:2", "stats:xyz:1")]
+
+    assert run(scenario()) == [None, None, b"response"]
+
+
+def test_tiered_backend_serves_stale_while_one_request_revalidates(run, backend, clock):
+    async def scenario():
+        await backend.get_with_ttl("stats:abc:1")
+        await backend.set("stats:abc:1", b"old", expire=10)
+        clock.now += 15
+        first = await backend.get_with_ttl("stats:abc:1")
+        second = await backend.get_with_ttl("stats:abc:1")
+        await backend.set("stats:abc:1", b"new", expire=10)
+        third = await backend.get_with_ttl("stats:abc:1")
+        return first, second, third
+
+    first, second, third = run(scenario())
+    # первый запрос пересчитывает ответ, остальные пока получают устаревший
+    assert first == (0, None)
+    assert second == (0, b"old")
+    assert third[1] == b"new"
@@ -0,0 +1,64 @@
+import base64
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+
+from links.listing import cursor_of, decode_cursor, encode_cursor, user_links_query
+from links.router import owned_user_id
+
+
+def raw_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode("UTF-8")).decode("ascii")
+
+
+@pytest.mark.parametrize("sort, values", [("created", [42]), ("clicks", [1000, 42])])
+def test_cursor_round_trip(sort, values):
+    cursor = encode_cursor(values)
+    assert cursor.isascii() and "/" not in cursor and "+" not in cursor
+    assert decode_cursor(cursor, sort) == values
+
+
+def test_cursor_of_row():
+    row = SimpleNamespace(id=42, number_of_usages=7)
+    assert decode_cursor(cursor_of(row, "created"), "created") == [42]
+    assert decode_cursor(cursor_of(row, "clicks"), "clicks") == [7, 42]
+
+
+@pytest.mark.parametrize("cursor", [None, ""])
+def test_first_page(cursor):
+    assert decode_cursor(cursor, "created") is None
+
+
+@pytest.mark.parametrize("cursor, sort", [
+    ("not base64!", "created"),
+    ("пусто", "created"),
+    (base64.urlsafe_b64encode(b"not json").decode(), "created"),
+    (raw_cursor({"id": 42}), "created"),
+    (raw_cursor(["42"]), "created"),
+    (raw_cursor([1.5]), "created"),
+    # курсор другой сортировки
+    (raw_cursor([1000, 42]), "created"),
+    (raw_cursor([42]), "clicks"),
+])
+def test_invalid_cursor(cursor, sort):
+    with pytest.raises(ValueError, match="invalid cursor"):
+        decode_cursor(cursor, sort)
+
+
+def test_query_continues_after_cursor():
+    query = user_links_query(7, "clicks", [1000, 42], 50)
+    sql = str(query.compile(dialect=postgresql.dialect()))
+    assert "(links.number_of_usages, links.id) < (" in sql
+    assert "ORDER BY links.number_of_usages DESC, links.id DESC" in sql
+
+
+def test_owned_user_id():
+    user = SimpleNamespace(links_user_id=7)
+    assert owned_user_id(user, None) == 7
+    assert owned_user_id(user, 7) == 7
+    with pytest.raises(HTTPException) as error:
+        owned_user_id(user, 8)
+    assert error.value.status_code == 403